@@ -0,0 +1,353 @@
+"""Batch processing for Ignora.
+
+Applies a chain of engine operations to every image in a directory or glob,
+spread over a process pool. Only a few files per worker are in flight at any
+time, so memory stays flat however many files there are. Every finished file
+is appended to a journal in the output directory; a rerun skips files whose
+source, chain and output settings are unchanged, so an interrupted run
+resumes where it stopped.
+
+Inputs too big to decode comfortably are streamed through the memory-mapped
+outofcore backend instead, when the chain and output format allow it.
+
+    python main.py batch photos/ -o out/ --op grayscale --op rotate=15 --op crop=0,0,800,600
+    python main.py batch 'intake/**/*.jpg' -o out/ --recipe edit.json
+"""
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import argparse
+import json
+import os
+import sys
+import time
+
+from PIL import Image
+
+import engine
+from latency import percentile
+import outofcore
+import parallel
+import pipeline
+from recipe import Recipe
+
+# Record of finished files, kept in the output directory
+JOURNAL_NAME = '.ignora-batch.jsonl'
+
+# Files submitted per worker ahead of completion; bounds pending memory
+IN_FLIGHT_PER_WORKER = 2
+
+# Inputs with more pixels than this are streamed out of core when possible
+OUT_OF_CORE_PIXELS = 150_000_000
+
+# Output formats the out-of-core path can write
+OUT_OF_CORE_FORMATS = ('.png', outofcore.RAW_EXTENSION)
+
+# Operations whose single argument is a sequence, e.g. crop=x1,y1,x2,y2
+SEQUENCE_ARGUMENTS = {'crop'}
+
+
+def _number(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_step(text):
+    """Parse 'name' or 'name=arg,arg' into a (name, args) step"""
+    name, _, values = text.partition('=')
+    name = name.strip()
+    if name not in engine.OPERATIONS:
+        raise ValueError(f"Unknown operation: {name}")
+    args = [_number(v.strip()) for v in values.split(',')] if values else []
+    if name in SEQUENCE_ARGUMENTS:
+        args = [args]
+    return name, args
+
+
+def check_step(name, args):
+    """Raise ValueError unless args suit the operation.
+
+    The step is tried on a 1x1 image, so a wrong count or type of argument
+    is reported once, before the pool starts, rather than by every file. A
+    crop is checked by its box alone, since trying it would allocate the box.
+    """
+    if name == 'crop':
+        box = args[0] if len(args) == 1 else None
+        if (not isinstance(box, (list, tuple)) or len(box) != 4
+                or not all(isinstance(v, (int, float)) for v in box)
+                or box[2] <= box[0] or box[3] <= box[1]):
+            raise ValueError("crop needs x1,y1,x2,y2 with x2 > x1 and y2 > y1")
+        return
+    try:
+        engine.OPERATIONS[name](Image.new('RGB', (1, 1)), *args)
+    except Exception as e:
+        shown = ','.join(str(arg) for arg in args)
+        raise ValueError(f"bad arguments for {name}{'=' + shown if shown else ''}: {e}")
+
+
+def load_recipe(path):
+    """argparse type for --recipe: the Recipe in path, or a readable error"""
+    try:
+        return Recipe.load(path)
+    except OSError as e:
+        raise argparse.ArgumentTypeError(f"can't read {path}: {e.strerror or e}")
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise argparse.ArgumentTypeError(f"{path} is not a valid recipe: {e}")
+
+
+def target_path(relative, output_dir, image_format=None):
+    """Output path for an input file, with the extension of image_format if given"""
+    if image_format:
+        relative = os.path.splitext(relative)[0] + '.' + image_format.lower()
+    return os.path.join(output_dir, relative)
+
+
+def _init_worker():
+    # Files are already spread over the cores; don't nest another pool
+    parallel.disable()
+
+
+def use_out_of_core(source, target, steps, out_of_core=None):
+    """Whether to stream source through outofcore: True forces it, None decides by size"""
+    if out_of_core is False:
+        return False
+    if out_of_core is None:
+        return (os.path.splitext(target)[1].lower() in OUT_OF_CORE_FORMATS
+                and outofcore.can_stream(steps)
+                and outofcore.pixel_count(source) > OUT_OF_CORE_PIXELS)
+    if os.path.splitext(target)[1].lower() not in OUT_OF_CORE_FORMATS:
+        raise ValueError("out-of-core output must be PNG or raw; use --format png")
+    if not outofcore.can_stream(steps):
+        raise ValueError("the chain has operations that need the whole image in memory")
+    return True
+
+
+def process_file(source, target, steps, save_settings, out_of_core=None):
+    """Worker: load, apply the chain, save atomically; returns phase timings"""
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    if use_out_of_core(source, target, steps, out_of_core):
+        return process_out_of_core(source, target, steps, save_settings)
+    started = time.perf_counter()
+    with Image.open(source) as img:
+        img.load()
+    loaded = time.perf_counter()
+
+    result = pipeline.apply_chain(img, steps)
+    processed = time.perf_counter()
+
+    # Atomic, so a partly written file never looks finished to a resumed run
+    engine.save_image(result, target, **save_settings)
+    saved = time.perf_counter()
+    return {'load': loaded - started, 'process': processed - loaded, 'save': saved - processed}
+
+
+def process_out_of_core(source, target, steps, save_settings):
+    """Worker: map source, stream the chain and the save; returns phase timings"""
+    started = time.perf_counter()
+    # Scratch files sit beside the target, on the disk that will hold the result
+    scratch = target + '.source' + outofcore.RAW_EXTENSION
+    result_path = target + '.result' + outofcore.RAW_EXTENSION
+    mapped = result = None
+    try:
+        mapped = outofcore.MappedImage.load(source, scratch)
+        loaded = time.perf_counter()
+        result = outofcore.apply_chain(mapped, steps, result_path)
+        processed = time.perf_counter()
+        outofcore.save(result, target, save_settings.get('compress_level', 6))
+        saved = time.perf_counter()
+    finally:
+        for image in (mapped, result):
+            if image is not None:
+                image.close()
+        for path in (scratch, result_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return {'load': loaded - started, 'process': processed - loaded, 'save': saved - processed}
+
+
+def load_journal(path):
+    """Finished files recorded by earlier runs, keyed by source path"""
+    done = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be cut short by an interruption
+                    continue
+                done[record['source']] = record
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def run(files, output_dir, steps, workers=None, resume=True, save_settings=None,
+        image_format=None, out_of_core=None, out=sys.stdout):
+    """Process (path, relative path) files; returns the number of failures.
+
+    save_settings are encoder options passed to engine.save_image.
+    out_of_core True streams every file through outofcore, None only those
+    over OUT_OF_CORE_PIXELS.
+    """
+    workers = workers or parallel.cpu_count()
+    save_settings = save_settings or {}
+    chain = json.dumps(steps)
+    # Output settings, so changing the format or encoder options reprocesses
+    settings = json.dumps(dict(save_settings, format=image_format), sort_keys=True)
+    os.makedirs(output_dir, exist_ok=True)
+    journal_path = os.path.join(output_dir, JOURNAL_NAME)
+    done = load_journal(journal_path) if resume else {}
+
+    todo = []
+    skipped = 0
+    for source, relative in files:
+        target = target_path(relative, output_dir, image_format)
+        stat = os.stat(source)
+        record = done.get(os.path.abspath(source))
+        if (record is not None and record['chain'] == chain
+                and record.get('settings') == settings
+                and record['mtime'] == stat.st_mtime and record['size'] == stat.st_size
+                and os.path.exists(target)):
+            skipped += 1
+            continue
+        todo.append((source, target, stat))
+
+    if skipped:
+        print(f"Skipping {skipped} file(s) finished by an earlier run", file=out)
+    timings = []
+    failures = 0
+    started = time.perf_counter()
+    queue = iter(todo)
+    pending = {}
+    with open(journal_path, 'a') as journal, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        def fill():
+            while len(pending) < workers * IN_FLIGHT_PER_WORKER:
+                item = next(queue, None)
+                if item is None:
+                    return
+                pending[pool.submit(process_file, item[0], item[1], steps,
+                                     save_settings, out_of_core)] = item
+
+        try:
+            fill()
+            count = 0
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        raise future.exception()
+                    source, target, stat = pending.pop(future)
+                    count += 1
+                    prefix = f"[{count:>{len(str(len(todo)))}}/{len(todo)}] {source}"
+                    try:
+                        timing = future.result()
+                    except Exception as e:
+                        failures += 1
+                        print(f"{prefix}  FAILED: {e}", file=out)
+                        continue
+                    total = sum(timing.values())
+                    timings.append(total)
+                    journal.write(json.dumps({
+                        'source': os.path.abspath(source), 'target': target,
+                        'mtime': stat.st_mtime, 'size': stat.st_size,
+                        'chain': chain, 'settings': settings, 'seconds': round(total, 4)}) + '\n')
+                    journal.flush()
+                    print(f"{prefix}  load {timing['load'] * 1000:.0f} ms"
+                          f"  ops {timing['process'] * 1000:.0f} ms"
+                          f"  save {timing['save'] * 1000:.0f} ms"
+                          f"  total {total * 1000:.0f} ms", file=out)
+                fill()
+        except BrokenProcessPool:
+            # A worker died (killed for memory, or a crash in a codec) and took
+            # the pool with it; only finished files are in the journal
+            unfinished = [item[0] for item in pending.values()] + [item[0] for item in queue]
+            failures += len(unfinished)
+            print(f"A worker process died; {len(unfinished)} file(s) did not finish:", file=out)
+            for source in unfinished:
+                print(f"  {source}", file=out)
+            print("Run the same command again to retry them", file=out)
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print("Interrupted; run the same command again to resume", file=out)
+            raise
+
+    elapsed = time.perf_counter() - started
+    print(f"Processed {len(timings)}, skipped {skipped}, failed {failures} "
+          f"in {elapsed:.1f} s ({len(timings) / elapsed if elapsed else 0:.1f} files/s)",
+          file=out)
+    if timings:
+        # Nearest-rank, as in the editor's latency report
+        ordered = sorted(timings)
+        print(f"Per file: mean {sum(timings) / len(timings) * 1000:.0f} ms"
+              f"  p50 {percentile(ordered, 0.5) * 1000:.0f} ms"
+              f"  p95 {percentile(ordered, 0.95) * 1000:.0f} ms"
+              f"  max {max(timings) * 1000:.0f} ms", file=out)
+    return failures
+
+
+def main(argv=None):
+    """Command-line entry point; returns the process exit status"""
+    parser = argparse.ArgumentParser(
+        prog='main.py batch', description="Apply a chain of operations to many images.")
+    parser.add_argument('input', help="directory or glob pattern of images")
+    parser.add_argument('-o', '--output', required=True, help="output directory")
+    parser.add_argument('--recipe', type=load_recipe,
+                        help="recipe file saved from the editor; runs before any --op")
+    parser.add_argument('--op', dest='steps', action='append', default=[],
+                        metavar='NAME[=ARGS]', type=parse_step,
+                        help="operation to apply, in order; e.g. grayscale, rotate=15, "
+                             "brightness=20, crop=0,0,800,600. Known: "
+                             + ', '.join(engine.OPERATIONS))
+    parser.add_argument('--format', help="output format extension, e.g. png or jpg")
+    parser.add_argument('--quality', type=int, help="JPEG/WebP quality")
+    parser.add_argument('--subsampling', choices=('4:4:4', '4:2:2', '4:2:0'),
+                        help="JPEG chroma subsampling")
+    parser.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                        help="PNG zlib level; lower is faster and larger")
+    parser.add_argument('--optimize', action='store_true',
+                        help="extra JPEG/PNG size optimisation (slower)")
+    parser.add_argument('--compression', help="TIFF compression, e.g. tiff_lzw, tiff_deflate")
+    parser.add_argument('--out-of-core', action='store_true', default=None,
+                        help="stream every file through memory-mapped strips (PNG or raw "
+                             f"output); files over {OUT_OF_CORE_PIXELS // 1_000_000} MP "
+                             "are streamed anyway when possible. Memory stays bounded "
+                             "for raw and uncompressed TIFF inputs; others, such as "
+                             "JPEG or PNG, are decoded in memory once first")
+    parser.add_argument('-j', '--workers', type=int, help="worker processes (default: all CPUs)")
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help="include subdirectories of an input directory")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="reprocess files finished by an earlier run")
+    args = parser.parse_args(argv)
+    steps = (args.recipe.steps if args.recipe else []) + args.steps
+    if not steps:
+        parser.error("give a --recipe or at least one --op")
+    for name, args in steps:
+        try:
+            check_step(name, args)
+        except ValueError as e:
+            parser.error(str(e))
+
+    files = engine.find_images(args.input, args.recursive)
+    if not files:
+        print(f"No images found for {args.input}", file=sys.stderr)
+        return 1
+    save_settings = {key: value for key, value in (
+        ('quality', args.quality), ('subsampling', args.subsampling),
+        ('compress_level', args.compress_level), ('compression', args.compression),
+        ('optimize', args.optimize or None)) if value is not None}
+    try:
+        failures = run(files, args.output, steps, args.workers, not args.no_resume,
+                       save_settings, args.format, args.out_of_core)
+    except KeyboardInterrupt:
+        return 130
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
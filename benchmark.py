@@ -0,0 +1,328 @@
+"""Benchmarks for Ignora's image operations.
+
+Runs every editor operation, the display's tile rendering and each save format on
+synthetic images of several sizes and modes, and reports wall time,
+throughput and peak memory. Results can be written to JSON and compared with
+an earlier run; a slowdown or memory growth past the threshold makes the run
+fail, so it can gate CI. Nothing here needs a display.
+
+Each case runs in a forked child process where the platform allows it, so
+its peak memory can be read from the child's resource usage without earlier
+cases inflating it. Peak memory is what the operation adds on top of the
+source image.
+
+    python main.py benchmark --sizes 1,12 --output baseline.json
+    python main.py benchmark --sizes 1,12 --baseline baseline.json --threshold 0.15
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import PIL
+from PIL import Image
+
+import display
+import engine
+import parallel
+
+# Image sizes in megapixels and the modes each one is tried in
+SIZES = (1, 12, 50, 200)
+MODES = ('RGB', 'RGBA', 'L')
+
+# Canvas the display cases render for, as on a full-screen window
+DISPLAY_SIZE = (1600, 1000)
+
+# Extensions of the save cases
+SAVE_FORMATS = ('jpg', 'png', 'tiff', 'bmp', 'webp')
+
+# Fraction a case may get slower or bigger than the baseline before failing
+DEFAULT_THRESHOLD = 0.10
+
+# Cases faster than this in the baseline are too noisy to judge on time
+MIN_SECONDS = 0.005
+
+# Growth in peak memory below this is allocator noise, whatever the fraction
+MEMORY_SLACK = 8 * 1024 * 1024
+
+RESULTS_FORMAT = 'ignora-benchmark'
+
+
+def synthetic_image(megapixels, mode, seed=0):
+    """Gradients with a little noise: compresses like a photo, not like static"""
+    width = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    height = int(round(megapixels * 1e6 / width))
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 24, (height, width), dtype=np.uint8)
+    across = np.broadcast_to((np.arange(width) * 200 // width).astype(np.uint8), (height, width))
+    down = np.broadcast_to((np.arange(height) * 200 // height).astype(np.uint8)[:, None],
+                           (height, width))
+    bands = {'L': (across,), 'RGB': (across, down, across // 2 + down // 2),
+             'RGBA': (across, down, across // 2 + down // 2, 255 - down)}[mode]
+    pixels = np.dstack([band + noise for band in bands]) if len(bands) > 1 else bands[0] + noise
+    return Image.fromarray(pixels, mode)
+
+
+def operation_cases(img, workdir):
+    """(name, func) pairs timing each editor operation on img"""
+    width, height = img.size
+    cases = []
+    for name in ('grayscale', 'sepia', 'invert', 'blur', 'sharpen', 'emboss',
+                 'flip_horizontal', 'flip_vertical', 'rotate_90', 'rotate_180',
+                 'rotate_270', 'transpose'):
+        cases.append((name, lambda image, operation=engine.OPERATIONS[name]:
+                      engine.run_operation(operation, image)))
+    box = (width // 4, height // 4, width * 3 // 4, height * 3 // 4)
+    # 'adjust' is the fused path the sliders use; the single ones stay for comparison
+    for name, args in (('rotate', (15,)), ('crop', (box,)), ('brightness', (20,)),
+                       ('contrast', (20,)), ('saturation', (20,)), ('adjust', (20, 20, 20))):
+        cases.append((name, lambda image, operation=engine.OPERATIONS[name], args=args:
+                      engine.run_operation(operation, image, args)))
+    # Fitted to the window, then at 100% looking at the middle of the image
+    for name, zoom in (('display', None), ('display_100', 1.0)):
+        cases.append((name, lambda image, zoom=zoom: render_display(image, zoom)))
+    for extension in SAVE_FORMATS:
+        path = os.path.join(workdir, 'benchmark.' + extension)
+        cases.append(('save_' + extension, lambda image, path=path:
+                      engine.save_image(image, path, **engine.DEFAULT_SAVE_SETTINGS)))
+    return cases
+
+
+def render_display(img, zoom=None):
+    """Tiles the editor draws for a freshly opened img, without Tk.
+
+    Builds the pyramid level for the scale like TiledCanvasRenderer and
+    resamples every tile visible on a DISPLAY_SIZE canvas; zoom None fits
+    the image to the canvas, otherwise the view is centered on the image.
+    """
+    scale = zoom or engine.display_scale(img.size, DISPLAY_SIZE)
+    scaled_size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+    pyramid = display.DisplayPyramid()
+    pyramid.set_image(img, 0)
+    level_image = pyramid.get_level(pyramid.level_for_scale(scale))
+    left = max(0, (scaled_size[0] - DISPLAY_SIZE[0]) // 2)
+    top = max(0, (scaled_size[1] - DISPLAY_SIZE[1]) // 2)
+    right = min(scaled_size[0], left + DISPLAY_SIZE[0])
+    bottom = min(scaled_size[1], top + DISPLAY_SIZE[1])
+    size = display.TILE_SIZE
+    tiles = []
+    for col, row in display.tiles_covering(left, top, right, bottom):
+        bounds = (col * size, row * size,
+                  min(scaled_size[0], (col + 1) * size), min(scaled_size[1], (row + 1) * size))
+        tiles.append(display.resample_tile(level_image, scaled_size, bounds))
+    return tiles
+
+
+def _rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _max_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(func, img, repeat):
+    """Best of repeat timed calls of func(img), and the peak memory added if known"""
+    start = _rss()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(img)
+        times.append(time.perf_counter() - started)
+    peak = _max_rss()
+    added = peak - start if peak is not None and start is not None else None
+    return {'seconds': min(times), 'mean_seconds': sum(times) / len(times),
+            'peak_bytes': added}
+
+
+def _measure_in_child(connection, func, img, repeat):
+    try:
+        connection.send(measure(func, img, repeat))
+    except BaseException as e:
+        connection.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        parallel.shutdown_pool()
+        connection.close()
+
+
+def run_case(func, img, repeat):
+    """measure() in a forked child if possible, so peaks don't accumulate"""
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        result = measure(func, img, repeat)
+        result['peak_bytes'] = None
+        return result
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    # Forked, so img and func reach the child without being pickled
+    child = context.Process(target=_measure_in_child, args=(sender, func, img, repeat))
+    child.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {'error': f"benchmark process died (exit code {child.exitcode})"}
+    child.join()
+    if 'error' not in result and child.exitcode:
+        result = {'error': f"benchmark process exited with {child.exitcode}"}
+    return result
+
+
+def run(sizes=SIZES, modes=MODES, operations=None, repeat=3, out=sys.stdout):
+    """Benchmark every case; returns the list of result records"""
+    workdir = tempfile.mkdtemp(prefix='ignora-benchmark-')
+    results = []
+    try:
+        for megapixels in sizes:
+            for mode in modes:
+                img = synthetic_image(megapixels, mode)
+                actual = img.width * img.height / 1e6
+                for name, func in operation_cases(img, workdir):
+                    if operations and name not in operations:
+                        continue
+                    result = run_case(func, img, repeat)
+                    record = {'operation': name, 'mode': mode, 'megapixels': megapixels,
+                              'size': list(img.size)}
+                    if 'error' in result:
+                        record['error'] = result['error']
+                        print(f"{megapixels:>5g} MP {mode:<4} {name:<16} FAILED: "
+                              f"{result['error']}", file=out)
+                    else:
+                        record.update(result)
+                        record['megapixels_per_second'] = actual / max(result['seconds'], 1e-9)
+                        print(format_record(record), file=out)
+                    out.flush()
+                    results.append(record)
+                del img
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def format_record(record, note=''):
+    """One table line for a result record"""
+    peak = record.get('peak_bytes')
+    memory = f"{peak / 2 ** 20:8.0f} MB" if peak is not None else '       - MB'
+    return (f"{record['megapixels']:>5g} MP {record['mode']:<4} {record['operation']:<16}"
+            f"{record['seconds'] * 1000:10.1f} ms {record['megapixels_per_second']:9.1f} MP/s"
+            f" {memory}{note}")
+
+
+def _key(record):
+    return record['operation'], record['mode'], record['megapixels']
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """(record, messages) for every result worse than its baseline by over threshold"""
+    before = {_key(record): record for record in baseline if 'error' not in record}
+    regressions = []
+    for record in results:
+        old = before.get(_key(record))
+        if old is None:
+            continue
+        if 'error' in record:
+            regressions.append((record, ["failed"]))
+            continue
+        messages = []
+        if (old['seconds'] >= MIN_SECONDS
+                and record['seconds'] > old['seconds'] * (1 + threshold)):
+            messages.append(f"time +{record['seconds'] / old['seconds'] - 1:.0%}")
+        if (old.get('peak_bytes') and record.get('peak_bytes') is not None
+                and record['peak_bytes'] > old['peak_bytes']
+                + max(old['peak_bytes'] * threshold, MEMORY_SLACK)):
+            messages.append(f"memory +{record['peak_bytes'] / old['peak_bytes'] - 1:.0%}")
+        if messages:
+            regressions.append((record, messages))
+    return regressions
+
+
+def save_results(results, path):
+    """Write results, with enough about the machine to tell runs apart"""
+    data = {'format': RESULTS_FORMAT, 'version': 1, 'python': platform.python_version(),
+            'pillow': PIL.__version__, 'numpy': np.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
+
+
+def load_results(path):
+    """Result records from a file written by save_results()"""
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('format') != RESULTS_FORMAT:
+        raise ValueError(f"{path} is not an Ignora benchmark file")
+    return data['results']
+
+
+def _numbers(text):
+    return [float(v) if '.' in v else int(v) for v in text.split(',') if v.strip()]
+
+
+def main(argv=None):
+    """Command-line entry point; returns 1 if any case regressed or failed"""
+    parser = argparse.ArgumentParser(
+        prog='main.py benchmark',
+        description="Time Ignora's operations on synthetic images.")
+    parser.add_argument('--sizes', type=_numbers, default=list(SIZES),
+                        help="comma-separated image sizes in megapixels (default: %(default)s)")
+    parser.add_argument('--modes', type=lambda text: text.split(','), default=list(MODES),
+                        help="comma-separated image modes (default: RGB,RGBA,L)")
+    parser.add_argument('--operations', type=lambda text: set(text.split(',')),
+                        help="only these cases, e.g. blur,rotate,save_jpg")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="timed runs per case; the best is kept (default: 3)")
+    parser.add_argument('--quick', action='store_true',
+                        help="1 MP only, one run per case; a smoke test")
+    parser.add_argument('-o', '--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', type=load_results,
+                        help="results file of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown or memory growth as a fraction "
+                             "(default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.sizes, args.repeat = [1], 1
+    for mode in args.modes:
+        if mode not in MODES:
+            parser.error(f"unsupported mode {mode}; choose from {', '.join(MODES)}")
+
+    print(f"Pillow {PIL.__version__}, NumPy {np.__version__}, {os.cpu_count()} CPUs")
+    results = run(args.sizes, args.modes, args.operations, args.repeat)
+    if args.output:
+        save_results(results, args.output)
+
+    failures = sum(1 for record in results if 'error' in record)
+    if args.baseline is None:
+        return 1 if failures else 0
+    regressions = compare(results, args.baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} case(s) regressed beyond {args.threshold:.0%}:")
+        for record, messages in regressions:
+            if 'error' in record:
+                print(f"{record['megapixels']:>5g} MP {record['mode']:<4} "
+                      f"{record['operation']:<16} FAILED")
+            else:
+                print(format_record(record, '  ' + ', '.join(messages)))
+    else:
+        print(f"\nNo regressions beyond {args.threshold:.0%} against the baseline")
+    return 1 if regressions or failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
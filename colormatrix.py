@@ -0,0 +1,160 @@
+"""Affine colour-matrix operations for Ignora.
+
+Grayscale, sepia, invert and saturation are all affine maps of the colour
+channels, so they share one implementation: a 4x5 matrix acting on
+(R, G, B, A, 1). Chains of them compose into a single matrix and cost one
+pass over the pixels.
+"""
+import numpy as np
+from PIL import Image
+
+# Pixels converted to float32 at a time on the NumPy path
+CHUNK_PIXELS = 1 << 20
+
+# Modes colour operations work on directly
+MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+# ITU-R 601-2 luma weights, as used by Image.convert('L')
+LUMA = (0.299, 0.587, 0.114)
+
+
+def editable(img):
+    """img in one of the modes colour operations work on: L, LA, RGB or RGBA"""
+    if img.mode in ('P', 'PA'):
+        has_alpha = img.mode == 'PA' or 'transparency' in img.info
+        return img.convert('RGBA' if has_alpha else 'RGB')
+    if img.mode == '1':
+        return img.convert('L')
+    if img.mode not in MODES:
+        # Other modes (CMYK, YCbCr, 16-bit and float) are edited as RGB
+        return img.convert('RGB')
+    return img
+
+
+class ColorMatrix:
+    """Affine colour transform stored as a 4x5 matrix over (R, G, B, A, 1).
+
+    A 3x4 matrix over (R, G, B, 1) is accepted too and leaves alpha alone.
+    Values are in 0-255 units, so the offset column of invert is 255.
+    """
+
+    def __init__(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.shape == (3, 4):
+            full = np.zeros((4, 5))
+            full[:3, :3] = matrix[:, :3]
+            full[:3, 4] = matrix[:, 3]
+            full[3, 3] = 1.0
+            matrix = full
+        if matrix.shape != (4, 5):
+            raise ValueError(f"Colour matrix must be 3x4 or 4x5, not {matrix.shape}")
+        self.matrix = matrix
+
+    def _homogeneous(self):
+        square = np.eye(5)
+        square[:4] = self.matrix
+        return square
+
+    def then(self, other):
+        """Matrix applying self first and other second"""
+        return ColorMatrix((other._homogeneous() @ self._homogeneous())[:4])
+
+    def keeps_alpha(self):
+        """Whether alpha passes through unchanged and colour ignores it"""
+        return (np.allclose(self.matrix[3], (0, 0, 0, 1, 0))
+                and np.allclose(self.matrix[:3, 3], 0))
+
+    def keeps_gray(self):
+        """Whether gray input stays gray, so L images can stay L"""
+        gain = self.matrix[:3, :3].sum(axis=1)
+        offset = self.matrix[:3, 4]
+        return np.allclose(gain, gain[0]) and np.allclose(offset, offset[0])
+
+    def clips(self):
+        """Whether some 8-bit input maps outside 0-255 and must be clamped.
+
+        Matrices that clip cannot be composed with a following matrix
+        without changing the result.
+        """
+        corners = np.array([(r, g, b, a, 1) for r in (0, 255) for g in (0, 255)
+                            for b in (0, 255) for a in (0, 255)], dtype=np.float64)
+        values = corners @ self.matrix.T
+        return bool((values < -1e-6).any() or (values > 255 + 1e-6).any())
+
+    def apply(self, img):
+        """Return a new image with the matrix applied; alpha is preserved"""
+        img = editable(img)
+        if img.mode in ('L', 'LA'):
+            if self.keeps_gray() and self.keeps_alpha():
+                return self._apply_gray(img)
+            img = img.convert('RGBA' if img.mode == 'LA' else 'RGB')
+
+        if img.mode == 'RGB' or self.keeps_alpha():
+            # Pillow's matrix convert does the whole image in one C pass
+            matrix = tuple(float(v) for row in self.matrix[:3]
+                           for v in (row[0], row[1], row[2], row[4]))
+            if img.mode == 'RGB':
+                return img.convert('RGB', matrix)
+            result = img.convert('RGB').convert('RGB', matrix)
+            result.putalpha(img.getchannel('A'))
+            return result
+        return self._apply_chunked(img)
+
+    def _apply_gray(self, img):
+        # Gray-to-gray affine maps are point operations
+        gain = self.matrix[0, :3].sum()
+        offset = self.matrix[0, 4]
+        lut = [int(np.clip(round(v * gain + offset), 0, 255)) for v in range(256)]
+        if img.mode == 'LA':
+            lut += list(range(256))
+        return img.point(lut)
+
+    def _apply_chunked(self, img):
+        """General RGBA path in bounded float32 chunks"""
+        pixels = np.asarray(img)
+        height, width, bands = pixels.shape
+        linear = self.matrix[:bands, :bands].T.astype(np.float32)
+        offset = self.matrix[:bands, 4].astype(np.float32) + 0.5
+        result = np.empty_like(pixels)
+        rows = max(1, CHUNK_PIXELS // width)
+        for top in range(0, height, rows):
+            chunk = pixels[top:top + rows].astype(np.float32) @ linear
+            chunk += offset
+            np.clip(chunk, 0, 255, out=chunk)
+            result[top:top + rows] = chunk
+        return Image.fromarray(result, img.mode)
+
+
+def compose(*matrices):
+    """Single matrix equivalent to applying matrices in order"""
+    result = IDENTITY
+    for matrix in matrices:
+        result = result.then(matrix)
+    return result
+
+
+def saturation(factor):
+    """Blend each channel with luma; 0 is grayscale, 1 is unchanged"""
+    matrix = np.zeros((3, 4))
+    for channel in range(3):
+        for i in range(3):
+            identity = 1.0 if i == channel else 0.0
+            matrix[channel, i] = factor * identity + (1.0 - factor) * LUMA[i]
+    return ColorMatrix(matrix)
+
+
+IDENTITY = ColorMatrix(np.eye(4, 5))
+
+GRAYSCALE = saturation(0.0)
+
+SEPIA = ColorMatrix([
+    [0.393, 0.769, 0.189, 0],
+    [0.349, 0.686, 0.168, 0],
+    [0.272, 0.534, 0.131, 0]
+])
+
+INVERT = ColorMatrix([
+    [-1, 0, 0, 255],
+    [0, -1, 0, 255],
+    [0, 0, -1, 255]
+])
@@ -0,0 +1,322 @@
+"""Display-side caches and rendering for the Ignora canvas.
+
+The editor never resamples the full-resolution image for the screen directly.
+A DisplayPyramid keeps power-of-two levels of the image, and the
+TiledCanvasRenderer resamples only the tiles of the nearest level that
+intersect the visible part of the canvas.
+"""
+import math
+
+from lazy import LazyModule
+
+# Deferred until the first image is shown
+Image = LazyModule('PIL.Image')
+ImageTk = LazyModule('PIL.ImageTk')
+ImageDraw = LazyModule('PIL.ImageDraw')
+
+TILE_SIZE = 256
+
+# Modes Image.reduce() works on directly; others are converted first
+REDUCIBLE_MODES = ('L', 'LA', 'I', 'F', 'RGB', 'RGBA', 'RGBa', 'CMYK', 'YCbCr')
+
+
+def reduce_by_two(image, box=None):
+    """Halve an image (or a box of it) by averaging, converting odd modes first"""
+    if image.mode not in REDUCIBLE_MODES:
+        if box is not None:
+            image = image.crop(box)
+            box = None
+        if image.mode == '1':
+            image = image.convert('L')
+        elif image.mode in ('P', 'PA') and ('transparency' in image.info or image.mode == 'PA'):
+            image = image.convert('RGBA')
+        else:
+            image = image.convert('RGB')
+    return image.reduce(2, box=box)
+
+
+def tiles_covering(left, top, right, bottom, tile_size=TILE_SIZE):
+    """Tile (column, row) indices covering a box in scaled image coordinates"""
+    return {(col, row)
+            for col in range(int(left) // tile_size, int(math.ceil(right / tile_size)))
+            for row in range(int(top) // tile_size, int(math.ceil(bottom / tile_size)))}
+
+
+def resample_tile(level_image, scaled_size, bounds):
+    """Pixels of the tile at bounds when level_image is shown at scaled_size"""
+    x0, y0, x1, y1 = bounds
+    # Map the tile back into the pyramid level it is resampled from
+    ratio_x = level_image.width / scaled_size[0]
+    ratio_y = level_image.height / scaled_size[1]
+    box = (x0 * ratio_x, y0 * ratio_y, x1 * ratio_x, y1 * ratio_y)
+    return level_image.resize((x1 - x0, y1 - y0), Image.Resampling.LANCZOS, box=box)
+
+
+class DisplayPyramid:
+    """Lazily built power-of-two downscales of an image.
+
+    Level 0 is the source image, level k is the source reduced by 2**k.
+    Levels are keyed on the image version: a new version drops every level,
+    while invalidate() only marks the changed region dirty so it can be
+    rebuilt from the level below on the next request.
+    """
+
+    def __init__(self, min_size=64):
+        self.min_size = min_size
+        self.image = None
+        self.version = None
+        self.levels = {}
+        self.dirty = {}
+
+    @property
+    def nbytes(self):
+        """Memory held by the reduced levels; level 0 is the image itself"""
+        return sum(image.width * image.height * len(image.getbands())
+                   for level, image in self.levels.items() if level > 0)
+
+    def set_image(self, image, version):
+        """Use image as level 0; cached levels survive only if version matches"""
+        if image is self.image and version == self.version:
+            return
+        self.image = image
+        self.version = version
+        self.levels = {0: image}
+        self.dirty = {}
+
+    def replace_source(self, image):
+        """Swap level 0 for an identical copy, keeping every cached level"""
+        self.image = image
+        self.levels[0] = image
+
+    def invalidate(self, box, version):
+        """Mark the (x1, y1, x2, y2) source region as changed in place"""
+        if self.image is None:
+            return
+        self.version = version
+        for level in self.levels:
+            if level > 0:
+                self.dirty.setdefault(level, []).append(box)
+
+    def max_level(self):
+        """Highest level that stays at least min_size pixels on its short side"""
+        if self.image is None:
+            return 0
+        short_side = min(self.image.size)
+        if short_side <= self.min_size:
+            return 0
+        return int(math.log2(short_side / self.min_size))
+
+    def level_for_scale(self, scale):
+        """Smallest cached level that is still at least as large as scale"""
+        if scale >= 1.0:
+            return 0
+        return min(int(math.floor(math.log2(1.0 / scale))), self.max_level())
+
+    def get_level(self, level):
+        """Return the image for a level, building or refreshing it as needed"""
+        if level not in self.levels:
+            self.levels[level] = reduce_by_two(self.get_level(level - 1))
+            self.dirty.pop(level, None)
+        elif self.dirty.get(level):
+            self._refresh(level)
+        return self.levels[level]
+
+    def _refresh(self, level):
+        """Rebuild only the dirty regions of a level from the level below"""
+        below = self.get_level(level - 1)
+        image = self.levels[level]
+        factor = 2 ** level
+        for x1, y1, x2, y2 in self.dirty.pop(level):
+            # Region in this level's coordinates, rounded outwards
+            left = max(0, x1 // factor)
+            top = max(0, y1 // factor)
+            right = min(image.width, -(-x2 // factor))
+            bottom = min(image.height, -(-y2 // factor))
+            if right <= left or bottom <= top:
+                continue
+            source_box = (left * 2, top * 2,
+                          min(below.width, right * 2), min(below.height, bottom * 2))
+            image.paste(reduce_by_two(below, source_box), (left, top))
+
+
+class TiledCanvasRenderer:
+    """Draws a pyramid onto a Tk canvas as tiles covering the visible area.
+
+    The scaled image is laid out in canvas coordinates starting at origin,
+    centered when it is smaller than the canvas. Tiles are rendered on demand
+    as the view scrolls, and PhotoImage objects of tiles that scroll out of
+    view are kept and reused through paste(). A PhotoImage converts whatever
+    is pasted to the mode it was created with, so photos are only reused for
+    pixels of the same mode.
+    """
+
+    def __init__(self, canvas, pyramid, tile_size=TILE_SIZE):
+        self.canvas = canvas
+        self.pyramid = pyramid
+        self.tile_size = tile_size
+        self.scale = None
+        self.origin = (0, 0)
+        self.scaled_size = (0, 0)
+        self.tiles = {}
+        self.spare_photos = {}
+        self.preview = None
+
+    def set_view(self, scale, canvas_size):
+        """Lay the image out at scale on a canvas of canvas_size"""
+        img_width, img_height = self.pyramid.image.size
+        scaled_size = (max(1, int(img_width * scale)), max(1, int(img_height * scale)))
+        canvas_width, canvas_height = canvas_size
+        origin = (max(0, (canvas_width - scaled_size[0]) // 2),
+                  max(0, (canvas_height - scaled_size[1]) // 2))
+        
+        if (scale, scaled_size, origin) != (self.scale, self.scaled_size, self.origin):
+            self.clear()
+        self.scale = scale
+        self.scaled_size = scaled_size
+        self.origin = origin
+        self.canvas.configure(scrollregion=(0, 0,
+                                            max(canvas_width, scaled_size[0]),
+                                            max(canvas_height, scaled_size[1])))
+
+    def clear(self):
+        """Remove every tile from the canvas"""
+        for key in list(self.tiles):
+            self._release(key)
+
+    def visible_tiles(self):
+        """Tile (column, row) indices intersecting the visible canvas region"""
+        left = self.canvas.canvasx(0) - self.origin[0]
+        top = self.canvas.canvasy(0) - self.origin[1]
+        right = left + self.canvas.winfo_width()
+        bottom = top + self.canvas.winfo_height()
+        
+        left, top = max(0, left), max(0, top)
+        right = min(self.scaled_size[0], right)
+        bottom = min(self.scaled_size[1], bottom)
+        if right <= left or bottom <= top:
+            return set()
+        return tiles_covering(left, top, right, bottom, self.tile_size)
+
+    def render(self):
+        """Render missing or stale visible tiles and drop the ones out of view"""
+        if self.pyramid.image is None or self.scale is None:
+            return
+        visible = self.visible_tiles()
+        for key in list(self.tiles):
+            if key not in visible:
+                self._release(key)
+        for key in visible:
+            tile = self.tiles.get(key)
+            if tile is None or tile[2] != self.pyramid.version:
+                self._render_tile(key)
+
+    def tile_bounds(self, key):
+        """Bounds of a tile in scaled image coordinates"""
+        col, row = key
+        x0 = col * self.tile_size
+        y0 = row * self.tile_size
+        return (x0, y0,
+                min(self.scaled_size[0], x0 + self.tile_size),
+                min(self.scaled_size[1], y0 + self.tile_size))
+
+    def set_preview(self, image):
+        """Show image, a reduced copy of the whole picture, instead of the pyramid"""
+        self.preview = image
+        for key in list(self.tiles):
+            self._render_tile(key)
+
+    def clear_preview(self):
+        """Go back to rendering from the pyramid"""
+        if self.preview is None:
+            return
+        self.preview = None
+        for key in list(self.tiles):
+            self._render_tile(key)
+
+    def _render_tile(self, key):
+        x0, y0, x1, y1 = bounds = self.tile_bounds(key)
+        if self.preview is not None:
+            level_image = self.preview
+        else:
+            level_image = self.pyramid.get_level(self.pyramid.level_for_scale(self.scale))
+        pixels = resample_tile(level_image, self.scaled_size, bounds)
+        
+        tile = self.tiles.get(key)
+        if tile is not None and tile[4] == pixels.mode:
+            item, photo = tile[0], tile[1]
+            photo.paste(pixels)
+        elif tile is not None:
+            # The edit changed the mode, which the old photo would convert back
+            item = tile[0]
+            self._pool_photo(tile[1], tile[4])
+            photo = self._acquire_photo(pixels)
+            self.canvas.itemconfigure(item, image=photo)
+        else:
+            photo = self._acquire_photo(pixels)
+            item = self.canvas.create_image(self.origin[0] + x0, self.origin[1] + y0,
+                                            image=photo, anchor='nw', tags='tile')
+            self.canvas.tag_lower(item)
+        self.tiles[key] = [item, photo, self.pyramid.version, pixels, pixels.mode]
+
+    def _acquire_photo(self, pixels):
+        spare = self.spare_photos.get((pixels.mode, pixels.size))
+        if spare:
+            photo = spare.pop()
+            photo.paste(pixels)
+            return photo
+        return ImageTk.PhotoImage(pixels)
+
+    def _pool_photo(self, photo, mode):
+        # Only full tiles are worth pooling, edge tiles change size with zoom
+        size = (photo.width(), photo.height())
+        if size == (self.tile_size, self.tile_size):
+            self.spare_photos.setdefault((mode, size), []).append(photo)
+
+    def _release(self, key):
+        item, photo, _, _, mode = self.tiles.pop(key)
+        self.canvas.delete(item)
+        self._pool_photo(photo, mode)
+
+    def _tiles_touching(self, box, pad=0):
+        """Rendered tiles overlapping a box given in scaled image coordinates"""
+        x1, y1, x2, y2 = box
+        for key in self.tiles:
+            tx0, ty0, tx1, ty1 = self.tile_bounds(key)
+            if tx0 < x2 + pad and x1 - pad < tx1 and ty0 < y2 + pad and y1 - pad < ty1:
+                yield key
+
+    def refresh_region(self, box):
+        """Re-render only the tiles overlapping an image region edited in place"""
+        if self.scale is None:
+            return
+        scaled_box = tuple(v * self.scale for v in box)
+        # Pad by the resampling filter's reach so neighbouring tiles stay exact.
+        # LANCZOS reaches 3 pixels of the level, or of the screen when shrinking,
+        # whichever is wider, so zoomed in it is 3 * scale screen pixels.
+        damaged = set(self._tiles_touching(scaled_box, pad=3 * max(1.0, self.scale)))
+        for key, tile in self.tiles.items():
+            if key in damaged:
+                self._render_tile(key)
+            else:
+                tile[2] = self.pyramid.version
+
+    def draw_stroke(self, points, color, width):
+        """Paint a stroke onto the visible tiles only, as an interactive preview"""
+        if self.scale is None or len(points) < 2:
+            return
+        scaled = [(x * self.scale, y * self.scale) for x, y in points]
+        scaled_width = max(1, int(round(width * self.scale)))
+        pad = scaled_width / 2 + 1
+        xs = [p[0] for p in scaled]
+        ys = [p[1] for p in scaled]
+        for key in list(self._tiles_touching((min(xs), min(ys), max(xs), max(ys)), pad)):
+            tile = self.tiles[key]
+            tx0, ty0 = self.tile_bounds(key)[:2]
+            ImageDraw.Draw(tile[3]).line([(x - tx0, y - ty0) for x, y in scaled],
+                                         fill=color, width=scaled_width)
+            tile[1].paste(tile[3])
+
+    def canvas_to_image(self, x, y):
+        """Convert canvas coordinates to full-resolution image coordinates"""
+        return (int((x - self.origin[0]) / self.scale),
+                int((y - self.origin[1]) / self.scale))
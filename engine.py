@@ -0,0 +1,501 @@
+"""Headless image operations for Ignora.
+
+Every function here works on plain PIL images and never touches Tk, so the
+same code paths serve the editor window, batch jobs and benchmarks.
+"""
+import glob
+import os
+
+from PIL import ImageFilter
+
+from lazy import LazyModule
+import tracing
+
+# Deferred until first used, to keep start-up quick
+Image = LazyModule('PIL.Image')
+ImageEnhance = LazyModule('PIL.ImageEnhance')
+ImageDraw = LazyModule('PIL.ImageDraw')
+colormatrix = LazyModule('colormatrix')
+parallel = LazyModule('parallel')
+
+# Margin (in canvas pixels) kept around the image when fitting it to the view
+DISPLAY_MARGIN = 20
+
+# Rows per strip when a filter runs in steps to report progress
+STRIP_ROWS = 256
+
+# Encoder settings each format understands; others are dropped when saving
+ENCODER_SETTINGS = {
+    'JPEG': ('quality', 'subsampling', 'optimize', 'progressive'),
+    'PNG': ('compress_level', 'optimize'),
+    'TIFF': ('compression',),
+    'WEBP': ('quality', 'lossless', 'method'),
+}
+
+# Default encoder settings used by the editor
+DEFAULT_SAVE_SETTINGS = {
+    'quality': 90,
+    'subsampling': '4:2:0',
+    'compress_level': 6,
+    'optimize': False,
+    'compression': 'raw',
+}
+
+# Modes each format can store; anything else is converted to RGB first
+FORMAT_MODES = {
+    'JPEG': ('L', 'RGB', 'CMYK'),
+    'BMP': ('1', 'L', 'P', 'RGB'),
+}
+
+# Extensions picked up when listing the images in a directory
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+
+class Cancelled(Exception):
+    """Raised from a progress callback to abandon an operation"""
+
+
+# Loading
+def find_images(source, recursive=False):
+    """(path, path relative to the input root) for each image in a directory or glob"""
+    if os.path.isdir(source):
+        root = source
+        if recursive:
+            paths = [os.path.join(folder, name)
+                     for folder, _, names in os.walk(source) for name in names]
+        else:
+            paths = [os.path.join(source, name) for name in os.listdir(source)]
+        paths = [p for p in paths
+                 if os.path.isfile(p) and os.path.splitext(p)[1].lower() in EXTENSIONS]
+    else:
+        paths = [p for p in glob.glob(source, recursive=True) if os.path.isfile(p)]
+        if not paths:
+            return []
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    return sorted((p, os.path.relpath(os.path.abspath(p), os.path.abspath(root)))
+                  for p in paths)
+
+
+def load_image(path):
+    """Open and fully decode an image file"""
+    with tracing.span('decode', 'decode', file=os.path.basename(path)):
+        img = Image.open(path)
+        img.load()
+    return img
+
+
+def load_preview(path, size):
+    """Quickly decode a reduced copy of a large JPEG, at least size big.
+
+    Uses the decoder's DCT scaling, so only a fraction of the work of a full
+    decode is done. Returns None for other formats and for images that are
+    small enough to decode in full anyway.
+    """
+    img = Image.open(path)
+    if img.format != 'JPEG' or (img.width <= size[0] and img.height <= size[1]):
+        img.close()
+        return None
+    if img.draft(img.mode, size) is None:
+        img.close()
+        return None
+    img.load()
+    return img
+
+
+def load_thumbnail(path, size):
+    """Decode path scaled down to fit in size, in an RGB or RGBA mode.
+
+    JPEGs are decoded at a reduced scale (draft mode) first, so a thumbnail
+    of a large photo costs a fraction of a full decode.
+    """
+    img = Image.open(path)
+    if img.format == 'JPEG':
+        img.draft('RGB', size)
+    img.thumbnail(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    if img.mode in ('RGB', 'RGBA'):
+        return img
+    return img.convert('RGBA' if 'transparency' in img.info or 'A' in img.getbands() else 'RGB')
+
+
+# Saving
+def format_for_path(path):
+    """Pillow format name for a file name's extension"""
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        return Image.registered_extensions()[extension]
+    except KeyError:
+        raise ValueError(f"Unknown image format for {os.path.basename(path)}")
+
+
+def save_image(img, path, image_format=None, **settings):
+    """Encode img to a temporary file next to path, then rename it into place.
+
+    settings are encoder options such as quality or compress_level; the ones
+    the format doesn't take are ignored. Until the rename, any existing file
+    at path is untouched, so a crash mid-write can't corrupt it.
+    """
+    image_format = image_format or format_for_path(path)
+    options = {key: value for key, value in settings.items()
+               if key in ENCODER_SETTINGS.get(image_format, ())}
+    modes = FORMAT_MODES.get(image_format)
+    if modes is not None and img.mode not in modes:
+        img = img.convert('RGB')
+
+    partial = path + '.part'
+    try:
+        with open(partial, 'wb') as f:
+            with tracing.span('encode', 'save', format=image_format):
+                img.save(f, format=image_format, **options)
+            with tracing.span('sync', 'save'):
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+# Filters
+def grayscale(img):
+    """Convert image to grayscale, keeping the colour mode and alpha"""
+    return colormatrix.GRAYSCALE.apply(img)
+
+
+def sepia(img):
+    """Apply sepia tone"""
+    return colormatrix.SEPIA.apply(img)
+
+
+def invert(img):
+    """Invert image colors, leaving alpha alone"""
+    return colormatrix.INVERT.apply(img)
+
+
+def kernel_halo(image_filter):
+    """Rows of context a kernel filter needs on each side of a strip"""
+    width, height = image_filter.filterargs[0]
+    return max(width, height) // 2
+
+
+def filter_in_strips(img, image_filter, progress=None, strip_rows=STRIP_ROWS):
+    """Apply a kernel filter strip by strip, calling progress(fraction) between strips.
+
+    Each strip is filtered together with a halo of neighbouring rows that is
+    then discarded, so the result is identical to img.filter(image_filter).
+    Large images are spread over all cores by the parallel module.
+    """
+    halo = kernel_halo(image_filter)
+    if parallel.can_parallelize(img):
+        return parallel.filter_in_parallel(img, image_filter, halo, progress)
+    if progress is None:
+        return img.filter(image_filter)
+        
+    width, height = img.size
+    result = Image.new(img.mode, img.size)
+    for top in range(0, height, strip_rows):
+        bottom = min(height, top + strip_rows)
+        source_top = max(0, top - halo)
+        strip = img.crop((0, source_top, width, min(height, bottom + halo))).filter(image_filter)
+        result.paste(strip.crop((0, top - source_top, width, bottom - source_top)), (0, top))
+        progress(bottom / height)
+    return result
+
+
+def blur(img, progress=None):
+    """Apply blur filter"""
+    return filter_in_strips(img, ImageFilter.BLUR, progress)
+
+
+def sharpen(img, progress=None):
+    """Apply sharpen filter"""
+    return filter_in_strips(img, ImageFilter.SHARPEN, progress)
+
+
+def emboss(img, progress=None):
+    """Apply emboss filter"""
+    return filter_in_strips(img, ImageFilter.EMBOSS, progress)
+
+
+# Kernel filter behind each filter operation
+KERNEL_FILTERS = {
+    blur: ImageFilter.BLUR,
+    sharpen: ImageFilter.SHARPEN,
+    emboss: ImageFilter.EMBOSS,
+}
+
+
+# Transforms
+def flip_horizontal(img):
+    """Flip image horizontally"""
+    return img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+
+def flip_vertical(img):
+    """Flip image vertically"""
+    return img.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+
+
+def rotate_90(img):
+    """Rotate image 90 degrees"""
+    return img.transpose(Image.Transpose.ROTATE_90)
+
+
+def rotate_180(img):
+    """Rotate image 180 degrees"""
+    return img.transpose(Image.Transpose.ROTATE_180)
+
+
+def rotate_270(img):
+    """Rotate image 270 degrees"""
+    return img.transpose(Image.Transpose.ROTATE_270)
+
+
+def transpose(img):
+    """Transpose image (swap width and height)"""
+    return img.transpose(Image.Transpose.TRANSPOSE)
+
+
+def rotate(img, angle, fillcolor='white'):
+    """Rotate clockwise by an arbitrary angle, expanding to fit"""
+    # Use expand=True to avoid cutting off parts of the image
+    return img.rotate(-angle, expand=True, fillcolor=fillcolor)
+
+
+def crop(img, box):
+    """Crop image to the (x1, y1, x2, y2) box"""
+    return img.crop(tuple(box))
+
+
+# Adjustments (value ranges from -100 to 100, 0 is a no-op)
+def adjust_brightness(img, value):
+    """Adjust image brightness"""
+    return ImageEnhance.Brightness(img).enhance(1.0 + (value / 100.0))
+
+
+def adjust_contrast(img, value):
+    """Adjust image contrast"""
+    return ImageEnhance.Contrast(img).enhance(1.0 + (value / 100.0))
+
+
+def adjust_saturation(img, value):
+    """Adjust image saturation"""
+    return colormatrix.saturation(1.0 + (value / 100.0)).apply(img)
+
+
+def _clip8(value):
+    """Truncate and clamp a blended value the way Image.blend does"""
+    return 0 if value <= 0 else 255 if value >= 255 else int(value)
+
+
+class Adjustments:
+    """Brightness, contrast and saturation composed into one evaluation.
+
+    The two point operations are folded into a single lookup table and
+    saturation into a single colour matrix, so applying all three costs one
+    point() pass and one colour-matrix pass instead of three blends. Each
+    value ranges from -100 to 100 like the editor sliders. The result is
+    within a few levels (rounding) of applying adjust_brightness,
+    adjust_contrast and adjust_saturation in that order, since the separate
+    steps round to 8 bits in between.
+    """
+
+    def __init__(self, brightness=0, contrast=0, saturation=0):
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self._stats_image = None
+        self._histograms = None
+
+    def is_identity(self):
+        """Whether applying the adjustments changes nothing"""
+        return self.brightness == 0 and self.contrast == 0 and self.saturation == 0
+
+    def _band_histograms(self, img):
+        # Contrast needs the mean luma; cache the colour bands' histograms per source
+        if self._stats_image is not img:
+            histogram = img.histogram()
+            weights = colormatrix.LUMA if img.mode in ('RGB', 'RGBA') else (1.0,)
+            self._histograms = [(weight, histogram[band * 256:(band + 1) * 256])
+                                for band, weight in enumerate(weights)]
+            self._stats_image = img
+        return self._histograms
+
+    def lookup_table(self, img):
+        """256-entry table applying brightness then contrast to one band"""
+        factor = 1.0 + self.brightness / 100.0
+        lut = [_clip8(v * factor) for v in range(256)]
+        
+        if self.contrast != 0:
+            factor = 1.0 + self.contrast / 100.0
+            # Mean luma after brightness, from each band's histogram mapped
+            # through the table, so clipped channels count as clipped
+            histograms = self._band_histograms(img)
+            pixels = sum(histograms[0][1]) or 1
+            mean = int(sum(weight * count * lut[v] for weight, histogram in histograms
+                           for v, count in enumerate(histogram)) / pixels + 0.5)
+            lut = [_clip8(mean + factor * (v - mean)) for v in lut]
+        return lut
+
+    def saturation_matrix(self):
+        """ColorMatrix blending each channel with luma"""
+        return colormatrix.saturation(1.0 + self.saturation / 100.0)
+
+    def apply(self, img, progress=None, strip_rows=STRIP_ROWS):
+        """Return a new image with the adjustments applied.
+
+        With progress, the image is done strip by strip and progress(fraction)
+        is called between strips, so raising Cancelled from it stops the work.
+        """
+        if self.is_identity():
+            return img.copy()
+        if img.mode == 'P':
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        if img.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+            # Uncommon modes go through the separate enhancers
+            for adjust, value in ((adjust_brightness, self.brightness),
+                                  (adjust_contrast, self.contrast),
+                                  (adjust_saturation, self.saturation)):
+                if value != 0:
+                    img = adjust(img, value)
+            return img
+            
+        # The table and matrix come from the whole image, then apply to any part
+        lut = self.lookup_table(img)
+        identity = list(range(256))
+        table = [v for band in img.getbands() for v in (identity if band == 'A' else lut)]
+        matrix = None
+        if self.saturation != 0 and img.mode in ('RGB', 'RGBA'):
+            matrix = self.saturation_matrix()
+        if progress is None:
+            return self._apply_part(img, table, matrix)
+            
+        width, height = img.size
+        result = Image.new(img.mode, img.size)
+        result.info.update(img.info)
+        for top in range(0, height, strip_rows):
+            bottom = min(height, top + strip_rows)
+            strip = img.crop((0, top, width, bottom))
+            result.paste(self._apply_part(strip, table, matrix), (0, top))
+            progress(bottom / height)
+        return result
+
+    @staticmethod
+    def _apply_part(img, table, matrix):
+        result = img.point(table)
+        return result if matrix is None else matrix.apply(result)
+
+
+def adjust(img, brightness=0, contrast=0, saturation=0):
+    """Apply brightness, contrast and saturation together, as the sliders do"""
+    return Adjustments(brightness, contrast, saturation).apply(img)
+
+
+# Drawing
+def draw_line(img, points, color, width):
+    """Draw a polyline onto img in place and return it"""
+    ImageDraw.Draw(img).line(points, fill=color, width=width)
+    return img
+
+
+def draw(img, points, color, width):
+    """Return a copy of img with a polyline drawn on it"""
+    return draw_line(img.copy(), [tuple(p) for p in points], color, width)
+
+
+def line_bounds(points, width):
+    """Bounding box (x1, y1, x2, y2) touched by a polyline of the given width"""
+    pad = width // 2 + 2
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return (min(xs) - pad, min(ys) - pad, max(xs) + pad + 1, max(ys) + pad + 1)
+
+
+def clip_box(box, img_size):
+    """Clamp an (x1, y1, x2, y2) box to the image, or None if nothing is left"""
+    x1, y1 = max(0, box[0]), max(0, box[1])
+    x2, y2 = min(img_size[0], box[2]), min(img_size[1], box[3])
+    if x2 > x1 and y2 > y1:
+        return (x1, y1, x2, y2)
+    return None
+
+
+# Geometry shared by display, drawing and cropping
+def display_scale(img_size, canvas_size, zoom=1.0):
+    """Scale at which an image is shown on a canvas of the given size"""
+    img_width, img_height = img_size
+    canvas_width, canvas_height = canvas_size
+    scale_x = (canvas_width - DISPLAY_MARGIN) / img_width
+    scale_y = (canvas_height - DISPLAY_MARGIN) / img_height
+    # Don't upscale beyond 100% unless zoomed
+    return min(scale_x, scale_y, 1.0) * zoom
+
+
+def canvas_to_image(x, y, origin, scale):
+    """Convert canvas coordinates to image coordinates"""
+    return int((x - origin[0]) / scale), int((y - origin[1]) / scale)
+
+
+def canvas_rect_to_box(coords, img_size, origin, scale):
+    """Convert a canvas rectangle to a crop box clamped to the image, or None"""
+    x1, y1 = canvas_to_image(min(coords[0], coords[2]), min(coords[1], coords[3]),
+                             origin, scale)
+    x2, y2 = canvas_to_image(max(coords[0], coords[2]), max(coords[1], coords[3]),
+                             origin, scale)
+    return clip_box((x1, y1, x2, y2), img_size)
+
+
+# Operation registry, keyed by the names used in batch jobs and recipes
+OPERATIONS = {
+    'grayscale': grayscale,
+    'sepia': sepia,
+    'invert': invert,
+    'blur': blur,
+    'sharpen': sharpen,
+    'emboss': emboss,
+    'flip_horizontal': flip_horizontal,
+    'flip_vertical': flip_vertical,
+    'rotate_90': rotate_90,
+    'rotate_180': rotate_180,
+    'rotate_270': rotate_270,
+    'transpose': transpose,
+    'rotate': rotate,
+    'crop': crop,
+    'brightness': adjust_brightness,
+    'contrast': adjust_contrast,
+    'saturation': adjust_saturation,
+    'adjust': adjust,
+    'draw': draw,
+}
+
+# Registry names by operation
+OPERATION_NAMES = {operation: name for name, operation in OPERATIONS.items()}
+
+
+# Operations that accept a progress callback
+PROGRESS_OPERATIONS = {blur, sharpen, emboss}
+
+
+# Operations that are affine colour maps, as functions from args to a ColorMatrix
+COLOR_OPERATIONS = {
+    grayscale: lambda: colormatrix.GRAYSCALE,
+    sepia: lambda: colormatrix.SEPIA,
+    invert: lambda: colormatrix.INVERT,
+    adjust_saturation: lambda value: colormatrix.saturation(1.0 + value / 100.0),
+}
+
+
+def run_operation(operation, img, args=(), progress=None):
+    """Call operation on img, passing progress to operations that report it"""
+    if progress is not None and operation in PROGRESS_OPERATIONS:
+        return operation(img, *args, progress=progress)
+    return operation(img, *args)
+
+
+def apply_operation(img, name, *args, **kwargs):
+    """Apply a registered operation by name"""
+    try:
+        operation = OPERATIONS[name]
+    except KeyError:
+        raise ValueError(f"Unknown operation: {name}")
+    return operation(img, *args, **kwargs)
+
@@ -0,0 +1,144 @@
+"""Export presets for Ignora.
+
+One export writes the same image at several sizes and formats, e.g. a
+full-resolution TIFF master, a 2048px JPEG and a 512px web thumbnail. Sizes
+cascade: each smaller output is resized from the previous one rather than
+from the full image, so only the first resize touches every source pixel.
+Each output starts encoding on a thread as soon as its pixels exist, and
+Pillow's encoders release the GIL, so the export takes about as long as the
+slowest single encode.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import time
+
+import engine
+from lazy import LazyModule
+
+Image = LazyModule('PIL.Image')
+
+# Resize in two steps, a fast integer reduce then a filter, beyond this ratio
+REDUCING_GAP = 3.0
+
+
+class Preset:
+    """One output of an export: size limit, format and encoder settings"""
+
+    def __init__(self, name, max_size=None, extension='jpg', suffix='', settings=None):
+        self.name = name
+        self.max_size = max_size
+        self.extension = extension.lstrip('.').lower()
+        self.suffix = suffix
+        self.settings = dict(settings or {})
+
+    def output_path(self, folder, stem):
+        """File this preset writes for an image called stem"""
+        return os.path.join(folder, f"{stem}{self.suffix}.{self.extension}")
+
+    def size_for(self, size):
+        """Output size for a source of size; never larger than the source"""
+        width, height = size
+        if self.max_size is None or max(width, height) <= self.max_size:
+            return size
+        scale = self.max_size / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def to_dict(self):
+        """JSON-ready representation"""
+        return {'name': self.name, 'max_size': self.max_size, 'extension': self.extension,
+                'suffix': self.suffix, 'settings': self.settings}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a preset from to_dict() output"""
+        return cls(data['name'], data.get('max_size'), data.get('extension', 'jpg'),
+                   data.get('suffix', ''), data.get('settings'))
+
+
+DEFAULT_PRESETS = (
+    Preset("Full-size TIFF master", None, 'tiff', '', {'compression': 'tiff_lzw'}),
+    Preset("2048px JPEG", 2048, 'jpg', '_2048', {'quality': 90, 'subsampling': '4:2:0'}),
+    Preset("512px web thumbnail", 512, 'jpg', '_512',
+           {'quality': 80, 'subsampling': '4:2:0', 'optimize': True}),
+)
+
+
+def check_outputs_differ(presets):
+    """Raise ValueError if two presets would write the same file.
+
+    Their encodes run at once, so they would race on one .part file.
+    """
+    names = {}
+    for preset in presets:
+        # Case-folded, as on the case-insensitive filesystems of macOS and Windows
+        target = preset.output_path('', '').lower()
+        if target in names:
+            raise ValueError(f"Presets \"{names[target]}\" and \"{preset.name}\" "
+                             f"both write <name>{target}")
+        names[target] = preset.name
+
+
+def load_presets(path):
+    """Read a JSON list of presets written by save_presets()"""
+    with open(path) as f:
+        presets = [Preset.from_dict(data) for data in json.load(f)]
+    check_outputs_differ(presets)
+    return presets
+
+
+def save_presets(presets, path):
+    """Write presets to a JSON file"""
+    with open(path, 'w') as f:
+        json.dump([preset.to_dict() for preset in presets], f, indent=2)
+
+
+def existing_outputs(folder, stem, presets, source=None):
+    """Paths presets would overwrite, and whether one of them is source.
+
+    source is the file the image was opened from; writing over it loses
+    the original, so callers should ask before doing that.
+    """
+    existing = [path for path in (preset.output_path(folder, stem) for preset in presets)
+                if os.path.exists(path)]
+    overwrites_source = source is not None and os.path.exists(source) and any(
+        os.path.samefile(path, source) for path in existing)
+    return existing, overwrites_source
+
+
+def cascade(img, presets):
+    """(preset, image) pairs, largest first, each resized from the one before"""
+    ordered = sorted(presets, key=lambda preset: -max(preset.size_for(img.size)))
+    current = img
+    for preset in ordered:
+        size = preset.size_for(img.size)
+        if current.size != size:
+            current = current.resize(size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+        yield preset, current
+
+
+def export(img, folder, stem, presets, progress=None, workers=None):
+    """Write img once per preset into folder; returns {path: seconds to encode}.
+
+    Every output is written atomically with engine.save_image. The first
+    failure is raised once the other encodes have finished. Presets that
+    would write the same file raise ValueError before anything is written.
+    """
+    check_outputs_differ(presets)
+    def encode(image, path, settings):
+        started = time.perf_counter()
+        engine.save_image(image, path, **settings)
+        return time.perf_counter() - started
+
+    os.makedirs(folder, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers or len(presets) or 1) as pool:
+        futures = {}
+        for preset, image in cascade(img, presets):
+            path = preset.output_path(folder, stem)
+            futures[pool.submit(encode, image, path, preset.settings)] = path
+        timings = {}
+        for done, (future, path) in enumerate(futures.items(), 1):
+            timings[path] = future.result()
+            if progress is not None:
+                progress(done / len(futures))
+    return timings
@@ -0,0 +1,204 @@
+"""Folder filmstrip for the Ignora editor.
+
+A horizontal strip of thumbnails for every image in a folder. It is
+virtualised: only cells in or near view get canvas items and PhotoImages, so
+a folder of thousands of files costs no more than the handful on screen.
+Thumbnails come from a ThumbnailCache on a small pool of worker threads,
+cells in view first, then the rest of the folder in order to warm the cache.
+Finished thumbnails are picked up on the Tk thread by polling with
+root.after, as in workers.TaskRunner.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import tkinter as tk
+from tkinter import ttk
+
+import engine
+from lazy import LazyModule
+from thumbcache import THUMBNAIL_SIZE
+
+# Not needed until a folder is opened
+ImageTk = LazyModule('PIL.ImageTk')
+
+# Cell size around each thumbnail, in pixels
+CELL_WIDTH = THUMBNAIL_SIZE + 16
+CELL_HEIGHT = THUMBNAIL_SIZE + 28
+
+# Cells either side of the view that are drawn ahead of scrolling
+MARGIN_CELLS = 8
+
+# Thumbnails decoded at once; each worker keeps two queued
+THUMBNAIL_WORKERS = min(4, os.cpu_count() or 1)
+
+# How often the Tk thread collects finished thumbnails
+POLL_MS = 30
+
+
+class Filmstrip:
+    """Scrollable strip of thumbnails; clicking one calls on_open(path)"""
+
+    def __init__(self, parent, cache, on_open, workers=THUMBNAIL_WORKERS):
+        self.cache = cache
+        self.on_open = on_open
+        self.frame = tk.Frame(parent, bg='#34495e')
+        self.canvas = tk.Canvas(self.frame, height=CELL_HEIGHT, bg='#2c3e50',
+                                highlightthickness=0)
+        scrollbar = ttk.Scrollbar(self.frame, orient=tk.HORIZONTAL, command=self.scroll)
+        self.canvas.configure(xscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.canvas.pack(side=tk.TOP, fill=tk.X)
+
+        self.canvas.bind('<Button-1>', self.click)
+        self.canvas.bind('<Configure>', lambda e: self.refresh())
+        self.canvas.bind('<MouseWheel>', lambda e: self.scroll('scroll', -e.delta // 120, 'units'))
+        self.canvas.bind('<Button-4>', lambda e: self.scroll('scroll', -1, 'units'))
+        self.canvas.bind('<Button-5>', lambda e: self.scroll('scroll', 1, 'units'))
+
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.folder = None
+        self.paths = []
+        self.selected = None
+        self.cells = {}
+        self.thumbnails = {}
+        self.failed = set()
+        self.pending = {}
+        self.prefetch_from = 0
+        self.poll_id = None
+
+    def show_folder(self, folder):
+        """List the images in folder and start loading their thumbnails"""
+        for future in self.pending:
+            future.cancel()
+        self.pending = {}
+        for index in list(self.cells):
+            self._remove_cell(index)
+        self.folder = folder
+        self.paths = [path for path, _ in engine.find_images(folder)]
+        self.selected = None
+        self.thumbnails = {}
+        self.failed = set()
+        self.prefetch_from = 0
+        self.canvas.configure(scrollregion=(0, 0, len(self.paths) * CELL_WIDTH, CELL_HEIGHT))
+        self.canvas.xview_moveto(0)
+        self.refresh()
+
+    def select(self, path):
+        """Highlight the cell of path, if it's in the strip"""
+        index = self.paths.index(path) if path in self.paths else None
+        previous, self.selected = self.selected, index
+        for cell in (previous, index):
+            if cell in self.cells:
+                self._remove_cell(cell)
+        self.refresh()
+
+    def scroll(self, *args):
+        """Scroll the strip and draw the cells that come into view"""
+        self.canvas.xview(*args)
+        self.refresh()
+
+    def visible_range(self, margin=0):
+        """(first, last) indices of cells in view, widened by margin cells"""
+        left = self.canvas.canvasx(0)
+        first = int(left // CELL_WIDTH) - margin
+        last = int((left + self.canvas.winfo_width()) // CELL_WIDTH) + 1 + margin
+        return max(0, first), min(len(self.paths), last)
+
+    def refresh(self):
+        """Draw cells near the view, drop the rest, and queue missing thumbnails"""
+        first, last = self.visible_range(MARGIN_CELLS)
+        for index in list(self.cells):
+            if not first <= index < last:
+                self._remove_cell(index)
+        # Decoded thumbnails are kept a little further out, for scrolling back
+        keep_first, keep_last = self.visible_range(MARGIN_CELLS * 4)
+        for index in list(self.thumbnails):
+            if not keep_first <= index < keep_last:
+                del self.thumbnails[index]
+        for index in range(first, last):
+            if index not in self.cells:
+                self._draw_cell(index)
+        self._submit()
+
+    def _draw_cell(self, index):
+        x = index * CELL_WIDTH
+        selected = index == self.selected
+        items = [self.canvas.create_rectangle(x + 2, 2, x + CELL_WIDTH - 2, CELL_HEIGHT - 2,
+                                              fill='#3498db' if selected else '#34495e',
+                                              outline='')]
+        photo = None
+        centre = (x + CELL_WIDTH // 2, 8 + THUMBNAIL_SIZE // 2)
+        if index in self.thumbnails:
+            photo = ImageTk.PhotoImage(self.thumbnails[index])
+            items.append(self.canvas.create_image(*centre, image=photo))
+        else:
+            items.append(self.canvas.create_text(*centre, fill='#95a5a6',
+                                                 text='?' if index in self.failed else '...'))
+        name = os.path.basename(self.paths[index])
+        if len(name) > 22:
+            name = name[:10] + '...' + name[-9:]
+        items.append(self.canvas.create_text(x + CELL_WIDTH // 2, CELL_HEIGHT - 12,
+                                             text=name, fill='white', font=('Arial', 8)))
+        self.cells[index] = (items, photo)
+
+    def _remove_cell(self, index):
+        items, _ = self.cells.pop(index)
+        for item in items:
+            self.canvas.delete(item)
+
+    def _wanted(self):
+        """Indices whose thumbnails are needed, in the order to load them"""
+        view = range(*self.visible_range())
+        near = range(*self.visible_range(MARGIN_CELLS))
+        for index in list(view) + list(near):
+            if index not in self.thumbnails and index not in self.failed:
+                yield index, True
+        # Then warm the cache for the rest of the folder
+        while self.prefetch_from < len(self.paths):
+            if self.prefetch_from not in self.thumbnails:
+                yield self.prefetch_from, False
+            self.prefetch_from += 1
+
+    def _submit(self):
+        busy = {index for index, _ in self.pending.values()}
+        for index, show in self._wanted():
+            if len(self.pending) >= self.workers * 2:
+                break
+            if index in busy:
+                continue
+            future = self.executor.submit(self.cache.thumbnail, self.paths[index])
+            self.pending[future] = (index, show)
+            busy.add(index)
+        if self.pending and self.poll_id is None:
+            self.poll_id = self.canvas.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        self.poll_id = None
+        for future in [f for f in self.pending if f.done()]:
+            index, show = self.pending.pop(future)
+            near = range(*self.visible_range(MARGIN_CELLS))
+            if not show and index not in near:
+                continue
+            try:
+                self.thumbnails[index] = future.result()
+            except Exception:
+                self.failed.add(index)
+            if index in self.cells:
+                self._remove_cell(index)
+                self._draw_cell(index)
+        self._submit()
+        if not self.pending:
+            self.cache.flush()
+
+    def click(self, event):
+        """Open the image under the pointer"""
+        index = int(self.canvas.canvasx(event.x) // CELL_WIDTH)
+        if 0 <= index < len(self.paths):
+            self.on_open(self.paths[index])
+
+    def close(self):
+        """Stop loading thumbnails and save the cache index"""
+        for future in self.pending:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        self.cache.flush()
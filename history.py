@@ -0,0 +1,414 @@
+"""Undo/redo history for Ignora.
+
+Each history entry knows how to turn the current image into the neighbouring
+state and returns the entry that turns it back, so undoing an entry yields its
+redo entry and vice versa. Entries keep only what they need: nothing but the
+inverse operation for lossless transforms, a bounding-box patch for brush
+strokes, the discarded border for crops and a full frame only for operations
+that rewrite every pixel.
+
+Pixel data beyond the in-memory budget is spilled to a temporary directory
+and read back when the user steps that far; raw buffers are read straight into
+one preallocated buffer.
+"""
+from collections import deque
+import itertools
+import os
+import shutil
+import tempfile
+import weakref
+import zlib
+
+import engine
+from lazy import LazyModule
+
+Image = LazyModule('PIL.Image')
+colormatrix = LazyModule('colormatrix')
+
+# Default memory allowed for undo and redo entries together
+DEFAULT_BUDGET = 512 * 1024 * 1024
+
+# Default disk space for spilled entries; 0 disables spilling
+DEFAULT_DISK_BUDGET = 8 * 1024 * 1024 * 1024
+
+# Operations that are exactly undone by another operation
+INVERSES = {
+    engine.flip_horizontal: engine.flip_horizontal,
+    engine.flip_vertical: engine.flip_vertical,
+    engine.rotate_90: engine.rotate_270,
+    engine.rotate_180: engine.rotate_180,
+    engine.rotate_270: engine.rotate_90,
+    engine.transpose: engine.transpose,
+    engine.invert: engine.invert,
+}
+
+
+def image_nbytes(image):
+    """Approximate size of an image's pixel buffer"""
+    return image.width * image.height * len(image.getbands())
+
+
+class PixelData:
+    """Pixels of an image held as-is, zlib-compressed, or in a spill file"""
+
+    def __init__(self, image, compress=False):
+        self.mode = image.mode
+        self.size = image.size
+        self.palette = image.getpalette() if image.mode in ('P', 'PA') else None
+        self.info = dict(image.info)
+        self.path = None
+        self.disk_nbytes = 0
+        if compress:
+            self.data = zlib.compress(image.tobytes(), 1)
+            self.image = None
+            self.nbytes = len(self.data)
+        else:
+            self.data = None
+            self.image = image
+            self.nbytes = image_nbytes(image)
+
+    def to_image(self):
+        """Return the stored pixels as an image"""
+        if self.image is not None:
+            return self.image
+        if self.data is not None:
+            raw = zlib.decompress(self.data)
+        elif self.path.endswith('.zlib'):
+            with open(self.path, 'rb') as f:
+                raw = zlib.decompress(f.read())
+        else:
+            # Read in place, so the only other copy is the image's own
+            raw = bytearray(self.disk_nbytes)
+            with open(self.path, 'rb') as f:
+                if f.readinto(raw) != len(raw):
+                    raise OSError(f"Spilled history file is truncated: {self.path}")
+        image = Image.frombytes(self.mode, self.size, raw)
+        if self.palette is not None:
+            image.putpalette(self.palette)
+        image.info.update(self.info)
+        return image
+
+    def spill(self, path):
+        """Move the pixels to a file next to path and free the memory.
+
+        If the file can't be written the pixels stay in memory and the
+        OSError is raised.
+        """
+        if self.path is not None:
+            return
+        if self.data is not None:
+            target = path + '.zlib'
+            payload = self.data
+        else:
+            target = path + '.raw'
+            payload = self.image.tobytes()
+        try:
+            with open(target, 'wb') as f:
+                f.write(payload)
+        except OSError:
+            try:
+                os.remove(target)
+            except OSError:
+                pass
+            raise
+        self.path = target
+        self.disk_nbytes = len(payload)
+        self.nbytes = 0
+        self.image = None
+        self.data = None
+
+    def discard(self):
+        """Delete the spill file, if any"""
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+            self.disk_nbytes = 0
+
+
+class Entry:
+    """History entry that stores no pixels"""
+
+    nbytes = 0
+    disk_nbytes = 0
+
+    def apply(self, image):
+        """Return (new image, reverse entry, changed box or None)"""
+        raise NotImplementedError
+
+    def spill(self, path):
+        """Move stored pixels to disk"""
+
+    def discard(self):
+        """Release any resources held by the entry"""
+
+
+class PixelEntry(Entry):
+    """History entry backed by a PixelData"""
+
+    def __init__(self, image, compress=False):
+        self.pixels = PixelData(image, compress)
+        self.compress = compress
+
+    @property
+    def nbytes(self):
+        return self.pixels.nbytes
+
+    @property
+    def disk_nbytes(self):
+        return self.pixels.disk_nbytes
+
+    def spill(self, path):
+        self.pixels.spill(path)
+
+    def discard(self):
+        self.pixels.discard()
+
+
+class InverseEntry(Entry):
+    """Lossless operation undone by applying its inverse; stores no pixels"""
+
+    def __init__(self, operation, reverse_operation):
+        self.operation = operation
+        self.reverse_operation = reverse_operation
+
+    def apply(self, image):
+        """Apply the operation and return the entry for its inverse"""
+        return (self.operation(image),
+                InverseEntry(self.reverse_operation, self.operation), None)
+
+
+class FrameEntry(PixelEntry):
+    """Whole image, for operations whose effect can't be described cheaply"""
+
+    def apply(self, image):
+        """Swap the stored frame with the current image"""
+        return self.pixels.to_image(), FrameEntry(image, self.compress), None
+
+
+class PatchEntry(PixelEntry):
+    """Pixels of a box that was changed in place, e.g. by a brush stroke"""
+
+    def __init__(self, box, patch, compress=False):
+        super().__init__(patch, compress)
+        self.box = box
+
+    def apply(self, image):
+        """Swap the stored patch with the pixels currently in the box"""
+        reverse = PatchEntry(self.box, image.crop(self.box), self.compress)
+        image.paste(self.pixels.to_image(), self.box[:2])
+        return image, reverse, self.box
+
+
+class UncropEntry(Entry):
+    """Restores the border removed by a crop.
+
+    Only the strips outside the crop box are kept, up to four of them; the
+    inside is the cropped image itself.
+    """
+
+    def __init__(self, image, box, compress=False):
+        self.size = image.size
+        self.box = box
+        self.compress = compress
+        width, height = image.size
+        left, top, right, bottom = box
+        self.strips = []
+        for strip in ((0, 0, width, top), (0, bottom, width, height),
+                      (0, top, left, bottom), (right, top, width, bottom)):
+            if strip[2] > strip[0] and strip[3] > strip[1]:
+                self.strips.append((strip[:2], PixelData(image.crop(strip), compress)))
+
+    @property
+    def nbytes(self):
+        return sum(pixels.nbytes for _, pixels in self.strips)
+
+    @property
+    def disk_nbytes(self):
+        return sum(pixels.disk_nbytes for _, pixels in self.strips)
+
+    def spill(self, path):
+        for i, (_, pixels) in enumerate(self.strips):
+            pixels.spill(f"{path}-{i}")
+
+    def discard(self):
+        for _, pixels in self.strips:
+            pixels.discard()
+
+    def apply(self, image):
+        """Paste the cropped image back into its border"""
+        restored = Image.new(image.mode, self.size)
+        if image.mode in ('P', 'PA'):
+            restored.putpalette(image.getpalette())
+        restored.info.update(image.info)
+        for offset, pixels in self.strips:
+            restored.paste(pixels.to_image(), offset)
+        restored.paste(image, self.box[:2])
+        return restored, RecropEntry(self.box, self.compress), None
+
+
+class RecropEntry(Entry):
+    """Repeats a crop; the result is recomputed so nothing is stored"""
+
+    def __init__(self, box, compress=False):
+        self.box = box
+        self.compress = compress
+
+    def apply(self, image):
+        """Crop the image again"""
+        return (engine.crop(image, self.box),
+                UncropEntry(image, self.box, self.compress), None)
+
+
+class History:
+    """Undo and redo stacks bounded by byte budgets rather than a step count.
+
+    Entries furthest from the current state are spilled to disk once the
+    in-memory budget is exceeded, and the oldest undo entries are dropped once
+    the disk budget is exceeded too. The most recent undo step is always kept.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET, compress=False,
+                 disk_budget=DEFAULT_DISK_BUDGET, spill_dir=None):
+        self.budget = budget
+        self.compress = compress
+        self.disk_budget = disk_budget
+        self.spill_dir = spill_dir
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self._spill_names = itertools.count()
+        self._cleanup = None
+
+    @property
+    def nbytes(self):
+        """Memory currently held by both stacks"""
+        return sum(entry.nbytes for entry in self._entries())
+
+    @property
+    def disk_nbytes(self):
+        """Disk space currently used by spilled entries"""
+        return sum(entry.disk_nbytes for entry in self._entries())
+
+    def _entries(self):
+        return itertools.chain(self.undo_stack, self.redo_stack)
+
+    def clear(self):
+        """Forget all history"""
+        for entry in self._entries():
+            entry.discard()
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def close(self):
+        """Forget all history and remove the spill directory"""
+        self.clear()
+        if self._cleanup is not None:
+            self._cleanup()
+            self._cleanup = None
+
+    def can_undo(self):
+        """Whether there is a step to undo"""
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        """Whether there is a step to redo"""
+        return bool(self.redo_stack)
+
+    def record(self, operation, args, before):
+        """Record that operation(before, *args) produced the current image"""
+        if operation in INVERSES and (operation is not engine.invert
+                                      or before.mode in colormatrix.MODES):
+            self.push(InverseEntry(INVERSES[operation], operation))
+        elif operation is engine.crop:
+            self.push(UncropEntry(before, tuple(args[0]), self.compress))
+        else:
+            self.record_frame(before)
+
+    def record_pipeline(self, pipeline, before):
+        """Record that a fused pipeline.apply(before) produced the current image"""
+        inverse = pipeline.inverse(before.mode)
+        if inverse is None:
+            self.record_frame(before)
+        else:
+            self.push(InverseEntry(inverse.apply, pipeline.apply))
+
+    def record_frame(self, before):
+        """Record an arbitrary change, keeping the whole previous image"""
+        self.push(FrameEntry(before, self.compress))
+
+    def record_patch(self, box, patch):
+        """Record an in-place edit, given the box's pixels from before it"""
+        self.push(PatchEntry(box, patch, self.compress))
+
+    def drop_last(self):
+        """Forget the newest undo entry, for an edit that never landed"""
+        if self.undo_stack:
+            self.undo_stack.pop().discard()
+
+    def push(self, entry):
+        """Add an undo entry, dropping redo history and enforcing the budget"""
+        self.undo_stack.append(entry)
+        for redo_entry in self.redo_stack:
+            redo_entry.discard()
+        self.redo_stack.clear()
+        self.trim()
+
+    def trim(self):
+        """Spill, then drop, the entries furthest from the current state"""
+        total = self.nbytes
+        spill_failed = False
+        if total > self.budget and self.disk_budget > 0:
+            # Both stacks grow away from the current state towards the left;
+            # the newest undo entry stays in memory
+            candidates = itertools.chain(
+                itertools.islice(self.undo_stack, 0, max(0, len(self.undo_stack) - 1)),
+                self.redo_stack)
+            for entry in list(candidates):
+                if total <= self.budget:
+                    break
+                if entry.nbytes:
+                    nbytes = entry.nbytes
+                    try:
+                        entry.spill(self._spill_path())
+                    except OSError:
+                        # Disk full or not writable: drop old entries instead
+                        spill_failed = True
+                        break
+                    total -= nbytes - entry.nbytes
+
+        # Without spilling, entries over the memory budget are simply dropped
+        disk_total = self.disk_nbytes
+        while (len(self.undo_stack) > 1
+               and (disk_total > self.disk_budget
+                    or (total > self.budget and (self.disk_budget <= 0 or spill_failed)))):
+            entry = self.undo_stack.popleft()
+            total -= entry.nbytes
+            disk_total -= entry.disk_nbytes
+            entry.discard()
+
+    def _spill_path(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='ignora-history-')
+            self._cleanup = weakref.finalize(self, shutil.rmtree, self.spill_dir,
+                                             ignore_errors=True)
+        return os.path.join(self.spill_dir, str(next(self._spill_names)))
+
+    def undo(self, image):
+        """Step back from image; returns (image, changed box or None)"""
+        entry = self.undo_stack.pop()
+        image, reverse, box = entry.apply(image)
+        entry.discard()
+        self.redo_stack.append(reverse)
+        self.trim()
+        return image, box
+
+    def redo(self, image):
+        """Step forward from image; returns (image, changed box or None)"""
+        entry = self.redo_stack.pop()
+        image, reverse, box = entry.apply(image)
+        entry.discard()
+        self.undo_stack.append(reverse)
+        self.trim()
+        return image, box
@@ -0,0 +1,165 @@
+"""Event-to-paint latency and main-loop stall monitoring for the Ignora editor.
+
+Opt-in. When enabled, input handlers call begin() with their Tk event; the
+sample ends once Tk has been through the idle passes the handler's work
+takes: deferred work like a stroke flush runs in one, and the canvas redraw
+it causes in the next. So it covers handling plus repainting. Where
+the event carries an X server timestamp, the time the event sat in the queue
+is added; the two clocks are aligned on the quickest event seen so far.
+
+A heartbeat scheduled with after() notices when the main loop fails to run
+it on time, and records the overrun as a stall. Samples are kept per kind
+of event and reported as p50/p95/p99 with a bucketed histogram.
+"""
+from collections import deque
+import math
+import time
+
+import tracing
+
+# Samples kept per kind of event
+MAX_SAMPLES = 5000
+
+# Heartbeat interval, and how late a beat must be to count as a stall
+HEARTBEAT_MS = 20
+STALL_MS = 100
+
+# Idle passes a sample waits for: deferred handler work, redraw, then the end
+PAINT_PASSES = 3
+
+# Upper edges of the histogram buckets, in milliseconds
+BUCKETS_MS = (8, 16, 33, 50, 100, 250, 500, 1000)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    # The smallest value with at least fraction of the samples at or below it;
+    # rounding first keeps e.g. 0.07 * 100 from ranking as 8
+    rank = math.ceil(round(fraction * len(ordered), 9))
+    return ordered[min(len(ordered), max(1, rank)) - 1]
+
+
+class LatencyMonitor:
+    """Event-to-paint samples and heartbeat stalls for one Tk root"""
+
+    def __init__(self, root, heartbeat_ms=HEARTBEAT_MS, stall_ms=STALL_MS):
+        self.root = root
+        self.heartbeat_ms = heartbeat_ms
+        self.stall_ms = stall_ms
+        self.enabled = False
+        self.samples = {}
+        self.stalls = deque(maxlen=MAX_SAMPLES)
+        self.clock_offset = None
+        self.beat_id = None
+        self.expected = None
+        self.started = None
+
+    def start(self):
+        """Begin collecting samples and watching for stalls"""
+        if self.enabled:
+            return
+        self.enabled = True
+        self.started = time.perf_counter()
+        self._schedule_beat()
+
+    def stop(self):
+        """Stop collecting; samples so far are kept for the report"""
+        self.enabled = False
+        if self.beat_id is not None:
+            self.root.after_cancel(self.beat_id)
+            self.beat_id = None
+
+    def reset(self):
+        """Forget every sample and stall"""
+        self.samples.clear()
+        self.stalls.clear()
+        self.started = time.perf_counter() if self.enabled else None
+
+    def _schedule_beat(self):
+        self.expected = time.perf_counter() + self.heartbeat_ms / 1000
+        self.beat_id = self.root.after(self.heartbeat_ms, self._beat)
+
+    def _beat(self):
+        late = time.perf_counter() - self.expected
+        if late * 1000 >= self.stall_ms:
+            self.stalls.append(late)
+            tracing.tracer.add('main loop stall', 'latency', self.expected, late)
+        self._schedule_beat()
+
+    def begin(self, kind, event=None):
+        """Start a sample for an input event of the given kind"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        queued = 0.0
+        event_time = getattr(event, 'time', None)
+        if isinstance(event_time, int) and event_time > 0:
+            # X server milliseconds and perf_counter differ by an unknown
+            # offset; the smallest difference seen is taken as no delay
+            difference = now * 1000 - event_time
+            if self.clock_offset is None or difference < self.clock_offset:
+                self.clock_offset = difference
+            queued = (difference - self.clock_offset) / 1000
+        self._after_passes(PAINT_PASSES, kind, now - queued)
+
+    def _after_passes(self, passes, kind, start):
+        # An idle callback added from an idle callback waits for the next
+        # idle pass, so each hop lets Tk's own idle work (redraws) run first
+        if passes:
+            self.root.after_idle(self._after_passes, passes - 1, kind, start)
+        else:
+            self._end(kind, start)
+
+    def _end(self, kind, start):
+        duration = time.perf_counter() - start
+        self.samples.setdefault(kind, deque(maxlen=MAX_SAMPLES)).append(duration)
+        tracing.tracer.add(f'{kind} latency', 'latency', start, duration)
+
+    def summary(self, kind):
+        """Count, p50, p95, p99 and max in milliseconds for one kind of event"""
+        ordered = sorted(self.samples.get(kind, ()))
+        if not ordered:
+            return None
+        return {'count': len(ordered),
+                'p50': percentile(ordered, 0.50) * 1000,
+                'p95': percentile(ordered, 0.95) * 1000,
+                'p99': percentile(ordered, 0.99) * 1000,
+                'max': ordered[-1] * 1000}
+
+    def histogram(self, kind):
+        """(label, count) buckets of one kind's latencies"""
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        for duration in self.samples.get(kind, ()):
+            milliseconds = duration * 1000
+            bucket = next((i for i, edge in enumerate(BUCKETS_MS) if milliseconds < edge),
+                          len(BUCKETS_MS))
+            counts[bucket] += 1
+        labels = [f"<{edge} ms" for edge in BUCKETS_MS] + [f">={BUCKETS_MS[-1]} ms"]
+        return list(zip(labels, counts))
+
+    def report(self):
+        """Multi-line text report of every kind of event and the stalls"""
+        lines = []
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        lines.append(f"Event-to-paint latency over {elapsed:.0f} s"
+                     + ("" if self.enabled else " (monitor stopped)"))
+        if not self.samples:
+            lines.append("  no input events yet")
+        for kind in sorted(self.samples):
+            stats = self.summary(kind)
+            lines.append(f"  {kind:<10} n={stats['count']:<6} p50 {stats['p50']:6.1f} ms"
+                         f"  p95 {stats['p95']:6.1f} ms  p99 {stats['p99']:6.1f} ms"
+                         f"  max {stats['max']:6.1f} ms")
+            total = stats['count']
+            for label, count in self.histogram(kind):
+                if count:
+                    lines.append(f"      {label:>9} {count:6} {'#' * max(1, 40 * count // total)}")
+        stalls = sorted(self.stalls)
+        if stalls:
+            lines.append(f"Main-loop stalls of {self.stall_ms} ms or more: {len(stalls)}"
+                         f"  p50 {percentile(stalls, 0.5) * 1000:.0f} ms"
+                         f"  p99 {percentile(stalls, 0.99) * 1000:.0f} ms"
+                         f"  max {stalls[-1] * 1000:.0f} ms")
+        else:
+            lines.append(f"No main-loop stalls of {self.stall_ms} ms or more")
+        return "\n".join(lines)
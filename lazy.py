@@ -0,0 +1,30 @@
+"""Deferred imports for a quick start-up.
+
+NumPy and the Pillow modules behind the editor's operations take longer to
+import than building the whole window, and none of them are needed until
+the first image is opened. A module that uses one binds a LazyModule in its
+place, which imports the real module the first time one of its attributes
+is used. Imports go through importlib, so that first use is safe from any
+thread.
+
+    colormatrix = LazyModule('colormatrix')
+"""
+import importlib
+
+
+class LazyModule:
+    """Stands in for a module until one of its attributes is first used"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        # Only called for attributes the stand-in doesn't have itself
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module {self._name!r} ({state})>"
@@ -1,40 +1,121 @@
+import time
+
+# When the process reached this module, for --measure-startup
+STARTUP_STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, colorchooser
 import os
-from PIL import Image, ImageTk, ImageFilter, ImageEnhance, ImageOps, ImageDraw
-from collections import deque
-import numpy as np
+import sys
+import engine
+import export
+from display import DisplayPyramid, TiledCanvasRenderer
+from filmstrip import Filmstrip
+from history import History, DEFAULT_BUDGET
+from latency import LatencyMonitor
+from lazy import LazyModule
+from workers import TaskRunner
+from recipe import Recipe, RecipeRecorder, step
+import sessions
+import tracing
+from thumbcache import ThumbnailCache
+
+# Deferred until the first operation that needs them
+Image = LazyModule('PIL.Image')
+pipeline = LazyModule('pipeline')
+
+# Size of the window when it opens
+WINDOW_SIZE = (1200, 800)
+
+# Launch to interactive window, the budget --measure-startup checks
+STARTUP_TARGET_MS = 300
+
+# Heavy modules start-up should leave for later, named in the start-up report
+DEFERRED_MODULES = ('numpy', 'PIL.Image', 'PIL.ImageTk', 'PIL.ImageDraw', 'PIL.ImageEnhance',
+                    'colormatrix', 'parallel', 'pipeline', 'batch')
+
+# Slider idle time before the full-resolution adjustment is computed
+ADJUST_DEBOUNCE_MS = 250
+
+# How often an open performance panel picks up new spans
+PANEL_REFRESH_MS = 500
 
 class ImageEditor:
-    def __init__(self):
+    def __init__(self, history_budget=DEFAULT_BUDGET, session_budget=sessions.DEFAULT_BUDGET):
+        self.startup_marks = [('modules imported', time.perf_counter())]
+        self.measure_startup = False
         self.root = tk.Tk()
         self.root.title("Ignora Pro - Image Editor")
-        self.root.geometry("1200x800")
         self.root.configure(bg='#2c3e50')
+        self.mark_startup('Tk started')
         
         # Variables
+        self.image_version = 0
+        self.pyramid = DisplayPyramid()
+        self.renderer = None
+        self.render_pending = False
         self.current_image = None
         self.original_image = None
-        self.display_image = None
         self.image_path = None
-        self.undo_stack = deque(maxlen=20)
-        self.redo_stack = deque(maxlen=20)
+        self.image_stamp = None
+        self.history_budget = history_budget
+        self.history = History(history_budget)
+        self.recorder = RecipeRecorder()
+        self.sessions = sessions.SessionCache(session_budget)
+        self.adjustments = engine.Adjustments()
+        self.adjust_base = None
+        self.adjust_proxy = None
+        self.adjust_after_id = None
+        self.adjust_job = None
+        self.adjust_running = None
+        self.adjust_step = None
+        self.adjust_waiting = []
+        self.sliders = {}
+        self.tasks = TaskRunner(self.root)
+        self.latency = LatencyMonitor(self.root)
+        self.task = None
+        self.queued = None
+        self.queued_message = None
+        self.save_job = None
+        self.saving_image = None
+        self.save_settings = dict(engine.DEFAULT_SAVE_SETTINGS)
+        self.export_presets = list(export.DEFAULT_PRESETS)
+        self.status_after_id = None
         self.zoom_factor = 1.0
         self.drawing_mode = False
         self.draw_color = '#000000'
         self.brush_size = 5
-        self.last_x = None
-        self.last_y = None
+        self.stroke_points = []
+        self.stroke_drawn = 0
+        self.stroke_flush_pending = False
+        self.panels_built = False
         
-        # Create UI
+        # Create UI; the side panels follow once the window is on screen
         self.create_ui()
         self.center_window()
+        self.mark_startup('window built')
+        
+    @property
+    def current_image(self):
+        """The image being edited"""
+        return self._current_image
+        
+    @current_image.setter
+    def current_image(self, image):
+        # Every replacement is a new version so display caches know to rebuild
+        self._current_image = image
+        self.image_version += 1
+        
+    def mark_region_dirty(self, box):
+        """Record an in-place edit of the current image inside box"""
+        self.image_version += 1
+        self.pyramid.invalidate(box, self.image_version)
+        self.renderer.refresh_region(box)
         
     def center_window(self):
         """Center the window on screen"""
-        self.root.update_idletasks()
-        width = self.root.winfo_width()
-        height = self.root.winfo_height()
+        # The size is fixed up front, so nothing has to be laid out to know it
+        width, height = WINDOW_SIZE
         x = (self.root.winfo_screenwidth() // 2) - (width // 2)
         y = (self.root.winfo_screenheight() // 2) - (height // 2)
         self.root.geometry(f'{width}x{height}+{x}+{y}')
@@ -42,36 +123,100 @@ class ImageEditor:
     def create_ui(self):
         """Create the main user interface"""
         # Main container
-        main_frame = tk.Frame(self.root, bg='#2c3e50')
-        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.main_frame = tk.Frame(self.root, bg='#2c3e50')
+        self.main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         # Top toolbar
-        self.create_toolbar(main_frame)
+        self.create_toolbar(self.main_frame)
         
         # Content area
-        content_frame = tk.Frame(main_frame, bg='#2c3e50')
-        content_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        self.content_frame = tk.Frame(self.main_frame, bg='#2c3e50')
+        self.content_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
         
-        # Left panel (tools)
-        self.create_left_panel(content_frame)
+        # Center (canvas); the tool and property panels are added by create_panels
+        self.create_canvas_area(self.content_frame)
         
-        # Center (canvas)
-        self.create_canvas_area(content_frame)
+        # Status bar
+        self.create_status_bar(self.main_frame)
         
-        # Right panel (properties)
-        self.create_right_panel(content_frame)
+        # Folder filmstrip, created once a folder is opened
+        self.filmstrip = None
         
-        # Status bar
-        self.create_status_bar(main_frame)
+        # The first time the canvas is drawn, the window is on screen
+        self.canvas.bind('<Expose>', self.window_shown)
         
         # Bind keyboard shortcuts
         self.root.bind('<Control-o>', lambda e: self.open_image())
+        self.root.bind('<Control-Shift-O>', lambda e: self.open_folder())
         self.root.bind('<Control-s>', lambda e: self.save_image())
+        self.root.bind('<Control-e>', lambda e: self.export_image())
         self.root.bind('<Control-z>', lambda e: self.undo())
         self.root.bind('<Control-y>', lambda e: self.redo())
         self.root.bind('<Control-plus>', lambda e: self.zoom_in())
         self.root.bind('<Control-minus>', lambda e: self.zoom_out())
         
+    def window_shown(self, event):
+        """Finish starting up once the window has first been drawn"""
+        self.canvas.unbind('<Expose>')
+        # The canvas redraw was queued by this event, so it idles first
+        self.root.after_idle(self.finish_startup)
+        
+    def finish_startup(self):
+        """Build the side panels, then note when the window became interactive"""
+        self.mark_startup('window shown')
+        self.create_panels()
+        self.mark_startup('panels built')
+        # Idle passes for the panels' layout, their redraw, and then the mark
+        self.root.after_idle(self.root.after_idle, self.root.after_idle, self.startup_done)
+        
+    def startup_done(self):
+        """Record the start-up time; with --measure-startup, report it and quit"""
+        self.mark_startup('interactive')
+        tracing.tracer.add('start-up', 'ui', STARTUP_STARTED, self.startup_seconds())
+        if self.measure_startup:
+            self.root.quit()
+            
+    def mark_startup(self, label):
+        """Note that start-up reached label"""
+        self.startup_marks.append((label, time.perf_counter()))
+        
+    def startup_seconds(self, label='interactive'):
+        """Seconds from launch to label, or None if it wasn't reached"""
+        for name, when in self.startup_marks:
+            if name == label:
+                return when - STARTUP_STARTED
+        return None
+        
+    def startup_report(self):
+        """Time of each start-up stage as text"""
+        lines = ["Start-up, from loading main.py (interpreter start not included):"]
+        previous = STARTUP_STARTED
+        for label, when in self.startup_marks:
+            lines.append(f"  {label:<18} {(when - STARTUP_STARTED) * 1000:7.1f} ms"
+                         f"  (+{(when - previous) * 1000:.1f})")
+            previous = when
+        total = self.startup_seconds()
+        if total is not None:
+            verdict = "met" if total * 1000 <= STARTUP_TARGET_MS else "MISSED"
+            lines.append(f"Target {STARTUP_TARGET_MS} ms to an interactive window: {verdict}")
+        loaded = [name for name in DEFERRED_MODULES if name in sys.modules]
+        deferred = [name for name in DEFERRED_MODULES if name not in sys.modules]
+        lines.append(f"Deferred: {', '.join(deferred) or 'none'}")
+        if loaded:
+            lines.append(f"Loaded during start-up: {', '.join(loaded)}")
+        return "\n".join(lines)
+        
+    def create_panels(self):
+        """Build the tool and property panels on either side of the canvas"""
+        if self.panels_built:
+            return
+        self.panels_built = True
+        with tracing.span('build panels', 'ui'):
+            # Packed before the canvas so they keep their width when it expands
+            self.create_left_panel(self.content_frame, before=self.canvas.master)
+            self.create_right_panel(self.content_frame, before=self.canvas.master)
+        self.update_image_info()
+        
     def create_toolbar(self, parent):
         """Create the top toolbar"""
         toolbar = tk.Frame(parent, bg='#34495e', height=60)
@@ -92,6 +237,7 @@ class ImageEditor:
         
         self.create_button(edit_frame, "↶ Undo", self.undo, "#e67e22")
         self.create_button(edit_frame, "↷ Redo", self.redo, "#e67e22")
+        self.create_button(edit_frame, "✖ Cancel", self.cancel_task, "#e74c3c")
         
         # Zoom controls
         zoom_frame = tk.Frame(toolbar, bg='#34495e')
@@ -125,10 +271,10 @@ class ImageEditor:
         rgb = tuple(min(255, int(c * 1.2)) for c in rgb)
         return f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
         
-    def create_left_panel(self, parent):
+    def create_left_panel(self, parent, before=None):
         """Create the left tool panel"""
         left_panel = tk.Frame(parent, bg='#34495e', width=200)
-        left_panel.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
+        left_panel.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10), before=before)
         left_panel.pack_propagate(False)
         
         # Create scrollable frame for tools
@@ -216,8 +362,8 @@ class ImageEditor:
         self.canvas = tk.Canvas(canvas_frame, bg='white', cursor='crosshair')
         
         # Scrollbars
-        v_scrollbar = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.canvas.yview)
-        h_scrollbar = ttk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        v_scrollbar = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.scroll_y)
+        h_scrollbar = ttk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL, command=self.scroll_x)
         
         self.canvas.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
         
@@ -231,10 +377,39 @@ class ImageEditor:
         self.canvas.bind('<B1-Motion>', self.draw)
         self.canvas.bind('<ButtonRelease-1>', self.end_draw)
         
-    def create_right_panel(self, parent):
+        # Panning with the middle button and the mouse wheel
+        self.canvas.bind('<ButtonPress-2>', lambda e: self.canvas.scan_mark(e.x, e.y))
+        self.canvas.bind('<B2-Motion>', self.pan)
+        self.canvas.bind('<MouseWheel>', lambda e: self.scroll_y('scroll', -e.delta // 120, 'units'))
+        self.canvas.bind('<Shift-MouseWheel>', lambda e: self.scroll_x('scroll', -e.delta // 120, 'units'))
+        self.canvas.bind('<Button-4>', lambda e: self.scroll_y('scroll', -1, 'units'))
+        self.canvas.bind('<Button-5>', lambda e: self.scroll_y('scroll', 1, 'units'))
+        self.canvas.bind('<Configure>', lambda e: self.display_image_on_canvas())
+        
+        self.renderer = TiledCanvasRenderer(self.canvas, self.pyramid)
+        
+    def scroll_x(self, *args):
+        """Scroll the canvas horizontally and load newly visible tiles"""
+        self.latency.begin('scroll')
+        self.canvas.xview(*args)
+        self.schedule_render()
+        
+    def scroll_y(self, *args):
+        """Scroll the canvas vertically and load newly visible tiles"""
+        self.latency.begin('scroll')
+        self.canvas.yview(*args)
+        self.schedule_render()
+        
+    def pan(self, event):
+        """Drag the view with the middle mouse button"""
+        self.latency.begin('pan', event)
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.schedule_render()
+        
+    def create_right_panel(self, parent, before=None):
         """Create the right properties panel"""
         right_panel = tk.Frame(parent, bg='#34495e', width=250)
-        right_panel.pack(side=tk.RIGHT, fill=tk.Y, padx=(10, 0))
+        right_panel.pack(side=tk.RIGHT, fill=tk.Y, padx=(10, 0), before=before)
         right_panel.pack_propagate(False)
         
         # Properties section
@@ -264,13 +439,16 @@ class ImageEditor:
         adj_label.pack(pady=10)
         
         # Brightness
-        self.create_slider(right_panel, "Brightness", -100, 100, 0, self.adjust_brightness)
+        self.sliders['brightness'] = self.create_slider(
+            right_panel, "Brightness", -100, 100, 0, self.adjust_brightness)
         
         # Contrast
-        self.create_slider(right_panel, "Contrast", -100, 100, 0, self.adjust_contrast)
+        self.sliders['contrast'] = self.create_slider(
+            right_panel, "Contrast", -100, 100, 0, self.adjust_contrast)
         
         # Saturation
-        self.create_slider(right_panel, "Saturation", -100, 100, 0, self.adjust_saturation)
+        self.sliders['saturation'] = self.create_slider(
+            right_panel, "Saturation", -100, 100, 0, self.adjust_saturation)
         
         # Drawing tools
         draw_label = tk.Label(right_panel, text="✏️ DRAWING", bg='#34495e', 
@@ -320,10 +498,39 @@ class ImageEditor:
     def update_status(self, message):
         """Update status bar message"""
         self.status_bar.config(text=message)
-        self.root.after(3000, lambda: self.status_bar.config(text="Ready"))
+        if self.status_after_id is not None:
+            self.root.after_cancel(self.status_after_id)
+        self.status_after_id = self.root.after(3000, lambda: self.status_bar.config(text="Ready"))
+        
+    def show_progress(self, task):
+        """Show a running task's progress in the status bar"""
+        if task.fraction is None:
+            progress = f"{task.elapsed():.1f}s"
+        else:
+            progress = f"{task.fraction:.0%}, {task.elapsed():.1f}s"
+        self.status_bar.config(text=f"{task.description}... ({progress}) - press Cancel to stop")
+        
+    def is_busy(self):
+        """Whether a background edit is running; tells the user if so"""
+        if self.task is not None:
+            self.update_status(f"Please wait: {self.task.description} is still running")
+            return True
+        if self.adjust_waiting:
+            self.update_status("Please wait: Applying adjustments is still running")
+            return True
+        return False
+        
+    def cancel_task(self):
+        """Cancel the running background edit"""
+        if self.task is not None:
+            self.task.cancel()
+            self.status_bar.config(text=f"Cancelling {self.task.description}...")
         
     def open_image(self):
         """Open an image file"""
+        if self.is_busy():
+            return
+            
         file_path = filedialog.askopenfilename(
             title="Open Image",
             filetypes=[
@@ -335,38 +542,184 @@ class ImageEditor:
         )
         
         if file_path:
-            try:
-                self.original_image = Image.open(file_path)
-                self.current_image = self.original_image.copy()
-                self.image_path = file_path
-                
-                # Clear undo/redo stacks
-                self.undo_stack.clear()
-                self.redo_stack.clear()
-                self.save_state()
-                
-                self.display_image_on_canvas()
-                self.update_image_info()
-                self.update_status(f"Opened: {os.path.basename(file_path)}")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not open image: {str(e)}")
-                
+            self.load_image(file_path)
+            
+    def open_folder(self):
+        """Browse a folder of images in the filmstrip"""
+        folder = filedialog.askdirectory(title="Open Folder")
+        if not folder:
+            return
+            
+        if self.filmstrip is None:
+            self.filmstrip = Filmstrip(self.main_frame, ThumbnailCache(), self.open_from_filmstrip)
+        # Above the status bar, below the canvas
+        self.filmstrip.frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(10, 0), after=self.status_bar)
+        self.filmstrip.show_folder(folder)
+        self.update_status(f"{len(self.filmstrip.paths)} image(s) in {os.path.basename(folder)}")
+        
+    def open_from_filmstrip(self, file_path):
+        """Open an image clicked in the filmstrip"""
+        if file_path == self.image_path or self.is_busy():
+            return
+        self.filmstrip.select(file_path)
+        self.load_image(file_path)
+        
+    def load_image(self, file_path):
+        """Show a quick reduced decode, then swap in the full decode from a worker"""
+        if self.adjust_base is not None:
+            # The slider session is part of the file being left
+            self.commit_adjustments(lambda: self.load_image(file_path))
+            return
+            
+        name = os.path.basename(file_path)
+        started = time.perf_counter()
+        session = self.sessions.take(file_path)
+        if session is not None:
+            self.stash_session()
+            self.restore_session(session)
+            elapsed = (time.perf_counter() - started) * 1000
+            self.update_status(f"Switched to {name} in {elapsed:.0f} ms")
+            return
+            
+        try:
+            with tracing.span('decode preview', 'decode', file=name):
+                preview = engine.load_preview(file_path, (max(1, self.canvas.winfo_width()),
+                                                          max(1, self.canvas.winfo_height())))
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open image: {str(e)}")
+            return
+            
+        # Edits are blocked by is_busy(), or queued, until the full decode lands.
+        # The state left behind stays here until then, so a failed or
+        # cancelled load can go back to it whether or not the cache keeps it.
+        previous = self.detach_session()
+        self.original_image = None
+        self.current_image = preview
+        self.image_path = None
+        self.image_stamp = None
+        if preview is not None:
+            self.display_image_on_canvas()
+        else:
+            self.renderer.clear()
+        self.update_image_info()
+            
+        def load(path, progress):
+            stamp = sessions.file_stamp(path)
+            image = engine.load_image(path)
+            return image, image.copy(), stamp
+            
+        def on_done(result):
+            self.task = None
+            self.original_image, self.current_image, self.image_stamp = result
+            self.image_path = file_path
+            if previous is not None:
+                # Opening the open file again is a reload, so its state isn't kept
+                if (previous.path is not None and os.path.abspath(previous.path)
+                        == os.path.abspath(file_path)):
+                    previous.close()
+                else:
+                    self.keep_session(previous)
+                    
+            self.display_image_on_canvas()
+            self.update_image_info()
+            self.update_status(f"Opened: {name}")
+            self.run_queued()
+            
+        def on_error(e):
+            self.task = None
+            self.queued = None
+            self.return_to(previous)
+            messagebox.showerror("Error", f"Could not open image: {str(e)}")
+            
+        def on_cancel():
+            self.task = None
+            self.queued = None
+            self.return_to(previous)
+            self.update_status("Open cancelled")
+            
+        self.task = self.tasks.submit(f"Loading {name}", load, file_path,
+                                      on_done=on_done, on_error=on_error,
+                                      on_progress=self.show_progress, on_cancel=on_cancel)
+        if preview is not None:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.status_bar.config(text=f"Preview of {name} in {elapsed:.0f} ms, "
+                                        f"loading full resolution...")
+            
+    def detach_session(self):
+        """Take the open image's state out of the editor and start afresh.
+        
+        Returns it as a Session, or None if no image is open. The slider
+        session must have been committed already.
+        """
+        if self.current_image is None:
+            return None
+        session = sessions.Session(self.image_path, self.image_stamp, self.original_image,
+                                   self.current_image, self.image_version, self.pyramid,
+                                   self.history, self.recorder, self.zoom_factor)
+        self.pyramid = DisplayPyramid()
+        self.renderer.pyramid = self.pyramid
+        self.renderer.clear()
+        self.history = History(self.history_budget)
+        self.recorder = RecipeRecorder()
+        return session
+        
+    def keep_session(self, session):
+        """Cache a detached session of a file; anything else is released"""
+        if session.path is not None and session.original_image is not None:
+            self.sessions.put(session)
+        else:
+            session.close()
+            
+    def stash_session(self):
+        """Keep the open file's state in the session cache and start afresh"""
+        session = self.detach_session()
+        if session is not None:
+            self.keep_session(session)
+            
+    def restore_session(self, session):
+        """Make a detached or cached session the open image again"""
+        self.end_adjustment_session()
+        self.history.close()
+        self.original_image = session.original_image
+        self._current_image = session.current_image
+        # The pyramid's levels are valid for the version they were built at
+        self.image_version = session.image_version
+        self.pyramid = session.pyramid
+        self.renderer.pyramid = self.pyramid
+        self.renderer.clear()
+        self.history = session.history
+        self.recorder = session.recorder
+        self.zoom_factor = session.zoom_factor
+        self.image_path = session.path
+        self.image_stamp = session.stamp
+        self.display_image_on_canvas()
+        self.update_image_info()
+        
+    def return_to(self, session):
+        """Go back to the state detached before a load that failed or was cancelled"""
+        if session is not None:
+            self.restore_session(session)
+        else:
+            self.history.clear()
+            self.recorder.clear()
+            self.current_image = None
+            self.renderer.clear()
+            self.update_image_info()
+            
     def save_image(self):
         """Save the current image"""
         if not self.current_image:
             messagebox.showwarning("Warning", "No image to save!")
             return
             
+        if self.is_busy():
+            return
+            
         if not self.image_path:
             self.save_as_image()
             return
             
-        try:
-            self.current_image.save(self.image_path)
-            self.update_status("Image saved successfully")
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not save image: {str(e)}")
+        self.write_image(self.image_path)
             
     def save_as_image(self):
         """Save image with new name"""
@@ -374,6 +727,9 @@ class ImageEditor:
             messagebox.showwarning("Warning", "No image to save!")
             return
             
+        if self.is_busy():
+            return
+            
         file_path = filedialog.asksaveasfilename(
             title="Save Image As",
             defaultextension=".jpg",
@@ -386,13 +742,185 @@ class ImageEditor:
         )
         
         if file_path:
-            try:
-                self.current_image.save(file_path)
+            self.write_image(file_path)
+            
+    def write_image(self, file_path):
+        """Encode the current image to file_path in the background"""
+        settings = dict(self.save_settings)
+        name = os.path.basename(file_path)
+        
+        def save(image, progress):
+            engine.save_image(image, file_path, **settings)
+            
+        original = self.original_image
+        
+        def on_saved(result):
+            # The user may have switched to another file meanwhile
+            if self.original_image is original:
                 self.image_path = file_path
-                self.update_status(f"Saved as: {os.path.basename(file_path)}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Could not save image: {str(e)}")
+                self.image_stamp = sessions.file_stamp(file_path)
+            self.update_status(f"Saved: {name}")
+            
+        self.run_save(f"Saving {name}", save, on_saved)
+        
+    def run_save(self, description, func, on_saved):
+        """Run func(image, progress) on the current image on a worker while editing goes on.
+        
+        Edits replace current_image rather than change it, apart from strokes
+        and patch undos, which copy it first while a save holds it.
+        """
+        if self.save_job is not None:
+            self.update_status(f"Please wait: {self.save_job.description} is still running")
+            return
+            
+        self.finish_adjustments(lambda: self.start_save(description, func, on_saved))
+        
+    def start_save(self, description, func, on_saved):
+        """Hand the up-to-date current_image to a worker for run_save"""
+        image = self.current_image
+        
+        def finished():
+            self.save_job = None
+            self.saving_image = None
+            
+        def on_done(result):
+            finished()
+            on_saved(result)
+            
+        def on_error(e):
+            finished()
+            messagebox.showerror("Error", f"Could not save image: {str(e)}")
+            
+        def on_cancel():
+            finished()
+            self.update_status("Save cancelled")
+            
+        self.saving_image = image
+        self.save_job = self.tasks.submit(description, func, image,
+                                          on_done=on_done, on_error=on_error, on_cancel=on_cancel)
+        self.status_bar.config(text=f"{description}...")
+        
+    def export_image(self):
+        """Write the current image once per chosen export preset"""
+        if not self.current_image:
+            messagebox.showwarning("Warning", "No image to export!")
+            return
+            
+        if self.is_busy():
+            return
+            
+        export_window = tk.Toplevel(self.root)
+        export_window.title("Export")
+        export_window.geometry("380x340")
+        export_window.configure(bg='#34495e')
+        
+        title_label = tk.Label(export_window, text="Export Presets",
+                              bg='#34495e', fg='white', font=('Arial', 14, 'bold'))
+        title_label.pack(pady=15)
+        
+        presets_frame = tk.Frame(export_window, bg='#34495e')
+        presets_frame.pack(pady=5)
+        chosen = []
+        
+        def show_presets():
+            for widget in presets_frame.winfo_children():
+                widget.destroy()
+            chosen.clear()
+            for preset in self.export_presets:
+                var = tk.BooleanVar(value=True)
+                tk.Checkbutton(presets_frame, text=preset.name, variable=var,
+                              bg='#34495e', fg='white', selectcolor='#34495e').pack(anchor=tk.W)
+                chosen.append((preset, var))
+                
+        show_presets()
+        
+        if self.image_path:
+            folder, stem = os.path.split(os.path.splitext(self.image_path)[0])
+        else:
+            folder, stem = os.getcwd(), "untitled"
+            
+        target_frame = tk.Frame(export_window, bg='#34495e')
+        target_frame.pack(pady=10)
+        
+        tk.Label(target_frame, text="Folder:", bg='#34495e', fg='white').grid(row=0, column=0, padx=5, pady=5)
+        folder_entry = tk.Entry(target_frame, width=24)
+        folder_entry.insert(0, folder)
+        folder_entry.grid(row=0, column=1, padx=5, pady=5)
+        
+        def browse():
+            path = filedialog.askdirectory(title="Export To", initialdir=folder_entry.get())
+            if path:
+                folder_entry.delete(0, tk.END)
+                folder_entry.insert(0, path)
+                
+        tk.Button(target_frame, text="...", command=browse).grid(row=0, column=2, padx=5)
+        
+        tk.Label(target_frame, text="Name:", bg='#34495e', fg='white').grid(row=1, column=0, padx=5, pady=5)
+        stem_entry = tk.Entry(target_frame, width=24)
+        stem_entry.insert(0, stem)
+        stem_entry.grid(row=1, column=1, padx=5, pady=5)
+        
+        button_frame = tk.Frame(export_window, bg='#34495e')
+        button_frame.pack(pady=15)
+        
+        def load_presets():
+            path = filedialog.askopenfilename(title="Load Export Presets",
+                                              filetypes=[("Export presets", "*.json"), ("All files", "*.*")])
+            if path:
+                try:
+                    self.export_presets = export.load_presets(path)
+                except Exception as e:
+                    messagebox.showerror("Error", f"Could not load presets: {str(e)}")
+                    return
+                show_presets()
                 
+        def run_export():
+            presets = [preset for preset, var in chosen if var.get()]
+            if not presets:
+                messagebox.showerror("Error", "Choose at least one preset!")
+                return
+            target_folder, target_stem = folder_entry.get(), stem_entry.get()
+            existing, overwrites_source = export.existing_outputs(target_folder, target_stem,
+                                                                  presets, self.image_path)
+            if existing:
+                names = "\n".join(os.path.basename(path) for path in existing)
+                if overwrites_source:
+                    title, question = "Overwrite Original?", (
+                        f"Exporting would replace the opened image with the edited version:\n"
+                        f"{self.image_path}\n\nFiles that would be overwritten:\n{names}\n\n"
+                        f"Overwrite the original?")
+                else:
+                    title, question = "Overwrite Files?", f"These files already exist:\n{names}\n\nOverwrite them?"
+                if not messagebox.askyesno(title, question, icon=messagebox.WARNING,
+                                           default=messagebox.NO, parent=export_window):
+                    return
+            started = time.perf_counter()
+            
+            def on_exported(timings):
+                elapsed = time.perf_counter() - started
+                self.update_status(f"Exported {len(timings)} file(s) in {elapsed:.1f} s "
+                                   f"(slowest encode {max(timings.values()):.1f} s)")
+                
+            export_window.destroy()
+            self.run_save(f"Exporting {len(presets)} file(s)",
+                          lambda image, progress: export.export(image, target_folder, target_stem,
+                                                                presets, progress),
+                          on_exported)
+            
+        tk.Button(button_frame, text="Export", command=run_export,
+                 bg='#27ae60', fg='white', font=('Arial', 10), padx=20).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Load Presets...", command=load_presets,
+                 bg='#34495e', fg='white', font=('Arial', 10), padx=10).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Cancel", command=export_window.destroy,
+                 bg='#e74c3c', fg='white', font=('Arial', 10), padx=20).pack(side=tk.LEFT, padx=5)
+        
+    def detach_from_save(self):
+        """Copy current_image before an in-place edit if a save is still encoding it"""
+        if self.saving_image is not None and self.current_image is self.saving_image:
+            # Same pixels, so the display keeps its cached levels
+            self._current_image = self.current_image.copy()
+            self.pyramid.replace_source(self._current_image)
+            
     def display_image_on_canvas(self):
         """Display the current image on canvas"""
         if not self.current_image:
@@ -407,40 +935,37 @@ class ImageEditor:
             self.root.after(100, self.display_image_on_canvas)
             return
             
-        img_width, img_height = self.current_image.size
-        
         # Calculate scale to fit image in canvas
-        scale_x = (canvas_width - 20) / img_width  # Leave some margin
-        scale_y = (canvas_height - 20) / img_height
-        scale = min(scale_x, scale_y, 1.0) * self.zoom_factor  # Don't upscale beyond 100% unless zoomed
-        
-        new_width = max(1, int(img_width * scale))
-        new_height = max(1, int(img_height * scale))
+        scale = engine.display_scale(self.current_image.size, (canvas_width, canvas_height),
+                                     self.zoom_factor)
         
-        # Resize image for display
+        # Only the tiles intersecting the visible region are resampled
         try:
-            self.display_image = self.current_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            self.photo = ImageTk.PhotoImage(self.display_image)
-            
-            # Clear canvas and display image
-            self.canvas.delete("all")
-            
-            # Center the image
-            x = canvas_width // 2
-            y = canvas_height // 2
-            
-            self.canvas.create_image(x, y, image=self.photo, anchor=tk.CENTER)
-            
-            # Update scroll region
-            bbox = self.canvas.bbox("all")
-            if bbox:
-                self.canvas.configure(scrollregion=bbox)
+            with tracing.span('display refresh', 'display'):
+                self.pyramid.set_image(self.current_image, self.image_version)
+                self.renderer.set_view(scale, (canvas_width, canvas_height))
+                self.renderer.render()
         except Exception as e:
             print(f"Error displaying image: {e}")
             self.update_status("Error displaying image")
+            
+    def schedule_render(self):
+        """Render visible tiles once the current burst of scroll events is handled"""
+        if self.current_image and not self.render_pending:
+            self.render_pending = True
+            self.root.after_idle(self.render_visible_tiles)
+            
+    def render_visible_tiles(self):
+        """Render tiles that scrolled into view"""
+        self.render_pending = False
+        with tracing.span('render tiles', 'display'):
+            self.renderer.render()
         
     def update_image_info(self):
         """Update image information display"""
+        if not self.panels_built:
+            # create_panels fills it in
+            return
         if self.current_image:
             width, height = self.current_image.size
             self.size_label.config(text=f"Size: {width} × {height}")
@@ -449,42 +974,79 @@ class ImageEditor:
             self.size_label.config(text="Size: No image")
             self.format_label.config(text="Format: -")
             
-    def save_state(self):
-        """Save current state to undo stack"""
-        if self.current_image:
-            self.undo_stack.append(self.current_image.copy())
-            self.redo_stack.clear()
+    def restore_state(self, image, box):
+        """Show an image returned by the history; box is set for in-place changes"""
+        if box is not None:
+            self.mark_region_dirty(box)
+        else:
+            self.current_image = image
+            self.display_image_on_canvas()
+            self.update_image_info()
             
     def undo(self):
         """Undo last operation"""
-        if len(self.undo_stack) > 1:
-            self.redo_stack.append(self.undo_stack.pop())
-            self.current_image = self.undo_stack[-1].copy()
-            self.display_image_on_canvas()
-            self.update_status("Undo successful")
+        if self.current_image and self.history.can_undo() and not self.is_busy():
+            self.commit_adjustments(self.undo_step)
+            
+    def undo_step(self):
+        """Step back once the adjustments are committed"""
+        self.detach_from_save()
+        with tracing.span('undo', 'history'):
+            self.restore_state(*self.history.undo(self.current_image))
+        self.recorder.undo()
+        self.update_status("Undo successful")
             
     def redo(self):
         """Redo last undone operation"""
-        if self.redo_stack:
-            self.current_image = self.redo_stack.pop()
-            self.undo_stack.append(self.current_image.copy())
-            self.display_image_on_canvas()
-            self.update_status("Redo successful")
+        if self.current_image and self.history.can_redo() and not self.is_busy():
+            self.commit_adjustments(self.redo_step)
+            
+    def redo_step(self):
+        """Step forward once the adjustments are committed"""
+        # Committing a slider session is a new edit, which drops the redo steps
+        if not self.history.can_redo():
+            return
+        self.detach_from_save()
+        with tracing.span('redo', 'history'):
+            self.restore_state(*self.history.redo(self.current_image))
+        self.recorder.redo()
+        self.update_status("Redo successful")
+            
+    def set_zoom(self, zoom_factor):
+        """Change zoom while keeping the center of the view in place"""
+        if not self.current_image or self.renderer.scale is None:
+            self.zoom_factor = zoom_factor
+            return
             
+        self.latency.begin('zoom')
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        center = self.renderer.canvas_to_image(self.canvas.canvasx(canvas_width / 2),
+                                               self.canvas.canvasy(canvas_height / 2))
+        
+        self.zoom_factor = zoom_factor
+        self.display_image_on_canvas()
+        
+        # Scroll so the same image point is back in the middle
+        region_width = max(canvas_width, self.renderer.scaled_size[0])
+        region_height = max(canvas_height, self.renderer.scaled_size[1])
+        x = self.renderer.origin[0] + center[0] * self.renderer.scale - canvas_width / 2
+        y = self.renderer.origin[1] + center[1] * self.renderer.scale - canvas_height / 2
+        self.canvas.xview_moveto(max(0, x) / region_width)
+        self.canvas.yview_moveto(max(0, y) / region_height)
+        self.renderer.render()
+        
     def zoom_in(self):
         """Zoom in"""
-        self.zoom_factor = min(self.zoom_factor * 1.2, 5.0)
-        self.display_image_on_canvas()
+        self.set_zoom(min(self.zoom_factor * 1.2, 5.0))
         
     def zoom_out(self):
         """Zoom out"""
-        self.zoom_factor = max(self.zoom_factor / 1.2, 0.1)
-        self.display_image_on_canvas()
+        self.set_zoom(max(self.zoom_factor / 1.2, 0.1))
         
     def fit_to_window(self):
         """Fit image to window"""
-        self.zoom_factor = 1.0
-        self.display_image_on_canvas()
+        self.set_zoom(1.0)
         
     # Drawing functions
     def toggle_draw_mode(self):
@@ -508,184 +1070,331 @@ class ImageEditor:
         
     def start_draw(self, event):
         """Start drawing"""
-        if self.drawing_mode and self.current_image:
-            self.last_x = event.x
-            self.last_y = event.y
+        if self.drawing_mode and self.current_image and not self.is_busy():
+            x = self.canvas.canvasx(event.x)
+            y = self.canvas.canvasy(event.y)
+            self.stroke_points = [self.renderer.canvas_to_image(x, y)]
+            self.stroke_drawn = 1
             
     def draw(self, event):
-        """Draw on image"""
-        if self.drawing_mode and self.current_image and self.last_x and self.last_y:
-            # Calculate position on actual image
-            canvas_width = self.canvas.winfo_width()
-            canvas_height = self.canvas.winfo_height()
-            
-            img_width, img_height = self.current_image.size
-            scale_x = canvas_width / img_width
-            scale_y = canvas_height / img_height
-            scale = min(scale_x, scale_y) * self.zoom_factor
-            
-            # Convert canvas coordinates to image coordinates
-            center_x = canvas_width // 2
-            center_y = canvas_height // 2
-            
-            img_x = int((event.x - center_x) / scale + img_width // 2)
-            img_y = int((event.y - center_y) / scale + img_height // 2)
-            last_img_x = int((self.last_x - center_x) / scale + img_width // 2)
-            last_img_y = int((self.last_y - center_y) / scale + img_height // 2)
-            
-            # Draw on the actual image
-            draw = ImageDraw.Draw(self.current_image)
-            draw.line([last_img_x, last_img_y, img_x, img_y], 
-                     fill=self.draw_color, width=self.brush_size)
+        """Queue a stroke point; bursts of motion events are painted together"""
+        if self.drawing_mode and self.current_image and self.stroke_points:
+            self.latency.begin('draw', event)
+            x = self.canvas.canvasx(event.x)
+            y = self.canvas.canvasy(event.y)
+            self.stroke_points.append(self.renderer.canvas_to_image(x, y))
+            
+            if not self.stroke_flush_pending:
+                self.stroke_flush_pending = True
+                self.root.after_idle(self.flush_stroke)
+                
+    def flush_stroke(self):
+        """Paint queued stroke points onto the visible tiles only"""
+        self.stroke_flush_pending = False
+        # Start from the last painted point so segments stay connected
+        pending = self.stroke_points[self.stroke_drawn - 1:]
+        self.stroke_drawn = len(self.stroke_points)
+        self.renderer.draw_stroke(pending, self.draw_color, self.brush_size)
+        
+    def end_draw(self, event):
+        """End drawing and commit the whole stroke to the full-resolution image"""
+        if self.drawing_mode and self.stroke_points:
+            self.flush_stroke()
+            points = self.stroke_points
+            self.stroke_points = []
+            
+            if len(points) > 1:
+                box = engine.clip_box(engine.line_bounds(points, self.brush_size),
+                                      self.current_image.size)
+                if box:
+                    color, size = self.draw_color, self.brush_size
+                    self.commit_adjustments(lambda: self.commit_stroke(points, color, size, box))
+                    
+    def commit_stroke(self, points, color, size, box):
+        """Draw a finished stroke into the full-resolution image as one undo step"""
+        self.detach_from_save()
+        with tracing.span('commit stroke', 'edit', points=len(points)):
+            self.history.record_patch(box, self.current_image.crop(box))
+            self.recorder.record([step(engine.draw, (points, color, size))])
+            engine.draw_line(self.current_image, points, color, size)
+            self.mark_region_dirty(box)
+                
+    def apply_operation(self, operation, message, *args):
+        """Run an engine operation in the background as one undoable step"""
+        if not self.current_image:
+            return
+        if pipeline.can_fuse(operation):
+            self.queue_operation(operation, message, args)
+            return
+        if self.is_busy():
+            return
+        self.commit_adjustments(lambda: self.run_operation(operation, message, args))
+        
+    def run_operation(self, operation, message, args):
+        """Run a non-fusable operation on the committed image"""
+        before = self.current_image
+        description = operation.__name__.replace('_', ' ').capitalize()
+        self.run_edit(description, message, engine.run_operation, (operation, before, args),
+                      lambda: self.history.record(operation, args, before),
+                      [step(operation, args)])
+        
+    def queue_operation(self, operation, message, args):
+        """Add a fusable operation to the queue; it runs as soon as the worker is free"""
+        if self.queued is None:
+            self.queued = pipeline.Pipeline()
+        self.queued.add(operation, args)
+        self.queued_message = message
+        if self.task is None and not self.adjust_waiting:
+            self.run_queued()
+        else:
+            # Without a task, the queue is waiting on the full-resolution adjustment
+            running = "Applying adjustments" if self.task is None else self.task.description
+            self.status_bar.config(text=f"{len(self.queued)} operation(s) queued behind "
+                                        f"{running}")
+            
+    def run_queued(self):
+        """Materialise the queued operations in one fused pass"""
+        if self.queued is not None:
+            self.commit_adjustments(self.run_fused)
             
+    def run_fused(self):
+        """Apply the queued operations to the committed image"""
+        # Operations queued while the adjustments rendered are picked up too
+        if self.queued is None:
+            return
+        fused, message = self.queued, self.queued_message
+        self.queued = None
+        before = self.current_image
+        if len(fused) > 1:
+            message = f"Applied {len(fused)} operations in one pass"
+        self.run_edit("Applying operations", message,
+                      lambda image, progress: fused.apply(image), (before,),
+                      lambda: self.history.record_pipeline(fused, before),
+                      [step(operation, args) for operation, args in fused.operations])
+        
+    def run_edit(self, description, message, func, args, record, steps):
+        """Run func(*args) on a worker, then show the result and call record().
+        
+        steps are the recipe steps the edit adds.
+        """
+        def on_done(result):
+            self.task = None
+            self.current_image = result
+            with tracing.span('record history', 'history'):
+                record()
+            self.recorder.record(steps)
             self.display_image_on_canvas()
+            self.update_image_info()
+            self.update_status(message)
+            self.run_queued()
             
-            self.last_x = event.x
-            self.last_y = event.y
+        def on_error(e):
+            self.task = None
+            self.queued = None
+            self.update_status("Operation failed")
+            messagebox.showerror("Error", f"Could not apply operation: {str(e)}")
             
-    def end_draw(self, event):
-        """End drawing"""
-        if self.drawing_mode:
-            self.save_state()
-            self.last_x = None
-            self.last_y = None
+        def on_cancel():
+            self.task = None
+            self.queued = None
+            self.update_status("Operation cancelled")
+            
+        self.task = self.tasks.submit(description, func, *args,
+                                      on_done=on_done, on_error=on_error,
+                                      on_progress=self.show_progress, on_cancel=on_cancel)
             
     # Filter functions
     def apply_grayscale(self):
         """Apply grayscale filter"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.convert('L').convert('RGB')
-            self.display_image_on_canvas()
-            self.update_status("Grayscale filter applied")
+        self.apply_operation(engine.grayscale, "Grayscale filter applied")
             
     def apply_sepia(self):
         """Apply sepia filter"""
-        if self.current_image:
-            self.save_state()
-            # Convert to numpy array for easier manipulation
-            img_array = np.array(self.current_image)
-            
-            # Sepia transformation matrix
-            sepia_filter = np.array([
-                [0.393, 0.769, 0.189],
-                [0.349, 0.686, 0.168],
-                [0.272, 0.534, 0.131]
-            ])
-            
-            sepia_img = img_array.dot(sepia_filter.T)
-            sepia_img = np.clip(sepia_img, 0, 255).astype(np.uint8)
-            
-            self.current_image = Image.fromarray(sepia_img)
-            self.display_image_on_canvas()
-            self.update_status("Sepia filter applied")
+        self.apply_operation(engine.sepia, "Sepia filter applied")
             
     def apply_invert(self):
         """Apply invert filter"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = ImageOps.invert(self.current_image)
-            self.display_image_on_canvas()
-            self.update_status("Invert filter applied")
+        self.apply_operation(engine.invert, "Invert filter applied")
             
     def apply_blur(self):
         """Apply blur filter"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.filter(ImageFilter.BLUR)
-            self.display_image_on_canvas()
-            self.update_status("Blur filter applied")
+        self.apply_operation(engine.blur, "Blur filter applied")
             
     def apply_sharpen(self):
         """Apply sharpen filter"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.filter(ImageFilter.SHARPEN)
-            self.display_image_on_canvas()
-            self.update_status("Sharpen filter applied")
+        self.apply_operation(engine.sharpen, "Sharpen filter applied")
             
     def apply_emboss(self):
         """Apply emboss filter"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.filter(ImageFilter.EMBOSS)
-            self.display_image_on_canvas()
-            self.update_status("Emboss filter applied")
+        self.apply_operation(engine.emboss, "Emboss filter applied")
             
     # Transform functions
     def flip_horizontal(self):
         """Flip image horizontally"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
-            self.display_image_on_canvas()
-            self.update_status("Flipped horizontally")
+        self.apply_operation(engine.flip_horizontal, "Flipped horizontally")
             
     def flip_vertical(self):
         """Flip image vertically"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
-            self.display_image_on_canvas()
-            self.update_status("Flipped vertically")
+        self.apply_operation(engine.flip_vertical, "Flipped vertically")
             
     def rotate_90(self):
         """Rotate image 90 degrees"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.transpose(Image.Transpose.ROTATE_90)
-            self.display_image_on_canvas()
-            self.update_image_info()
-            self.update_status("Rotated 90°")
+        self.apply_operation(engine.rotate_90, "Rotated 90°")
             
     def rotate_180(self):
         """Rotate image 180 degrees"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.transpose(Image.Transpose.ROTATE_180)
-            self.display_image_on_canvas()
+        self.apply_operation(engine.rotate_180, "Rotated 180°")
+            
     def rotate_270(self):
         """Rotate image 270 degrees"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.transpose(Image.Transpose.ROTATE_270)
-            self.display_image_on_canvas()
-            self.update_image_info()
-            self.update_status("Rotated 270°")
+        self.apply_operation(engine.rotate_270, "Rotated 270°")
             
     def transpose_image(self):
         """Transpose image (swap width and height)"""
-        if self.current_image:
-            self.save_state()
-            self.current_image = self.current_image.transpose(Image.Transpose.TRANSPOSE)
-            self.display_image_on_canvas()
-            self.update_image_info()
-            self.update_status("Image transposed")
+        self.apply_operation(engine.transpose, "Image transposed")
             
     # Adjustment functions
+    def set_adjustment(self, name, value):
+        """Preview slider adjustments on the display proxy and schedule the full render"""
+        if not self.current_image or self.renderer.scale is None or self.is_busy():
+            return
+        if self.adjust_base is None:
+            if value == 0:
+                return
+            # First slider move since the last edit: the whole session is one undo step
+            self.adjust_base = self.current_image
+            self.history.record_frame(self.adjust_base)
+            self.adjust_step = step(engine.adjust, (0, 0, 0))
+            self.recorder.record([self.adjust_step])
+            self.pyramid.set_image(self.adjust_base, self.image_version)
+            self.adjust_proxy = self.pyramid.get_level(
+                self.pyramid.level_for_scale(self.renderer.scale))
+            
+        self.latency.begin('slider')
+        setattr(self.adjustments, name, value)
+        self.adjust_step[1] = [self.adjustments.brightness, self.adjustments.contrast,
+                               self.adjustments.saturation]
+        with tracing.span('adjustment preview', 'edit'):
+            self.renderer.set_preview(self.adjustments.apply(self.adjust_proxy))
+        
+        # Restart the idle timer and drop any full-resolution render in flight
+        self.cancel_full_adjustment()
+        self.adjust_after_id = self.root.after(ADJUST_DEBOUNCE_MS, self.start_full_adjustment)
+        
+    def cancel_full_adjustment(self):
+        """Cancel the pending or running full-resolution adjustment"""
+        if self.adjust_after_id is not None:
+            self.root.after_cancel(self.adjust_after_id)
+            self.adjust_after_id = None
+        if self.adjust_job is not None:
+            # A render that already started stops at its next strip
+            self.adjust_job.cancel()
+            self.adjust_job = None
+        
+    def start_full_adjustment(self):
+        """Render the adjustments at full resolution on a worker thread"""
+        self.adjust_after_id = None
+        if self.adjust_running is not None:
+            # Only one full-size render at a time: wait for a cancelled one to stop
+            self.adjust_after_id = self.root.after(self.tasks.poll_ms, self.start_full_adjustment)
+            return
+        adjustments = engine.Adjustments(self.adjustments.brightness,
+                                         self.adjustments.contrast,
+                                         self.adjustments.saturation)
+        self.adjust_job = self.tasks.submit(
+            "Applying adjustments", adjustments.apply,
+            self.adjust_base, on_done=self.finish_full_adjustment,
+            on_error=self.adjustment_failed, on_cancel=self.adjustment_stopped)
+        self.adjust_running = self.adjust_job
+        self.status_bar.config(text="Applying adjustments...")
+        
+    def adjustment_stopped(self):
+        """Note that a cancelled full-resolution adjustment has let go of the pool"""
+        self.adjust_running = None
+        
+    def adjustment_failed(self, error):
+        """Drop a slider session whose full-resolution render failed.
+        
+        The image goes back to how it was before the session, and the undo
+        frame and recipe step the session recorded are dropped with it, so
+        the display, undo and the recipe agree. Edits waiting on the render
+        are abandoned.
+        """
+        self.adjust_job = None
+        self.adjust_running = None
+        self.adjust_waiting = []
+        self.current_image = self.adjust_base
+        self.history.drop_last()
+        self.recorder.drop_last()
+        self.end_adjustment_session()
+        self.display_image_on_canvas()
+        self.update_status("Adjustments failed")
+        messagebox.showerror("Error", f"Could not apply adjustments: {str(error)}")
+        
+    def finish_full_adjustment(self, result):
+        """Swap in the full-resolution adjustment result and run waiting edits"""
+        self.adjust_job = None
+        self.adjust_running = None
+        self.current_image = result
+        self.renderer.clear_preview()
+        self.display_image_on_canvas()
+        self.update_status("Adjustments applied")
+        waiting, self.adjust_waiting = self.adjust_waiting, []
+        for then in waiting:
+            then()
+        # Fusable operations queued meanwhile weren't started by queue_operation
+        if waiting and self.task is None:
+            self.run_queued()
+        
+    def finish_adjustments(self, then):
+        """Call then() once current_image is up to date with the sliders.
+        
+        A render still waiting out the debounce is started at once, and then()
+        runs from its on_done, so the Tk thread never renders full size.
+        """
+        if self.adjust_base is None or (self.adjust_after_id is None
+                                        and self.adjust_job is None):
+            then()
+            return
+        self.adjust_waiting.append(then)
+        if self.adjust_after_id is not None:
+            self.root.after_cancel(self.adjust_after_id)
+            self.start_full_adjustment()
+            
+    def commit_adjustments(self, then):
+        """Keep the adjusted image, zero the sliders, then call then()"""
+        def committed():
+            self.end_adjustment_session()
+            then()
+            
+        self.finish_adjustments(committed)
+        
+    def end_adjustment_session(self):
+        """Forget the slider session without touching current_image"""
+        if self.adjust_base is None:
+            return
+        self.cancel_full_adjustment()
+        self.renderer.clear_preview()
+        self.adjust_base = None
+        self.adjust_proxy = None
+        self.adjust_step = None
+        self.adjust_waiting = []
+        self.adjustments = engine.Adjustments()
+        # The sliders' callbacks see 0 with no base and are ignored
+        for slider in self.sliders.values():
+            slider.set(0)
+            
     def adjust_brightness(self, value):
         """Adjust image brightness"""
-        if self.current_image and value != 0:
-            enhancer = ImageEnhance.Brightness(self.original_image)
-            factor = 1.0 + (value / 100.0)
-            self.current_image = enhancer.enhance(factor)
-            self.display_image_on_canvas()
+        self.set_adjustment('brightness', value)
             
     def adjust_contrast(self, value):
         """Adjust image contrast"""
-        if self.current_image and value != 0:
-            enhancer = ImageEnhance.Contrast(self.original_image)
-            factor = 1.0 + (value / 100.0)
-            self.current_image = enhancer.enhance(factor)
-            self.display_image_on_canvas()
+        self.set_adjustment('contrast', value)
             
     def adjust_saturation(self, value):
         """Adjust image saturation"""
-        if self.current_image and value != 0:
-            enhancer = ImageEnhance.Color(self.original_image)
-            factor = 1.0 + (value / 100.0)
-            self.current_image = enhancer.enhance(factor)
-            self.display_image_on_canvas()
+        self.set_adjustment('saturation', value)
             
     # Tool functions
     def crop_tool(self):
@@ -729,36 +1438,13 @@ class ImageEditor:
                 # Get crop coordinates
                 coords = self.canvas.coords(self.crop_rect)
                 
-                # Get canvas dimensions and image position
-                canvas_width = self.canvas.winfo_width()
-                canvas_height = self.canvas.winfo_height()
-                
-                img_width, img_height = self.current_image.size
-                
-                # Calculate scale and position
-                scale_x = canvas_width / img_width
-                scale_y = canvas_height / img_height
-                scale = min(scale_x, scale_y) * self.zoom_factor
-                
-                # Calculate image position on canvas
-                scaled_width = int(img_width * scale)
-                scaled_height = int(img_height * scale)
-                img_x = (canvas_width - scaled_width) // 2
-                img_y = (canvas_height - scaled_height) // 2
-                
                 # Convert canvas coordinates to image coordinates
-                x1 = max(0, int((coords[0] - img_x) / scale))
-                y1 = max(0, int((coords[1] - img_y) / scale))
-                x2 = min(img_width, int((coords[2] - img_x) / scale))
-                y2 = min(img_height, int((coords[3] - img_y) / scale))
+                box = engine.canvas_rect_to_box(coords, self.current_image.size,
+                                                self.renderer.origin, self.renderer.scale)
                 
                 # Ensure we have a valid crop area
-                if x2 > x1 and y2 > y1:
-                    self.save_state()
-                    self.current_image = self.current_image.crop((x1, y1, x2, y2))
-                    self.display_image_on_canvas()
-                    self.update_image_info()
-                    self.update_status("Image cropped successfully")
+                if box:
+                    self.apply_operation(engine.crop, "Image cropped successfully", box)
                 else:
                     self.update_status("Invalid crop area")
                 
@@ -862,12 +1548,7 @@ class ImageEditor:
             angle = angle_var.get()
             if angle != 0:
                 try:
-                    self.save_state()
-                    # Use expand=True to avoid cutting off parts of the image
-                    self.current_image = self.current_image.rotate(-angle, expand=True, fillcolor='white')
-                    self.display_image_on_canvas()
-                    self.update_image_info()
-                    self.update_status(f"Rotated by {angle}°")
+                    self.apply_operation(engine.rotate, f"Rotated by {angle}°", angle)
                 except Exception as e:
                     messagebox.showerror("Error", f"Could not rotate image: {str(e)}")
             rotate_window.destroy()
@@ -876,7 +1557,7 @@ class ImageEditor:
             angle = angle_var.get()
             if angle != 0:
                 try:
-                    preview_img = self.current_image.rotate(-angle, expand=True, fillcolor='white')
+                    preview_img = engine.rotate(self.current_image, angle)
                     # Temporarily show preview
                     temp_current = self.current_image
                     self.current_image = preview_img
@@ -899,12 +1580,70 @@ class ImageEditor:
                  
     def reset_adjustments(self):
         """Reset all adjustments to original image"""
-        if self.original_image:
-            self.save_state()
-            self.current_image = self.original_image.copy()
-            self.display_image_on_canvas()
-            self.update_status("Reset to original image")
+        if self.original_image and not self.is_busy():
+            self.commit_adjustments(self.reset_to_original)
+            
+    def reset_to_original(self):
+        """Go back to the opened image as one undoable step"""
+        self.history.record_frame(self.current_image)
+        self.recorder.reset()
+        self.current_image = self.original_image.copy()
+        self.display_image_on_canvas()
+        self.update_image_info()
+        self.update_status("Reset to original image")
+            
+    def save_recipe(self):
+        """Save the edits made since opening the image as a recipe file"""
+        recipe = self.recorder.recipe()
+        if not recipe:
+            messagebox.showwarning("Warning", "No edits to save as a recipe!")
+            return
+            
+        file_path = filedialog.asksaveasfilename(
+            title="Save Recipe",
+            defaultextension=".json",
+            filetypes=[("Recipe files", "*.json"), ("All files", "*.*")]
+        )
+        
+        if file_path:
+            try:
+                recipe.save(file_path)
+                self.update_status(f"Recipe with {len(recipe)} step(s) saved: "
+                                   f"{os.path.basename(file_path)}")
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not save recipe: {str(e)}")
+                
+    def apply_recipe(self):
+        """Replay a recipe file on the current image as one undoable step"""
+        if not self.current_image:
+            messagebox.showwarning("Warning", "No image loaded!")
+            return
+        if self.is_busy():
+            return
+            
+        file_path = filedialog.askopenfilename(
+            title="Apply Recipe",
+            filetypes=[("Recipe files", "*.json"), ("All files", "*.*")]
+        )
+        if not file_path:
+            return
+            
+        try:
+            recipe = Recipe.load(file_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not load recipe: {str(e)}")
+            return
+            
+        message = f"Applied recipe: {os.path.basename(file_path)}"
+        
+        def run():
+            before = self.current_image
+            self.run_edit("Applying recipe", message,
+                          lambda image, progress: recipe.apply(image), (before,),
+                          lambda: self.history.record_frame(before), recipe.steps)
             
+        self.commit_adjustments(run)
+        
     def create_new_image(self):
         """Create a new blank image"""
         # Create new image dialog
@@ -959,23 +1698,11 @@ class ImageEditor:
                     messagebox.showerror("Error", "Width and height must be positive numbers!")
                     return
                     
-                if color == "transparent":
-                    self.current_image = Image.new('RGBA', (width, height), (255, 255, 255, 0))
-                else:
-                    self.current_image = Image.new('RGB', (width, height), color)
-                
-                self.original_image = self.current_image.copy()
-                self.image_path = None
-                
-                # Clear undo/redo stacks
-                self.undo_stack.clear()
-                self.redo_stack.clear()
-                self.save_state()
-                
-                self.display_image_on_canvas()
-                self.update_image_info()
-                self.update_status(f"Created new {width}×{height} image")
+                if self.is_busy():
+                    return
+                    
                 new_window.destroy()
+                self.commit_adjustments(lambda: self.new_image(width, height, color))
                 
             except ValueError:
                 messagebox.showerror("Error", "Please enter valid numbers for width and height!")
@@ -985,6 +1712,82 @@ class ImageEditor:
         tk.Button(button_frame, text="Cancel", command=new_window.destroy,
                  bg='#e74c3c', fg='white', font=('Arial', 10), padx=20).pack(side=tk.LEFT, padx=5)
                  
+    def new_image(self, width, height, color):
+        """Replace the open file with a blank image of the given background"""
+        self.stash_session()
+        if color == "transparent":
+            self.current_image = Image.new('RGBA', (width, height), (255, 255, 255, 0))
+        else:
+            self.current_image = Image.new('RGB', (width, height), color)
+            
+        self.original_image = self.current_image.copy()
+        self.image_path = None
+        self.image_stamp = None
+        
+        # Clear undo/redo stacks
+        self.history.clear()
+        self.recorder.clear()
+        
+        self.display_image_on_canvas()
+        self.update_image_info()
+        self.update_status(f"Created new {width}×{height} image")
+        
+    def show_save_options(self):
+        """Choose the encoder settings used when saving"""
+        options_window = tk.Toplevel(self.root)
+        options_window.title("Save Options")
+        options_window.geometry("340x330")
+        options_window.configure(bg='#34495e')
+        
+        title_label = tk.Label(options_window, text="Save Options",
+                              bg='#34495e', fg='white', font=('Arial', 14, 'bold'))
+        title_label.pack(pady=15)
+        
+        settings_frame = tk.Frame(options_window, bg='#34495e')
+        settings_frame.pack(pady=5)
+        
+        settings = self.save_settings
+        quality_var = tk.IntVar(value=settings['quality'])
+        subsampling_var = tk.StringVar(value=settings['subsampling'])
+        level_var = tk.IntVar(value=settings['compress_level'])
+        optimize_var = tk.BooleanVar(value=settings['optimize'])
+        compression_var = tk.StringVar(value=settings['compression'])
+        
+        tk.Label(settings_frame, text="JPEG quality:", bg='#34495e', fg='white').grid(row=0, column=0, sticky=tk.W, padx=5)
+        tk.Scale(settings_frame, from_=1, to=95, orient=tk.HORIZONTAL, variable=quality_var,
+                bg='#34495e', fg='white', highlightthickness=0).grid(row=0, column=1, padx=5)
+        
+        tk.Label(settings_frame, text="JPEG subsampling:", bg='#34495e', fg='white').grid(row=1, column=0, sticky=tk.W, padx=5)
+        tk.OptionMenu(settings_frame, subsampling_var, '4:4:4', '4:2:2', '4:2:0').grid(row=1, column=1, padx=5, pady=5)
+        
+        tk.Label(settings_frame, text="PNG compression:", bg='#34495e', fg='white').grid(row=2, column=0, sticky=tk.W, padx=5)
+        tk.Scale(settings_frame, from_=0, to=9, orient=tk.HORIZONTAL, variable=level_var,
+                bg='#34495e', fg='white', highlightthickness=0).grid(row=2, column=1, padx=5)
+        
+        tk.Label(settings_frame, text="TIFF compression:", bg='#34495e', fg='white').grid(row=3, column=0, sticky=tk.W, padx=5)
+        tk.OptionMenu(settings_frame, compression_var, 'raw', 'tiff_lzw', 'tiff_deflate').grid(row=3, column=1, padx=5, pady=5)
+        
+        tk.Checkbutton(settings_frame, text="Optimize JPEG/PNG size (slower)", variable=optimize_var,
+                      bg='#34495e', fg='white', selectcolor='#34495e').grid(row=4, column=0, columnspan=2, pady=5)
+        
+        button_frame = tk.Frame(options_window, bg='#34495e')
+        button_frame.pack(pady=15)
+        
+        def apply_options():
+            self.save_settings = {
+                'quality': quality_var.get(),
+                'subsampling': subsampling_var.get(),
+                'compress_level': level_var.get(),
+                'optimize': optimize_var.get(),
+                'compression': compression_var.get(),
+            }
+            options_window.destroy()
+            
+        tk.Button(button_frame, text="OK", command=apply_options,
+                 bg='#27ae60', fg='white', font=('Arial', 10), padx=20).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Cancel", command=options_window.destroy,
+                 bg='#e74c3c', fg='white', font=('Arial', 10), padx=20).pack(side=tk.LEFT, padx=5)
+                 
     def show_image_info(self):
         """Show detailed image information"""
         if not self.current_image:
@@ -1038,6 +1841,131 @@ class ImageEditor:
             tk.Label(info_frame, text=value, bg='#34495e', fg='white', 
                     font=('Arial', 10, 'bold'), anchor=tk.W).grid(row=i, column=1, sticky=tk.W, padx=(20, 0), pady=5)
                     
+    def show_performance_panel(self):
+        """Show recent operation timings live, with trace export and profiling"""
+        panel = tk.Toplevel(self.root)
+        panel.title("Performance")
+        panel.geometry("720x460")
+        panel.configure(bg='#34495e')
+        
+        summary = tk.Label(panel, bg='#34495e', fg='white', font=('Arial', 10), anchor=tk.W)
+        summary.pack(fill=tk.X, padx=10, pady=(10, 5))
+        
+        # Newest spans first
+        table_frame = tk.Frame(panel, bg='#34495e')
+        table_frame.pack(fill=tk.BOTH, expand=True, padx=10)
+        columns = ('time', 'name', 'category', 'ms', 'memory', 'thread')
+        table = ttk.Treeview(table_frame, columns=columns, show='headings', height=15)
+        for column, heading, width in zip(columns,
+                                          ("At (s)", "Stage", "Kind", "ms", "RSS Δ (MB)", "Thread"),
+                                          (70, 250, 80, 80, 90, 130)):
+            table.heading(column, text=heading)
+            table.column(column, width=width, anchor=tk.W if column == 'name' else tk.E)
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.VERTICAL, command=table.yview)
+        table.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        tracer = tracing.tracer
+        shown = [None]
+        
+        def refresh():
+            if not panel.winfo_exists():
+                return
+            if tracer.total != shown[0]:
+                shown[0] = tracer.total
+                spans = tracer.recent()
+                table.delete(*table.get_children())
+                for span in reversed(spans):
+                    memory = f"{span.rss_delta / 2 ** 20:+.1f}" if span.rss_delta is not None else ""
+                    table.insert('', tk.END, values=(f"{span.start:.2f}", "  " * span.args.get('depth', 0) + span.name,
+                                                     span.category, f"{span.duration * 1000:.1f}",
+                                                     memory, span.thread_name))
+                slowest = max(spans, key=lambda span: span.duration, default=None)
+                rss = tracing.rss()
+                summary.config(text=f"{tracer.total} spans recorded"
+                                    + (f" · process memory {rss / 2 ** 20:.0f} MB" if rss else "")
+                                    + (f" · slowest recent: {slowest.name} ({slowest.duration * 1000:.0f} ms)"
+                                       if slowest else "")
+                                    + (" · profiler armed" if tracer.profile_armed else ""))
+            panel.after(PANEL_REFRESH_MS, refresh)
+            
+        def export_trace():
+            path = filedialog.asksaveasfilename(parent=panel, title="Export Chrome Trace",
+                                                defaultextension=".json",
+                                                filetypes=[("Trace files", "*.json"), ("All files", "*.*")])
+            if path:
+                try:
+                    tracer.export_chrome(path)
+                    self.update_status(f"Trace saved: {os.path.basename(path)} (open in chrome://tracing)")
+                except Exception as e:
+                    messagebox.showerror("Error", f"Could not save trace: {str(e)}", parent=panel)
+                    
+        def profile_next(kind, extension):
+            path = filedialog.asksaveasfilename(parent=panel, title="Save Profile As",
+                                                defaultextension=extension)
+            if path:
+                # Only background operations, so a redraw doesn't take the profiler
+                tracer.profile_next(kind, path, category='task')
+                shown[0] = None
+                self.update_status(f"The next operation will be profiled to {os.path.basename(path)}")
+                
+        def clear():
+            tracer.clear()
+            shown[0] = None
+            
+        button_frame = tk.Frame(panel, bg='#34495e')
+        button_frame.pack(pady=10)
+        for text, command in (("Export Trace...", export_trace),
+                              ("cProfile Next Operation...", lambda: profile_next('cprofile', '.prof')),
+                              ("tracemalloc Next Operation...", lambda: profile_next('tracemalloc', '.txt')),
+                              ("Clear", clear)):
+            tk.Button(button_frame, text=text, command=command, bg='#3498db', fg='white',
+                     font=('Arial', 10), padx=10).pack(side=tk.LEFT, padx=5)
+                     
+        refresh()
+        
+    def toggle_latency_monitor(self):
+        """Start or stop measuring event-to-paint latency"""
+        if self.latency.enabled:
+            self.latency.stop()
+            self.update_status("Latency monitor stopped")
+        else:
+            self.latency.start()
+            self.update_status("Latency monitor running")
+        self.latency_var.set(self.latency.enabled)
+        
+    def show_latency_report(self):
+        """Show latency percentiles and main-loop stalls, updated live"""
+        window = tk.Toplevel(self.root)
+        window.title("Input Latency")
+        window.geometry("640x420")
+        window.configure(bg='#34495e')
+        
+        text = tk.Text(window, bg='#2c3e50', fg='white', font=('Courier', 10), wrap=tk.NONE)
+        text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+        
+        def refresh():
+            if not window.winfo_exists():
+                return
+            report = self.latency.report()
+            if not self.latency.enabled:
+                report += "\n\nTurn on View > Latency Monitor to collect samples."
+            text.config(state=tk.NORMAL)
+            text.delete('1.0', tk.END)
+            text.insert('1.0', report)
+            text.config(state=tk.DISABLED)
+            window.after(PANEL_REFRESH_MS * 2, refresh)
+            
+        button_frame = tk.Frame(window, bg='#34495e')
+        button_frame.pack(pady=10)
+        tk.Button(button_frame, text="Reset", command=self.latency.reset, bg='#3498db', fg='white',
+                 font=('Arial', 10), padx=10).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Close", command=window.destroy, bg='#3498db', fg='white',
+                 font=('Arial', 10), padx=10).pack(side=tk.LEFT, padx=5)
+        
+        refresh()
+        
     def run(self):
         """Start the application"""
         # Add menu bar
@@ -1045,6 +1973,9 @@ class ImageEditor:
         
         # Start the main loop
         self.root.mainloop()
+        if self.filmstrip is not None:
+            self.filmstrip.close()
+        self.sessions.clear()
         
     def create_menu_bar(self):
         """Create the menu bar"""
@@ -1056,9 +1987,15 @@ class ImageEditor:
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="New...", command=self.create_new_image, accelerator="Ctrl+N")
         file_menu.add_command(label="Open...", command=self.open_image, accelerator="Ctrl+O")
+        file_menu.add_command(label="Open Folder...", command=self.open_folder, accelerator="Ctrl+Shift+O")
         file_menu.add_separator()
         file_menu.add_command(label="Save", command=self.save_image, accelerator="Ctrl+S")
         file_menu.add_command(label="Save As...", command=self.save_as_image, accelerator="Ctrl+Shift+S")
+        file_menu.add_command(label="Save Options...", command=self.show_save_options)
+        file_menu.add_command(label="Export...", command=self.export_image, accelerator="Ctrl+E")
+        file_menu.add_separator()
+        file_menu.add_command(label="Save Recipe...", command=self.save_recipe)
+        file_menu.add_command(label="Apply Recipe...", command=self.apply_recipe)
         file_menu.add_separator()
         file_menu.add_command(label="Image Info...", command=self.show_image_info)
         file_menu.add_separator()
@@ -1069,6 +2006,7 @@ class ImageEditor:
         menubar.add_cascade(label="Edit", menu=edit_menu)
         edit_menu.add_command(label="Undo", command=self.undo, accelerator="Ctrl+Z")
         edit_menu.add_command(label="Redo", command=self.redo, accelerator="Ctrl+Y")
+        edit_menu.add_command(label="Cancel Operation", command=self.cancel_task)
         edit_menu.add_separator()
         edit_menu.add_command(label="Reset to Original", command=self.reset_adjustments)
         
@@ -1078,6 +2016,12 @@ class ImageEditor:
         view_menu.add_command(label="Zoom In", command=self.zoom_in, accelerator="Ctrl++")
         view_menu.add_command(label="Zoom Out", command=self.zoom_out, accelerator="Ctrl+-")
         view_menu.add_command(label="Fit to Window", command=self.fit_to_window, accelerator="Ctrl+0")
+        view_menu.add_separator()
+        view_menu.add_command(label="Performance Panel...", command=self.show_performance_panel)
+        self.latency_var = tk.BooleanVar(value=self.latency.enabled)
+        view_menu.add_checkbutton(label="Latency Monitor", variable=self.latency_var,
+                                  command=self.toggle_latency_monitor)
+        view_menu.add_command(label="Latency Report...", command=self.show_latency_report)
         
         # Tools menu
         tools_menu = tk.Menu(menubar, tearoff=0)
@@ -1128,8 +2072,10 @@ class ImageEditor:
             ("File Operations", ""),
             ("Ctrl + N", "New Image"),
             ("Ctrl + O", "Open Image"),
+            ("Ctrl + Shift + O", "Open Folder"),
             ("Ctrl + S", "Save"),
             ("Ctrl + Shift + S", "Save As"),
+            ("Ctrl + E", "Export"),
             ("", ""),
             ("Edit Operations", ""),
             ("Ctrl + Z", "Undo"),
@@ -1190,9 +2136,26 @@ class ImageEditor:
 
 # Main execution
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['batch']:
+        import batch
+        sys.exit(batch.main(sys.argv[2:]))
+    if sys.argv[1:2] == ['benchmark']:
+        import benchmark
+        sys.exit(benchmark.main(sys.argv[2:]))
     try:
         app = ImageEditor()
+        # --latency measures input latency for the session and prints a report on exit
+        if '--latency' in sys.argv[1:]:
+            app.latency.start()
+        # --measure-startup opens the window, reports how long that took and quits
+        app.measure_startup = '--measure-startup' in sys.argv[1:]
         app.run()
+        if app.latency.started is not None:
+            print(app.latency.report())
+        if app.measure_startup:
+            print(app.startup_report())
+            total = app.startup_seconds()
+            sys.exit(0 if total is not None and total * 1000 <= STARTUP_TARGET_MS else 1)
     except Exception as e:
         print(f"Error starting application: {e}")
         import traceback
@@ -0,0 +1,438 @@
+"""Out-of-core images for Ignora.
+
+Gigapixel scans and stitched panoramas don't fit in memory as PIL images. A
+MappedImage keeps its pixels in a file mapped with numpy.memmap, either in
+Ignora's own raw format or an uncompressed TIFF read in place. The
+operations here stream over it in strips of bounded size and write their
+result to a new mapped file, so peak memory is a few strips whatever the
+image size. Inputs that are neither raw nor uncompressed TIFF are the
+exception: they are decoded in memory once while being converted to a mapped
+file. The batch command switches to this path for very large inputs.
+
+Files mapped here are the user's own local images, so Pillow's
+decompression-bomb limit is lifted while they are opened and decoded.
+Pillow only has a process-wide limit, so the override is made under a lock
+and only ever from batch worker processes, never the editor.
+"""
+import contextlib
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+
+import numpy as np
+from PIL import Image
+
+import engine
+import pipeline
+
+# Raw file layout: a fixed header followed by rows of interleaved 8-bit bands
+MAGIC = b'IGNORAMM'
+HEADER = struct.Struct('<8s8sQQ')
+HEADER_SIZE = 64
+RAW_EXTENSION = '.raw'
+
+# Bands per pixel of the modes that can be mapped
+BANDS = {'L': 1, 'LA': 2, 'RGB': 3, 'RGBA': 4, 'CMYK': 4}
+
+# Approximate bytes per strip, or per tile, read into memory at a time
+STRIP_BYTES = 64 * 1024 * 1024
+
+T = Image.Transpose
+
+# Transposes that turn source columns into destination rows
+SWAPS_AXES = {T.ROTATE_90, T.ROTATE_270, T.TRANSPOSE, T.TRANSVERSE}
+
+# Transposes whose first destination strip comes from the far end of the source
+REVERSES_STRIPS = {T.FLIP_TOP_BOTTOM, T.ROTATE_180}
+
+# Where a source box (x0, y0, x1, y1) of a width x height image lands, as the
+# top-left corner of the box after an axis-swapping transpose
+SWAPPED_CORNERS = {
+    T.ROTATE_90: lambda x0, y0, x1, y1, width, height: (y0, width - x1),
+    T.ROTATE_270: lambda x0, y0, x1, y1, width, height: (height - y1, x0),
+    T.TRANSPOSE: lambda x0, y0, x1, y1, width, height: (y0, x0),
+    T.TRANSVERSE: lambda x0, y0, x1, y1, width, height: (height - y1, width - x1),
+}
+
+# PNG colour type for each mode
+PNG_COLOR_TYPES = {'L': 0, 'LA': 4, 'RGB': 2, 'RGBA': 6}
+
+
+# Held for as long as Pillow's pixel limit is lifted, so overlapping blocks
+# can't restore each other's saved value or see it restored early
+_limit_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def trusted_size():
+    """Open and decode images of any size inside the block.
+
+    TIFF checks the limit again when it decodes, so the block has to cover
+    the decode as well as Image.open.
+    """
+    with _limit_lock:
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            yield
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+
+
+def pixel_count(path):
+    """Width times height of an image file, read from its header"""
+    with trusted_size(), Image.open(path) as img:
+        return img.width * img.height
+
+
+def can_stream(steps):
+    """Whether apply_chain supports every (name, args) step"""
+    for name, _ in steps:
+        operation = engine.OPERATIONS.get(name)
+        if operation is None or not (pipeline.can_fuse(operation)
+                                     or operation in engine.KERNEL_FILTERS
+                                     or operation is engine.crop):
+            return False
+    return True
+
+
+class MappedImage:
+    """An 8-bit image whose pixels live in a memory-mapped file"""
+
+    def __init__(self, path, mode, size, offset, writable=False):
+        if mode not in BANDS:
+            raise ValueError(f"Mode {mode} can't be mapped")
+        self.path = path
+        self.mode = mode
+        self.size = size
+        self.bands = BANDS[mode]
+        self.pixels = np.memmap(path, np.uint8, 'r+' if writable else 'r', offset,
+                                (size[1], size[0], self.bands))
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    @classmethod
+    def create(cls, path, mode, size):
+        """New writable raw image file at path"""
+        if mode not in BANDS:
+            raise ValueError(f"Mode {mode} can't be mapped")
+        width, height = size
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, mode.encode(), width, height).ljust(HEADER_SIZE, b'\0'))
+            # Sparse where the filesystem allows; pages are filled as strips land
+            f.truncate(HEADER_SIZE + width * height * BANDS[mode])
+        return cls(path, mode, size, HEADER_SIZE, writable=True)
+
+    @classmethod
+    def open(cls, path):
+        """Map a raw image file, or an uncompressed single-strip TIFF in place"""
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if header.startswith(MAGIC):
+            _, mode, width, height = HEADER.unpack(header)
+            return cls(path, mode.rstrip(b'\0').decode(), (width, height), HEADER_SIZE)
+
+        with trusted_size(), Image.open(path) as img:
+            mode, size, tiles = img.mode, img.size, img.tile
+        if mode in BANDS and len(tiles) == 1:
+            codec, extents, offset, args = tiles[0]
+            if (codec == 'raw' and tuple(extents) == (0, 0) + size and args[0] == mode
+                    and args[1] in (0, size[0] * BANDS[mode])
+                    and (len(args) < 3 or args[2] == 1)):
+                return cls(path, mode, size, offset)
+        raise ValueError(f"{os.path.basename(path)} can't be mapped in place")
+
+    @classmethod
+    def from_image(cls, img, path):
+        """Copy a PIL image into a new raw file"""
+        if img.mode not in BANDS:
+            img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+        mapped = cls.create(path, img.mode, img.size)
+        for top, bottom in mapped.strips():
+            mapped.write(top, img.crop((0, top, img.width, bottom)))
+        mapped.flush()
+        return mapped
+
+    @classmethod
+    def load(cls, source, scratch_path):
+        """Map source in place if possible, otherwise convert it to scratch_path.
+
+        Uncompressed TIFFs, tiled or striped, are copied tile by tile without
+        decoding the whole image; other formats need one full decode.
+        """
+        try:
+            return cls.open(source)
+        except ValueError:
+            pass
+        with trusted_size(), Image.open(source) as img:
+            mode, size, tiles = img.mode, img.size, img.tile
+            if mode in BANDS and tiles and all(t[0] == 'raw' and t[3][0] == mode for t in tiles):
+                mapped = cls.create(scratch_path, mode, size)
+                mapped._copy_raw_tiles(source, tiles)
+                return mapped
+            img.load()
+            return cls.from_image(img, scratch_path)
+
+    def _copy_raw_tiles(self, source, tiles):
+        for _, (x0, y0, x1, y1), offset, args in tiles:
+            x1, y1 = min(x1, self.width), min(y1, self.height)
+            row_bytes = (x1 - x0) * self.bands
+            stride = args[1] if len(args) > 1 and args[1] else row_bytes
+            tile = np.memmap(source, np.uint8, 'r', offset, (y1 - y0, stride))
+            rows = tile[:, :row_bytes].reshape(y1 - y0, x1 - x0, self.bands)
+            if len(args) > 2 and args[2] == -1:
+                rows = rows[::-1]
+            self.pixels[y0:y1, x0:x1] = rows
+            del tile, rows
+        self.flush()
+
+    def strip_rows(self, width=None):
+        """Rows per strip for rows of the given width (default: this image's)"""
+        return max(1, STRIP_BYTES // ((width or self.width) * self.bands))
+
+    def strips(self, rows=None):
+        """(top, bottom) row ranges covering the image"""
+        rows = rows or self.strip_rows()
+        for top in range(0, self.height, rows):
+            yield top, min(self.height, top + rows)
+
+    def read(self, top, bottom, left=0, right=None):
+        """Rows [top, bottom) and columns [left, right) as an in-memory PIL image"""
+        right = self.width if right is None else right
+        region = np.ascontiguousarray(self.pixels[top:bottom, left:right])
+        return Image.frombuffer(self.mode, (right - left, bottom - top), region,
+                                'raw', self.mode, 0, 1).copy()
+
+    def write(self, top, img, left=0):
+        """Store a PIL image with its top-left corner at (left, top)"""
+        width, height = img.size
+        self.pixels[top:top + height, left:left + width] = \
+            np.asarray(img).reshape(height, width, self.bands)
+
+    def reduce(self, factor):
+        """In-memory copy reduced by an integer factor, e.g. for display"""
+        rows = max(factor, self.strip_rows() // factor * factor)
+        result = None
+        for top, bottom in self.strips(rows):
+            reduced = self.read(top, bottom).reduce(factor)
+            if result is None:
+                result = Image.new(reduced.mode, (-(-self.width // factor),
+                                                  -(-self.height // factor)))
+            result.paste(reduced, (0, top // factor))
+        return result
+
+    def flush(self):
+        """Write dirty pages back to the file"""
+        if self.pixels.mode == 'r+':
+            self.pixels.flush()
+
+    def close(self):
+        """Unmap the file"""
+        self.flush()
+        self.pixels = None
+
+
+def map_strips(source, path, func, halo=0, progress=None):
+    """New image at path with func applied strip by strip.
+
+    func gets each strip, with halo extra rows of context on each side, and
+    returns an image of the same size; the context rows are dropped again.
+    """
+    target = None
+    for top, bottom in source.strips():
+        source_top = max(0, top - halo)
+        source_bottom = min(source.height, bottom + halo)
+        result = func(source.read(source_top, source_bottom))
+        if halo:
+            result = result.crop((0, top - source_top, source.width, bottom - source_top))
+        if target is None:
+            target = MappedImage.create(path, result.mode, source.size)
+        target.write(top, result)
+        if progress is not None:
+            progress(bottom / source.height)
+    target.flush()
+    return target
+
+
+def transpose(source, path, method, progress=None):
+    """New image at path transposed by an Image.Transpose method.
+
+    Transposes that swap the axes work in square tiles: a destination row
+    comes from a source column, so whole strips would read a thin slice of
+    every source row, scattered over the entire file, for each strip.
+    """
+    if method in SWAPS_AXES:
+        return _transpose_tiles(source, path, method, progress)
+    target = MappedImage.create(path, source.mode, source.size)
+    for top, bottom in target.strips():
+        if method in REVERSES_STRIPS:
+            first, last = source.height - bottom, source.height - top
+        else:
+            first, last = top, bottom
+        target.write(top, source.read(first, last).transpose(method))
+        if progress is not None:
+            progress(bottom / source.height)
+    target.flush()
+    return target
+
+
+def _transpose_tiles(source, path, method, progress):
+    width, height = source.size
+    target = MappedImage.create(path, source.mode, (height, width))
+    side = max(1, int((STRIP_BYTES // source.bands) ** 0.5))
+    corner = SWAPPED_CORNERS[method]
+    for y0 in range(0, height, side):
+        y1 = min(height, y0 + side)
+        # Source tiles go row by row, so each source page is read once
+        for x0 in range(0, width, side):
+            x1 = min(width, x0 + side)
+            left, top = corner(x0, y0, x1, y1, width, height)
+            target.write(top, source.read(y0, y1, x0, x1).transpose(method), left)
+        if progress is not None:
+            progress(y1 / height)
+    target.flush()
+    return target
+
+
+def crop(source, path, box, progress=None):
+    """New image at path holding the (x1, y1, x2, y2) box of source.
+
+    As with Image.crop, parts of the box outside the source are zero.
+    """
+    x1, y1, x2, y2 = box
+    target = MappedImage.create(path, source.mode, (x2 - x1, y2 - y1))
+    inside = engine.clip_box(box, source.size)
+    if inside is not None:
+        left, top, right, bottom = inside
+        for strip_top, strip_bottom in target.strips():
+            # Target rows of this strip that lie over the source
+            first = max(strip_top, top - y1)
+            last = min(strip_bottom, bottom - y1)
+            if first < last:
+                target.write(first, source.read(y1 + first, y1 + last, left, right), left - x1)
+            if progress is not None:
+                progress(strip_bottom / target.height)
+    target.flush()
+    return target
+
+
+def apply_chain(source, steps, path, progress=None):
+    """Apply (name, args) steps to a MappedImage, writing the result to path.
+
+    Fusable runs become one streamed pass of colour stages plus at most one
+    streamed transpose; kernel filters stream with a halo. Operations that
+    need the whole image at once (arbitrary rotation, contrast, drawing)
+    raise ValueError.
+    """
+    workdir = tempfile.mkdtemp(prefix='ignora-ooc-', dir=os.path.dirname(os.path.abspath(path)))
+    names = iter(range(len(steps) * 2 + 1))
+    current = source
+
+    def scratch():
+        return os.path.join(workdir, f'{next(names)}{RAW_EXTENSION}')
+
+    def replace(result):
+        nonlocal current
+        if current is not source:
+            current.close()
+            os.remove(current.path)
+        current = result
+
+    def materialise(pending):
+        if pending.stages:
+            replace(map_strips(current, scratch(), pending.apply_pixels))
+        if pending.transpose is not None:
+            replace(transpose(current, scratch(), pending.transpose))
+
+    try:
+        pending = pipeline.Pipeline()
+        for done, (name, args) in enumerate(steps, 1):
+            operation = engine.OPERATIONS.get(name)
+            if operation is None:
+                raise ValueError(f"Unknown operation: {name}")
+            if pipeline.can_fuse(operation):
+                pending.add(operation, args)
+            else:
+                materialise(pending)
+                pending = pipeline.Pipeline()
+                if operation in engine.KERNEL_FILTERS:
+                    image_filter = engine.KERNEL_FILTERS[operation]
+                    replace(map_strips(current, scratch(), lambda img: img.filter(image_filter),
+                                       engine.kernel_halo(image_filter)))
+                elif operation is engine.crop:
+                    replace(crop(current, scratch(), tuple(args[0])))
+                else:
+                    raise ValueError(f"{name} is not supported out of core")
+            if progress is not None:
+                progress(done / (len(steps) + 1))
+        materialise(pending)
+
+        if current is source:
+            replace(map_strips(source, scratch(), lambda img: img))
+        current.close()
+        os.replace(current.path, path)
+        result = MappedImage.open(path)
+        if progress is not None:
+            progress(1.0)
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _png_chunk(f, kind, data):
+    f.write(struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+
+def save(source, path, compress_level=6, progress=None):
+    """Write source to a PNG or raw file strip by strip; the write is atomic"""
+    extension = os.path.splitext(path)[1].lower()
+    partial = path + '.part'
+    try:
+        if extension == RAW_EXTENSION:
+            copy = MappedImage.create(partial, source.mode, source.size)
+            for top, bottom in source.strips():
+                copy.pixels[top:bottom] = source.pixels[top:bottom]
+                if progress is not None:
+                    progress(bottom / source.height)
+            copy.close()
+        elif extension == '.png':
+            _save_png(source, partial, compress_level, progress)
+        else:
+            raise ValueError("Out-of-core images can be saved as PNG or raw only")
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def _save_png(source, path, compress_level, progress):
+    mode = source.mode if source.mode in PNG_COLOR_TYPES else 'RGB'
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        _png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', source.width, source.height, 8,
+                                           PNG_COLOR_TYPES[mode], 0, 0, 0))
+        compressor = zlib.compressobj(compress_level)
+        for top, bottom in source.strips():
+            strip = source.read(top, bottom)
+            if strip.mode != mode:
+                strip = strip.convert(mode)
+            rows = np.asarray(strip).reshape(bottom - top, -1)
+            # Filter type 0 (none) in front of every row
+            scanlines = np.concatenate([np.zeros((bottom - top, 1), np.uint8), rows], axis=1)
+            data = compressor.compress(scanlines.tobytes())
+            if data:
+                _png_chunk(f, b'IDAT', data)
+            if progress is not None:
+                progress(bottom / source.height)
+        _png_chunk(f, b'IDAT', compressor.flush())
+        _png_chunk(f, b'IEND', b'')
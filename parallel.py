@@ -0,0 +1,158 @@
+"""Multi-core execution of kernel filters for Ignora.
+
+The image is copied once into a shared-memory buffer and split into
+horizontal strips. Worker processes filter each strip together with a halo of
+neighbouring rows, sized from the kernel, and write the interior straight into
+a shared output buffer, so strips are stitched in place and the result is
+identical to a single Image.filter call.
+
+Workers are started from a forkserver rather than forked, because the editor
+calls in from TaskRunner threads inside a running Tk process.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from multiprocessing import shared_memory
+import atexit
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+# Images smaller than this are filtered in-process; pool overhead dominates
+MIN_PIXELS = 4 * 1024 * 1024
+
+# Modes stored as 8 bits per band, which the shared buffers assume
+MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK')
+
+# Smallest strip handed to a worker
+MIN_STRIP_ROWS = 64
+
+# One pool per worker count, so a caller asking for a different count never
+# shuts down a pool another thread is still filtering on
+_pools = {}
+_pool_lock = threading.Lock()
+_enabled = True
+
+
+def cpu_count():
+    """Number of CPUs this process may use"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def get_pool(workers=None):
+    """Shared process pool for this many workers, created on first use"""
+    workers = workers or cpu_count()
+    # Filters on several TaskRunner threads may ask at once
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=multiprocessing.get_context(_start_method()))
+            _pools[workers] = pool
+        return pool
+
+
+def _start_method():
+    """Forking a threaded Tk process is unsafe; fall back to spawn without forkserver"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return 'forkserver'
+    return 'spawn'
+
+
+def shutdown_pool():
+    """Stop the worker processes"""
+    with _pool_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(cancel_futures=True)
+
+
+atexit.register(shutdown_pool)
+
+
+def disable():
+    """Filter in-process from now on, e.g. inside a worker of another pool"""
+    global _enabled
+    _enabled = False
+
+
+def can_parallelize(img, workers=None):
+    """Whether filtering img across processes is supported and worthwhile"""
+    return (_enabled
+            and img.mode in MODES
+            and img.width * img.height >= MIN_PIXELS
+            and (workers or cpu_count()) > 1)
+
+
+def _filter_strip(source_name, target_name, shape, mode, image_filter, top, bottom, halo):
+    """Worker: filter rows [top, bottom) of the shared source into the target"""
+    source = shared_memory.SharedMemory(name=source_name)
+    target = shared_memory.SharedMemory(name=target_name)
+    try:
+        height, width, bands = shape
+        source_pixels = np.ndarray(shape, np.uint8, source.buf)
+        target_pixels = np.ndarray(shape, np.uint8, target.buf)
+
+        source_top = max(0, top - halo)
+        source_bottom = min(height, bottom + halo)
+        rows = source_pixels[source_top:source_bottom]
+        strip = Image.frombuffer(mode, (width, source_bottom - source_top), rows,
+                                 'raw', mode, 0, 1)
+        filtered = np.asarray(strip.filter(image_filter)).reshape(-1, width, bands)
+        target_pixels[top:bottom] = filtered[top - source_top:bottom - source_top]
+
+        # Views into the shared buffers must be gone before closing them
+        del source_pixels, target_pixels, rows, strip, filtered
+    finally:
+        source.close()
+        target.close()
+
+
+def filter_in_parallel(img, image_filter, halo, progress=None, workers=None):
+    """Apply a kernel filter with strips spread over a process pool.
+
+    progress(fraction) is called as strips complete; if it raises, queued
+    strips are cancelled and the exception propagates.
+    """
+    workers = workers or cpu_count()
+    width, height = img.size
+    bands = len(img.getbands())
+    shape = (height, width, bands)
+    nbytes = height * width * bands
+    # A few strips per worker keeps the pool busy when strips finish unevenly
+    strip_rows = max(MIN_STRIP_ROWS, -(-height // (workers * 4)))
+
+    source = shared_memory.SharedMemory(create=True, size=nbytes)
+    target = shared_memory.SharedMemory(create=True, size=nbytes)
+    try:
+        source.buf[:nbytes] = img.tobytes()
+        pool = get_pool(workers)
+        futures = [pool.submit(_filter_strip, source.name, target.name, shape, img.mode,
+                               image_filter, top, min(height, top + strip_rows), halo)
+                   for top in range(0, height, strip_rows)]
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                if progress is not None:
+                    progress(done / len(futures))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise
+        # Copied out once, so the segment can be closed before returning
+        pixels = target.buf[:nbytes]
+        try:
+            return Image.frombytes(img.mode, img.size, pixels)
+        finally:
+            pixels.release()
+    finally:
+        source.close()
+        source.unlink()
+        target.close()
+        target.unlink()
@@ -0,0 +1,212 @@
+"""Lazily evaluated, fused chains of operations for Ignora.
+
+A Pipeline records operations instead of running them and folds them as they
+arrive: the eight flips and right-angle rotations form the dihedral group of
+the square, so any run of them is one Image.transpose call; per-band point
+operations compose into one lookup table; colour matrices compose into one
+matrix. Pixel operations commute with transposes, so a whole fusable chain
+costs at most one pass per stage kind. Anything else forces materialisation.
+
+Transposes and lookup tables fuse exactly. Colour matrices compose in
+floating point, where running the operations one by one rounds to 8 bits
+after each, so fused results are within a few levels (rounding) of the
+sequential ones rather than identical.
+"""
+import numpy as np
+from PIL import Image
+
+import colormatrix
+import engine
+
+T = Image.Transpose
+
+# The dihedral group, with None as the identity
+DIHEDRAL = (None, T.FLIP_LEFT_RIGHT, T.FLIP_TOP_BOTTOM, T.ROTATE_90,
+            T.ROTATE_180, T.ROTATE_270, T.TRANSPOSE, T.TRANSVERSE)
+
+# Transform operations and the group element each one is
+TRANSPOSES = {
+    engine.flip_horizontal: T.FLIP_LEFT_RIGHT,
+    engine.flip_vertical: T.FLIP_TOP_BOTTOM,
+    engine.rotate_90: T.ROTATE_90,
+    engine.rotate_180: T.ROTATE_180,
+    engine.rotate_270: T.ROTATE_270,
+    engine.transpose: T.TRANSPOSE,
+}
+
+def _transposed(method, img):
+    return img if method is None else img.transpose(method)
+
+
+def _build_products():
+    # Work the group table out by transposing a tiny image with distinct pixels
+    marker = Image.frombytes('L', (3, 2), bytes(range(6)))
+    results = {_transposed(m, marker).tobytes() + bytes(_transposed(m, marker).size): m
+               for m in DIHEDRAL}
+    products = {}
+    for first in DIHEDRAL:
+        for second in DIHEDRAL:
+            image = _transposed(second, _transposed(first, marker))
+            products[first, second] = results[image.tobytes() + bytes(image.size)]
+    return products
+
+
+# products[a, b] is the single transpose equal to a followed by b
+PRODUCTS = _build_products()
+
+
+def compose_transposes(first, second):
+    """Single transpose method equal to first followed by second"""
+    return PRODUCTS[first, second]
+
+
+def inverse_transpose(method):
+    """Transpose method undoing method"""
+    return next(m for m in DIHEDRAL if PRODUCTS[method, m] is None)
+
+
+def brightness_table(value):
+    """Lookup table for engine.adjust_brightness(img, value)"""
+    # Image.blend works in single precision, so round the factor the same way
+    factor = np.float32(1.0 + value / 100.0)
+    return [engine._clip8(float(np.float32(v) * factor)) for v in range(256)]
+
+
+# Per-band point operations, as functions from args to a 256-entry table
+POINT_OPERATIONS = {
+    engine.invert: lambda: [255 - v for v in range(256)],
+    engine.adjust_brightness: brightness_table,
+}
+
+
+def can_fuse(operation):
+    """Whether a Pipeline can take operation without materialising"""
+    return (operation in TRANSPOSES or operation in POINT_OPERATIONS
+            or operation in engine.COLOR_OPERATIONS)
+
+
+class LookupStage:
+    """One lookup table applied to every colour band; alpha is left alone"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def then(self, table):
+        """Append another table; the composition is exact, clamping included"""
+        self.table = [table[v] for v in self.table]
+
+    def apply(self, img):
+        img = colormatrix.editable(img)
+        identity = list(range(256))
+        return img.point([v for band in img.getbands()
+                          for v in (identity if band == 'A' else self.table)])
+
+    def inverse(self):
+        """Stage undoing this one, or None if the table isn't a permutation"""
+        if sorted(self.table) != list(range(256)):
+            return None
+        table = [0] * 256
+        for v, mapped in enumerate(self.table):
+            table[mapped] = v
+        return LookupStage(table)
+
+
+class MatrixStage:
+    """One colour matrix"""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def apply(self, img):
+        return self.matrix.apply(img)
+
+    def inverse(self):
+        return None
+
+
+class Pipeline:
+    """Operations recorded lazily and fused into as few passes as possible.
+
+    Colour stages run in the order they were added and the accumulated
+    transpose runs once at the end. The pixels are within a few levels
+    (rounding) of running every operation in turn.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.transpose = None
+        self.operations = []
+
+    def __len__(self):
+        return len(self.operations)
+
+    def add(self, operation, args=()):
+        """Record operation(img, *args); it must satisfy can_fuse()"""
+        if operation in TRANSPOSES:
+            self.transpose = compose_transposes(self.transpose, TRANSPOSES[operation])
+        elif operation in POINT_OPERATIONS:
+            table = POINT_OPERATIONS[operation](*args)
+            if self.stages and isinstance(self.stages[-1], LookupStage):
+                self.stages[-1].then(table)
+            else:
+                self.stages.append(LookupStage(table))
+        elif operation in engine.COLOR_OPERATIONS:
+            matrix = engine.COLOR_OPERATIONS[operation](*args)
+            last = self.stages[-1] if self.stages else None
+            # Clamping after a matrix can't be composed with the next one
+            if isinstance(last, MatrixStage) and not last.matrix.clips():
+                last.matrix = last.matrix.then(matrix)
+            else:
+                self.stages.append(MatrixStage(matrix))
+        else:
+            raise ValueError(f"{operation.__name__} can't be fused")
+        self.operations.append((operation, tuple(args)))
+
+    def apply_pixels(self, img):
+        """Run only the colour stages; useful on strips of a larger image"""
+        for stage in self.stages:
+            img = stage.apply(img)
+        return img
+
+    def apply(self, img):
+        """Materialise: run the fused stages on img and return the result"""
+        img = self.apply_pixels(img)
+        if self.transpose is not None:
+            img = img.transpose(self.transpose)
+        return img
+
+    def inverse(self, mode):
+        """Pipeline undoing this one for images of mode, or None if it's lossy"""
+        # Lookup tables convert other modes, so they don't come back as they were
+        if self.stages and mode not in colormatrix.MODES:
+            return None
+        stages = [stage.inverse() for stage in reversed(self.stages)]
+        if None in stages:
+            return None
+        inverse = Pipeline()
+        inverse.stages = stages
+        inverse.transpose = inverse_transpose(self.transpose)
+        return inverse
+
+
+def apply_chain(img, steps):
+    """Apply (name, args) steps in order, fusing runs of fusable operations.
+
+    The pending pipeline is only materialised when a step that can't be
+    fused comes along, and at the end.
+    """
+    pending = Pipeline()
+    for name, args in steps:
+        operation = engine.OPERATIONS.get(name)
+        if operation is None:
+            raise ValueError(f"Unknown operation: {name}")
+        if can_fuse(operation):
+            pending.add(operation, args)
+            continue
+        if pending:
+            img = pending.apply(img)
+            pending = Pipeline()
+        img = operation(img, *args)
+    if pending:
+        img = pending.apply(img)
+    return img
@@ -0,0 +1,121 @@
+"""Recipes: edits recorded in the editor, saved as JSON and replayed anywhere.
+
+A recipe is an ordered list of [operation name, args] steps over
+engine.OPERATIONS. Replaying one is pipeline.apply_chain, so the same file
+works in the editor, headless, or across a process pool through the batch
+command.
+"""
+import json
+
+import engine
+from lazy import LazyModule
+
+pipeline = LazyModule('pipeline')
+
+# Written into every recipe file so loaders can recognise and upgrade it
+FORMAT = 'ignora-recipe'
+VERSION = 1
+
+
+def step(operation, args=()):
+    """Recipe step for operation(img, *args); args must be JSON-serialisable"""
+    return [engine.OPERATION_NAMES[operation], list(args)]
+
+
+class Recipe:
+    """An ordered chain of registered operations and their arguments"""
+
+    def __init__(self, steps=()):
+        self.steps = [[name, list(args)] for name, args in steps]
+
+    def __len__(self):
+        return len(self.steps)
+
+    def apply(self, img):
+        """Replay the recipe on img and return the result"""
+        return pipeline.apply_chain(img, self.steps)
+
+    def to_dict(self):
+        """JSON-ready representation"""
+        return {'format': FORMAT, 'version': VERSION,
+                'steps': [{'op': name, 'args': args} for name, args in self.steps]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a recipe from to_dict() output, checking every operation exists"""
+        if data.get('format') != FORMAT:
+            raise ValueError("Not an Ignora recipe")
+        if data.get('version', VERSION) > VERSION:
+            raise ValueError(f"Recipe version {data['version']} is newer than this program")
+        steps = []
+        for entry in data['steps']:
+            if entry['op'] not in engine.OPERATIONS:
+                raise ValueError(f"Unknown operation in recipe: {entry['op']}")
+            steps.append([entry['op'], entry.get('args', [])])
+        return cls(steps)
+
+    def save(self, path):
+        """Write the recipe to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Read a recipe written by save()"""
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+class RecipeRecorder:
+    """Steps behind each undoable edit, kept in step with the History stacks.
+
+    Every history entry gets one group of steps, so undo and redo move groups
+    between the stacks exactly as History moves entries. A reset to the
+    original image is recorded as a group of its own that the recipe starts
+    after.
+    """
+
+    RESET = None
+
+    def __init__(self):
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def record(self, steps):
+        """Add the steps of a new edit and forget the redo groups"""
+        self.undo_stack.append(steps)
+        self.redo_stack.clear()
+
+    def reset(self):
+        """Record a return to the original image"""
+        self.record(self.RESET)
+
+    def drop_last(self):
+        """Forget the newest group, for an edit that never landed"""
+        if self.undo_stack:
+            self.undo_stack.pop()
+
+    def undo(self):
+        """Move the newest group to the redo stack"""
+        if self.undo_stack:
+            self.redo_stack.append(self.undo_stack.pop())
+
+    def redo(self):
+        """Move the last undone group back"""
+        if self.redo_stack:
+            self.undo_stack.append(self.redo_stack.pop())
+
+    def clear(self):
+        """Forget everything, e.g. when another image is opened"""
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    def recipe(self):
+        """Recipe reproducing the current image from the original"""
+        steps = []
+        for group in self.undo_stack:
+            if group is self.RESET:
+                steps = []
+            else:
+                steps.extend(group)
+        return Recipe(steps)
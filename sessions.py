@@ -0,0 +1,103 @@
+"""Recently opened images kept decoded, for switching between files.
+
+When the editor moves to another file, the state of the one it leaves (the
+decoded original, the edited image, the display pyramid, undo history and
+recipe) is kept in a SessionCache. Reopening that file while the cache holds
+it restores everything at once instead of decoding it again. Sessions are
+evicted least recently used first once their total size passes a byte
+budget, and dropped if the file has changed on disk since it was decoded.
+"""
+from collections import OrderedDict
+import os
+
+from history import image_nbytes
+
+# Default memory for cached sessions, not counting the open one
+DEFAULT_BUDGET = 2 * 1024 * 1024 * 1024
+
+
+def file_stamp(path):
+    """(mtime, size) of path, to tell whether it changed since it was read"""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Session:
+    """Everything the editor keeps about one open file"""
+
+    def __init__(self, path, stamp, original_image, current_image, image_version,
+                 pyramid, history, recorder, zoom_factor):
+        self.path = path
+        self.stamp = stamp
+        self.original_image = original_image
+        self.current_image = current_image
+        self.image_version = image_version
+        self.pyramid = pyramid
+        self.history = history
+        self.recorder = recorder
+        self.zoom_factor = zoom_factor
+
+    @property
+    def nbytes(self):
+        """Memory held by the session's images, display levels and history"""
+        total = image_nbytes(self.current_image) + self.pyramid.nbytes + self.history.nbytes
+        if self.original_image is not self.current_image:
+            total += image_nbytes(self.original_image)
+        return total
+
+    def close(self):
+        """Release the history's spill files"""
+        self.history.close()
+
+
+class SessionCache:
+    """Sessions keyed by absolute path, evicted LRU by total bytes"""
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.sessions = OrderedDict()
+
+    @property
+    def nbytes(self):
+        """Memory held by all cached sessions"""
+        return sum(session.nbytes for session in self.sessions.values())
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.sessions
+
+    def put(self, session):
+        """Keep session as the most recent, evicting the oldest if over budget"""
+        key = os.path.abspath(session.path)
+        previous = self.sessions.pop(key, None)
+        if previous is not None and previous is not session:
+            previous.close()
+        self.sessions[key] = session
+        total = self.nbytes
+        # A session bigger than the whole budget isn't kept either
+        while self.sessions and total > self.budget:
+            _, oldest = self.sessions.popitem(last=False)
+            total -= oldest.nbytes
+            oldest.close()
+
+    def take(self, path):
+        """Remove and return the session of path, or None if absent or stale"""
+        session = self.sessions.pop(os.path.abspath(path), None)
+        if session is None:
+            return None
+        try:
+            stamp = file_stamp(path)
+        except OSError:
+            stamp = None
+        if stamp != session.stamp:
+            session.close()
+            return None
+        return session
+
+    def clear(self):
+        """Forget every session"""
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
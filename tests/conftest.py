@@ -0,0 +1,59 @@
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# The modules live at the top of the repository, next to main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def noise_image(mode, size=(160, 120), seed=0):
+    """Random pixels in mode, so rounding differences can't hide"""
+    bands = len(Image.new(mode, (1, 1)).getbands())
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (size[1], size[0], bands), dtype=np.uint8)
+    return Image.fromarray(pixels[:, :, 0] if bands == 1 else pixels, mode)
+
+
+def max_difference(a, b):
+    """Largest per-channel difference between two images of the same size"""
+    assert a.size == b.size and a.mode == b.mode
+    return int(np.abs(np.asarray(a, dtype=int) - np.asarray(b, dtype=int)).max())
+
+
+class FakeRoot:
+    """Stand-in for a Tk root: after() callbacks run when pump() is called"""
+
+    def __init__(self):
+        self.callbacks = {}
+        self.ids = itertools.count()
+
+    def after(self, ms, func, *args):
+        after_id = next(self.ids)
+        self.callbacks[after_id] = (func, args)
+        return after_id
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, after_id):
+        self.callbacks.pop(after_id, None)
+
+    def pump(self, until, timeout=5):
+        """Run scheduled callbacks, as the main loop would, until until() is true"""
+        deadline = time.monotonic() + timeout
+        while not until():
+            assert time.monotonic() < deadline, "main loop never got there"
+            callbacks, self.callbacks = self.callbacks, {}
+            for func, args in callbacks.values():
+                func(*args)
+            time.sleep(0.001)
+
+
+@pytest.fixture
+def rgb_image():
+    return noise_image('RGB')
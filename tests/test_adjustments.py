@@ -0,0 +1,47 @@
+import pytest
+
+import engine
+from conftest import max_difference, noise_image
+
+# Fused adjustments round once where the separate steps round after each
+TOLERANCE = 4
+
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('brightness, contrast, saturation', [
+    (30, 0, 0), (0, -40, 0), (0, 0, 60), (-30, 50, -80), (80, 80, 100), (80, -80, 50),
+])
+def test_adjustments_within_tolerance_of_separate_steps(mode, brightness, contrast, saturation):
+    img = noise_image(mode)
+    expected = img
+    for adjust, value in ((engine.adjust_brightness, brightness),
+                          (engine.adjust_contrast, contrast),
+                          (engine.adjust_saturation, saturation)):
+        if value:
+            expected = adjust(expected, value)
+    fused = engine.Adjustments(brightness, contrast, saturation).apply(img)
+    assert max_difference(fused, expected) <= TOLERANCE
+
+
+def test_identity_adjustments_copy(rgb_image):
+    result = engine.Adjustments().apply(rgb_image)
+    assert result is not rgb_image
+    assert max_difference(result, rgb_image) == 0
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_strips_match_whole_image(mode):
+    img = noise_image(mode, size=(90, 200))
+    adjustments = engine.Adjustments(25, -30, 40)
+    fractions = []
+    result = adjustments.apply(img, progress=fractions.append, strip_rows=64)
+    assert max_difference(result, adjustments.apply(img)) == 0
+    assert fractions == [64 / 200, 128 / 200, 192 / 200, 1.0]
+
+
+def test_cancel_between_strips(rgb_image):
+    def progress(fraction):
+        raise engine.Cancelled()
+
+    with pytest.raises(engine.Cancelled):
+        engine.Adjustments(10, 10, 10).apply(rgb_image, progress=progress, strip_rows=16)
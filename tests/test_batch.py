@@ -0,0 +1,81 @@
+import io
+import os
+
+import pytest
+
+import batch
+import engine
+from conftest import noise_image
+
+
+@pytest.fixture
+def photos(tmp_path):
+    folder = tmp_path / 'in'
+    folder.mkdir()
+    for name in ('a.png', 'b.png', 'c.png'):
+        noise_image('RGB', size=(40, 30)).save(folder / name)
+    return folder
+
+
+def run(photos, output, **kwargs):
+    out = io.StringIO()
+    failures = batch.run(engine.find_images(str(photos)), str(output), [['invert', []]],
+                         workers=1, out=out, **kwargs)
+    return failures, out.getvalue()
+
+
+def test_resume_skips_finished_files(photos, tmp_path):
+    run(photos, tmp_path / 'out')
+    failures, report = run(photos, tmp_path / 'out')
+    assert failures == 0
+    assert "Skipping 3 file(s)" in report
+
+
+def test_changed_save_settings_reprocess(photos, tmp_path):
+    run(photos, tmp_path / 'out', save_settings={'compress_level': 6})
+    _, report = run(photos, tmp_path / 'out', save_settings={'compress_level': 1})
+    assert "Skipping" not in report
+    assert "Processed 3" in report
+
+
+def _crash(source, target, steps, save_settings, out_of_core=None):
+    os._exit(1)
+
+
+def test_dead_worker_lists_unfinished_files(photos, tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'process_file', _crash)
+    failures, report = run(photos, tmp_path / 'out')
+    assert failures == 3
+    assert "did not finish" in report
+    assert all(name in report for name in ('a.png', 'b.png', 'c.png'))
+    journal = tmp_path / 'out' / batch.JOURNAL_NAME
+    assert not journal.exists() or journal.read_text() == ''
+
+
+@pytest.mark.parametrize('content', [None, '{not json', '[1, 2]'])
+def test_bad_recipe_is_a_usage_error(tmp_path, content, capsys):
+    path = tmp_path / 'recipe.json'
+    if content is not None:
+        path.write_text(content)
+    with pytest.raises(SystemExit) as exit_info:
+        batch.main([str(tmp_path), '-o', str(tmp_path / 'out'), '--recipe', str(path)])
+    assert exit_info.value.code == 2
+    assert '--recipe' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('op', ['brightness=abc', 'crop=1,2', 'crop=10,10,5,20', 'grayscale=3',
+                                'rotate'])
+def test_bad_arguments_are_rejected_before_the_pool(photos, tmp_path, monkeypatch, capsys, op):
+    def run(*args, **kwargs):
+        raise AssertionError("the pool started")
+
+    monkeypatch.setattr(batch, 'run', run)
+    with pytest.raises(SystemExit) as exit_info:
+        batch.main([str(photos), '-o', str(tmp_path / 'out'), '--op', op])
+    assert exit_info.value.code == 2
+    assert op.partition('=')[0] in capsys.readouterr().err
+
+
+def test_good_arguments_pass_the_check():
+    for op in ('brightness=20', 'crop=0,0,800,600', 'rotate=15', 'adjust=10,-5,20', 'invert'):
+        batch.check_step(*batch.parse_step(op))
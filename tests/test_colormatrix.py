@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+import colormatrix
+from conftest import max_difference, noise_image
+
+# Sepia as it was before the colour-matrix engine
+OLD_SEPIA = np.array([[0.393, 0.769, 0.189],
+                      [0.349, 0.686, 0.168],
+                      [0.272, 0.534, 0.131]])
+
+
+def test_matches_the_operations_it_replaced(rgb_image):
+    grayscale = colormatrix.GRAYSCALE.apply(rgb_image)
+    assert max_difference(grayscale, rgb_image.convert('L').convert('RGB')) <= 1
+    old_sepia = np.clip(np.asarray(rgb_image).dot(OLD_SEPIA.T), 0, 255).astype(np.uint8)
+    assert max_difference(colormatrix.SEPIA.apply(rgb_image), Image.fromarray(old_sepia)) <= 1
+    assert max_difference(colormatrix.INVERT.apply(rgb_image), ImageOps.invert(rgb_image)) == 0
+
+
+def test_gray_preserving_matrices_keep_l_images_gray():
+    img = noise_image('L')
+    inverted = colormatrix.INVERT.apply(img)
+    assert inverted.mode == 'L'
+    assert max_difference(inverted, ImageOps.invert(img)) == 0
+    assert max_difference(colormatrix.GRAYSCALE.apply(img), img) == 0
+
+
+def test_colouring_an_l_image_makes_it_rgb():
+    img = noise_image('L')
+    sepia = colormatrix.SEPIA.apply(img)
+    assert sepia.mode == 'RGB'
+    assert max_difference(sepia, colormatrix.SEPIA.apply(img.convert('RGB'))) == 0
+
+
+@pytest.mark.parametrize('mode', ['LA', 'RGBA'])
+@pytest.mark.parametrize('matrix', [colormatrix.GRAYSCALE, colormatrix.SEPIA,
+                                    colormatrix.INVERT])
+def test_alpha_is_preserved(mode, matrix):
+    img = noise_image(mode)
+    result = matrix.apply(img)
+    assert result.mode in ('LA', 'RGBA') and result.mode[-1] == 'A'
+    assert max_difference(result.getchannel('A'), img.getchannel('A')) == 0
+
+
+def test_other_modes_are_edited_as_rgb():
+    palette = noise_image('RGB').quantize(32)
+    assert colormatrix.INVERT.apply(palette).mode == 'RGB'
+    assert colormatrix.INVERT.apply(noise_image('RGB').convert('CMYK')).mode == 'RGB'
+
+
+# Colour reads alpha and alpha is rescaled, so only the NumPy path can apply it
+ALPHA_MATRIX = colormatrix.ColorMatrix([
+    [0.8, 0.1, 0.0, 0.1, 5],
+    [0.0, 0.9, 0.0, 0.1, 0],
+    [0.1, 0.0, 0.7, 0.2, -3],
+    [0.0, 0.0, 0.0, 0.5, 20],
+])
+
+
+def test_matrix_touching_alpha_goes_through_chunks(monkeypatch):
+    img = noise_image('RGBA', size=(97, 61))
+    assert not ALPHA_MATRIX.keeps_alpha()
+    whole = ALPHA_MATRIX.apply(img)
+    # Chunks of a few rows, not a multiple of the height
+    monkeypatch.setattr(colormatrix, 'CHUNK_PIXELS', 97 * 7)
+    chunked = ALPHA_MATRIX.apply(img)
+    assert max_difference(chunked, whole) == 0
+
+    pixels = np.asarray(img, dtype=np.float64)
+    expected = pixels @ ALPHA_MATRIX.matrix[:, :4].T + ALPHA_MATRIX.matrix[:, 4]
+    expected = np.clip(np.floor(expected + 0.5), 0, 255).astype(np.uint8)
+    assert max_difference(chunked, Image.fromarray(expected, 'RGBA')) <= 1
+
+
+def test_composed_matrix_matches_applying_in_turn(rgb_image):
+    # Neither clips, so folding them together only changes rounding
+    first, second = colormatrix.saturation(0.5), colormatrix.INVERT
+    sequential = second.apply(first.apply(rgb_image))
+    composed = colormatrix.compose(first, second).apply(rgb_image)
+    assert max_difference(composed, sequential) <= 1
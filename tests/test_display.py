@@ -0,0 +1,38 @@
+import pytest
+
+import benchmark
+import display
+import engine
+from conftest import max_difference, noise_image
+
+
+@pytest.mark.parametrize('zoom', [None, 1.0])
+def test_benchmark_renders_the_visible_tiles(zoom):
+    img = noise_image('RGB', size=(2400, 1800))
+    scale = zoom or engine.display_scale(img.size, benchmark.DISPLAY_SIZE)
+    visible = (min(int(img.width * scale), benchmark.DISPLAY_SIZE[0]),
+               min(int(img.height * scale), benchmark.DISPLAY_SIZE[1]))
+    tiles = benchmark.render_display(img, zoom)
+    assert all(tile.width <= display.TILE_SIZE and tile.height <= display.TILE_SIZE
+               for tile in tiles)
+    # Tiles overhang the view at its edges but never miss part of it
+    assert sum(tile.width * tile.height for tile in tiles) >= visible[0] * visible[1]
+
+
+def test_tiles_match_a_whole_resize():
+    # Each tile rounds its own fractional source box, so edges may be a level off
+    img = noise_image('RGB', size=(1000, 700))
+    scaled_size = (333, 233)
+    whole = img.resize(scaled_size, display.Image.Resampling.LANCZOS)
+    for col, row in display.tiles_covering(0, 0, *scaled_size, tile_size=100):
+        bounds = (col * 100, row * 100,
+                  min(scaled_size[0], col * 100 + 100), min(scaled_size[1], row * 100 + 100))
+        tile = display.resample_tile(img, scaled_size, bounds)
+        assert max_difference(tile, whole.crop(bounds)) <= 1
+
+
+def test_benchmark_times_the_slider_path(tmp_path):
+    img = noise_image('RGB', size=(64, 48))
+    cases = dict(benchmark.operation_cases(img, str(tmp_path)))
+    expected = engine.Adjustments(20, 20, 20).apply(img)
+    assert max_difference(cases['adjust'](img), expected) == 0
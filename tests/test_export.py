@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import export
+from conftest import noise_image
+
+
+def test_existing_outputs_flags_the_opened_file(tmp_path):
+    source = tmp_path / 'photo.tiff'
+    noise_image('RGB', size=(40, 30)).save(source)
+    existing, overwrites_source = export.existing_outputs(
+        str(tmp_path), 'photo', export.DEFAULT_PRESETS, str(source))
+    assert existing == [str(source)]
+    assert overwrites_source
+
+
+def test_existing_outputs_elsewhere(tmp_path):
+    source = tmp_path / 'photo.tiff'
+    noise_image('RGB', size=(40, 30)).save(source)
+    folder = tmp_path / 'out'
+    folder.mkdir()
+    assert export.existing_outputs(str(folder), 'photo', export.DEFAULT_PRESETS,
+                                   str(source)) == ([], False)
+    (folder / 'photo_512.jpg').write_bytes(b'')
+    existing, overwrites_source = export.existing_outputs(
+        str(folder), 'photo', export.DEFAULT_PRESETS, str(source))
+    assert existing == [str(folder / 'photo_512.jpg')]
+    assert not overwrites_source
+
+
+def test_presets_writing_the_same_file_are_rejected(tmp_path):
+    path = tmp_path / 'presets.json'
+    presets = list(export.DEFAULT_PRESETS) + [export.Preset("Other thumbnail", 256, 'JPG', '_512')]
+    export.save_presets(presets, str(path))
+    with pytest.raises(ValueError, match="512px web thumbnail"):
+        export.load_presets(str(path))
+    with pytest.raises(ValueError):
+        export.export(noise_image('RGB', size=(40, 30)), str(tmp_path), 'photo', presets)
+    assert not list(tmp_path.glob('photo*'))
+
+
+def test_distinct_presets_load(tmp_path):
+    path = tmp_path / 'presets.json'
+    export.save_presets(export.DEFAULT_PRESETS, str(path))
+    loaded = export.load_presets(str(path))
+    assert [preset.to_dict() for preset in loaded] == json.loads(path.read_text())
@@ -0,0 +1,146 @@
+import pytest
+from PIL import Image
+
+import engine
+from history import History, InverseEntry
+from conftest import max_difference, noise_image
+
+
+def same_image(a, b):
+    return (a.mode == b.mode and max_difference(a, b) == 0
+            and a.getpalette() == b.getpalette() and a.info == b.info)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_brush_patch_round_trip(compress):
+    history = History(compress=compress)
+    image = noise_image('RGB')
+    before = image.copy()
+    points = [(10, 10), (60, 40), (90, 15)]
+    box = engine.clip_box(engine.line_bounds(points, 5), image.size)
+    history.record_patch(box, image.crop(box))
+    engine.draw_line(image, points, '#ff0000', 5)
+    after = image.copy()
+
+    image, changed = history.undo(image)
+    assert changed == box and same_image(image, before)
+    image, changed = history.redo(image)
+    assert changed == box and same_image(image, after)
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_crop_round_trip_keeps_palette_and_info(compress):
+    history = History(compress=compress)
+    before = noise_image('RGB').quantize(64)
+    before.info['dpi'] = (300, 300)
+    box = (20, 15, 110, 90)
+    image = engine.crop(before, box)
+    history.record(engine.crop, (box,), before)
+    cropped = image.copy()
+
+    image, changed = history.undo(image)
+    assert changed is None and same_image(image, before)
+    image, _ = history.redo(image)
+    assert same_image(image, cropped)
+
+
+def test_crop_stores_only_the_border():
+    history = History()
+    before = noise_image('L', size=(100, 100))
+    box = (10, 10, 90, 90)
+    history.record(engine.crop, (box,), before)
+    assert history.nbytes == 100 * 100 - 80 * 80
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_full_frame_round_trip(compress):
+    history = History(compress=compress)
+    before = noise_image('RGBA')
+    image = engine.blur(before)
+    history.record(engine.blur, (), before)
+    blurred = image.copy()
+
+    image, changed = history.undo(image)
+    assert changed is None and same_image(image, before)
+    image, _ = history.redo(image)
+    assert same_image(image, blurred)
+
+
+def frames(count, size=(100, 100)):
+    return [Image.new('L', size, value) for value in range(count)]
+
+
+def test_budget_drops_the_oldest_entries():
+    history = History(budget=25000, disk_budget=0)
+    images = frames(5)
+    for image in images[:-1]:
+        history.record_frame(image)
+    assert len(history.undo_stack) == 2
+    assert history.nbytes <= history.budget
+
+    image, _ = history.undo(images[-1])
+    assert image.getpixel((0, 0)) == 3
+    image, _ = history.undo(image)
+    assert image.getpixel((0, 0)) == 2
+    assert not history.can_undo()
+
+
+def test_newest_entry_is_kept_over_budget():
+    history = History(budget=1000, disk_budget=0)
+    history.record_frame(Image.new('L', (100, 100), 7))
+    assert history.can_undo()
+    image, _ = history.undo(Image.new('L', (100, 100)))
+    assert image.getpixel((0, 0)) == 7
+
+
+@pytest.mark.parametrize('compress, suffix', [(False, '.raw'), (True, '.zlib')])
+def test_spilled_frames_read_back(tmp_path, compress, suffix):
+    history = History(budget=15000, compress=compress, spill_dir=str(tmp_path))
+    images = [noise_image('L', size=(100, 100), seed=seed) for seed in range(4)]
+    for image in images[:-1]:
+        history.record_frame(image)
+    spilled = sorted(path.suffix for path in tmp_path.iterdir())
+    # The newest undo entry always stays in memory
+    assert spilled == [suffix, suffix]
+    assert history.nbytes <= history.budget and history.disk_nbytes > 0
+
+    image = images[-1]
+    for expected in reversed(images[:-1]):
+        image, _ = history.undo(image)
+        assert same_image(image, expected)
+    for expected in images[1:]:
+        image, _ = history.redo(image)
+        assert same_image(image, expected)
+
+
+def test_failed_spill_drops_old_entries_instead(tmp_path):
+    history = History(budget=25000, spill_dir=str(tmp_path / 'missing'))
+    images = frames(5)
+    for image in images[:-1]:
+        history.record_frame(image)
+    # Nothing could be written, so the oldest entries went and the rest stayed
+    assert history.disk_nbytes == 0
+    assert len(history.undo_stack) == 2 and history.nbytes <= history.budget
+    image, _ = history.undo(images[-1])
+    assert image.getpixel((0, 0)) == 3
+    image, _ = history.undo(image)
+    assert image.getpixel((0, 0)) == 2
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('operation', [
+    engine.flip_horizontal, engine.flip_vertical, engine.rotate_90, engine.rotate_180,
+    engine.rotate_270, engine.transpose, engine.invert])
+def test_lossless_transform_round_trip(operation, mode):
+    history = History()
+    before = noise_image(mode, size=(90, 60))
+    image = operation(before)
+    history.record(operation, (), before)
+    after = image.copy()
+    # Undone by its inverse, so nothing is stored
+    assert isinstance(history.undo_stack[-1], InverseEntry) and history.nbytes == 0
+
+    image, _ = history.undo(image)
+    assert same_image(image, before)
+    image, _ = history.redo(image)
+    assert same_image(image, after)
@@ -0,0 +1,69 @@
+from collections import deque
+
+import pytest
+
+import latency
+from conftest import FakeRoot
+
+
+@pytest.mark.parametrize('fraction, expected', [
+    (0.0, 1), (0.01, 1), (0.07, 7), (0.5, 50), (0.95, 95), (0.99, 99), (1.0, 100)])
+def test_nearest_rank_percentile(fraction, expected):
+    assert latency.percentile(list(range(1, 101)), fraction) == expected
+
+
+def test_percentile_of_few_samples():
+    assert latency.percentile([4.0], 0.99) == 4.0
+    assert latency.percentile([1, 2], 0.5) == 1
+    assert latency.percentile([1, 2, 3, 4], 0.5) == 2
+    assert latency.percentile([1, 2, 3, 4], 0.51) == 3
+
+
+def monitor_with(samples_ms):
+    monitor = latency.LatencyMonitor(FakeRoot())
+    monitor.samples['draw'] = deque(milliseconds / 1000 for milliseconds in samples_ms)
+    return monitor
+
+
+def test_summary_in_milliseconds():
+    monitor = monitor_with(reversed(range(1, 201)))
+    summary = monitor.summary('draw')
+    assert summary['count'] == 200
+    assert summary['p50'] == pytest.approx(100)
+    assert summary['p95'] == pytest.approx(190)
+    assert summary['p99'] == pytest.approx(198)
+    assert summary['max'] == pytest.approx(200)
+    assert monitor.summary('zoom') is None
+
+
+def test_histogram_buckets_by_upper_edge():
+    monitor = monitor_with([1, 7.9, 8, 20, 33, 99, 2000])
+    counts = dict(monitor.histogram('draw'))
+    assert counts['<8 ms'] == 2
+    assert counts['<16 ms'] == 1
+    assert counts['<33 ms'] == 1
+    assert counts['<50 ms'] == 1
+    assert counts['<100 ms'] == 1
+    assert counts['>=1000 ms'] == 1
+    assert sum(counts.values()) == 7
+
+
+def test_sample_waits_for_the_paint_passes():
+    root = FakeRoot()
+    monitor = latency.LatencyMonitor(root)
+    monitor.start()
+    monitor.begin('slider')
+    passes = 0
+
+    def painted():
+        nonlocal passes
+        passes += 1
+        return 'slider' in monitor.samples
+
+    root.pump(painted)
+    # Checked before each idle pass and once more after the last
+    assert passes == latency.PAINT_PASSES + 1
+    monitor.stop()
+    assert monitor.beat_id is None
+    monitor.begin('slider')
+    assert len(monitor.samples['slider']) == 1
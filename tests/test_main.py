@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import engine
+import main
+
+
+class StatusBar:
+    text = None
+
+    def config(self, text):
+        self.text = text
+
+
+def editor(task=None, adjust_waiting=()):
+    """Just the state queue_operation reads; run_queued must not be reached"""
+    def run_queued():
+        raise AssertionError("queued operations ran while the editor was busy")
+
+    return SimpleNamespace(queued=None, queued_message=None, task=task,
+                           adjust_waiting=list(adjust_waiting), status_bar=StatusBar(),
+                           run_queued=run_queued)
+
+
+def test_operations_queue_behind_a_waiting_adjustment():
+    state = editor(adjust_waiting=[lambda: None])
+    main.ImageEditor.queue_operation(state, engine.flip_horizontal, "Flipped", ())
+    main.ImageEditor.queue_operation(state, engine.invert, "Inverted", ())
+    assert len(state.queued) == 2 and state.queued_message == "Inverted"
+    assert state.status_bar.text == "2 operation(s) queued behind Applying adjustments"
+
+
+def test_operations_queue_behind_a_running_task():
+    state = editor(task=SimpleNamespace(description="Loading photo.jpg"))
+    main.ImageEditor.queue_operation(state, engine.rotate_90, "Rotated", ())
+    assert state.status_bar.text == "1 operation(s) queued behind Loading photo.jpg"
@@ -0,0 +1,113 @@
+import io
+import threading
+
+import pytest
+from PIL import Image
+
+import batch
+import engine
+import outofcore
+import pipeline
+from conftest import max_difference, noise_image
+
+
+@pytest.fixture
+def small_strips(monkeypatch):
+    # A few hundred bytes per strip, so even tiny images take many strips and tiles
+    monkeypatch.setattr(outofcore, 'STRIP_BYTES', 3 * 7 * 7 + 5)
+
+
+@pytest.mark.parametrize('method', list(Image.Transpose))
+def test_transposes_match_pillow(tmp_path, small_strips, method):
+    img = noise_image('RGB', size=(37, 23))
+    source = outofcore.MappedImage.from_image(img, str(tmp_path / 'source.raw'))
+    result = outofcore.transpose(source, str(tmp_path / 'result.raw'), method)
+    assert max_difference(result.read(0, result.height), img.transpose(method)) == 0
+
+
+@pytest.mark.parametrize('compression', ['raw', 'tiff_lzw'])
+def test_load_ignores_decompression_bomb_limit(tmp_path, monkeypatch, compression):
+    img = noise_image('RGB', size=(64, 48))
+    path = str(tmp_path / 'big.tif')
+    img.save(path, compression=compression)
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 100)
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(path)
+
+    mapped = outofcore.MappedImage.load(path, str(tmp_path / 'scratch.raw'))
+    assert max_difference(mapped.read(0, mapped.height), img) == 0
+    assert Image.MAX_IMAGE_PIXELS == 100
+
+
+def test_overlapping_trusted_blocks_restore_the_limit(monkeypatch):
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 100)
+    inside, release = threading.Event(), threading.Event()
+    seen = []
+
+    def first():
+        with outofcore.trusted_size():
+            inside.set()
+            release.wait(5)
+
+    def second():
+        with outofcore.trusted_size():
+            seen.append(Image.MAX_IMAGE_PIXELS)
+
+    threads = [threading.Thread(target=first), threading.Thread(target=second)]
+    threads[0].start()
+    inside.wait(5)
+    threads[1].start()
+    # The second block waits for the first rather than saving its None
+    threads[1].join(0.2)
+    assert not seen
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert seen == [None] and Image.MAX_IMAGE_PIXELS == 100
+
+
+STEPS = [['invert', []], ['rotate_90', []], ['blur', []], ['crop', [[3, 4, 20, 30]]]]
+
+
+def run_batch(tmp_path, out_of_core):
+    source = tmp_path / 'in'
+    source.mkdir(exist_ok=True)
+    noise_image('RGB', size=(40, 30)).save(source / 'photo.png')
+    output = tmp_path / f'out-{out_of_core}'
+    failures = batch.run(engine.find_images(str(source)), str(output), STEPS, workers=1,
+                         out_of_core=out_of_core, out=io.StringIO())
+    assert failures == 0
+    with Image.open(output / 'photo.png') as img:
+        img.load()
+    return img
+
+
+def test_batch_out_of_core_matches_in_memory(tmp_path, small_strips):
+    streamed = run_batch(tmp_path, True)
+    in_memory = run_batch(tmp_path, False)
+    assert max_difference(streamed, in_memory) == 0
+    assert max_difference(in_memory, pipeline.apply_chain(
+        Image.open(tmp_path / 'in' / 'photo.png'), STEPS)) == 0
+
+
+def test_batch_streams_large_inputs_automatically(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'OUT_OF_CORE_PIXELS', 100)
+    calls = []
+    monkeypatch.setattr(batch, 'process_out_of_core',
+                        lambda *args: calls.append(args) or {'load': 0, 'process': 0, 'save': 0})
+    source = tmp_path / 'photo.png'
+    noise_image('RGB', size=(40, 30)).save(source)
+    batch.process_file(str(source), str(tmp_path / 'out.png'), STEPS, {})
+    assert len(calls) == 1
+
+
+def test_batch_keeps_unsupported_chains_in_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'OUT_OF_CORE_PIXELS', 100)
+    source = tmp_path / 'photo.png'
+    noise_image('RGB', size=(40, 30)).save(source)
+    steps = [['rotate', [15]]]
+    assert not batch.use_out_of_core(str(source), str(tmp_path / 'out.png'), steps)
+    with pytest.raises(ValueError):
+        batch.use_out_of_core(str(source), str(tmp_path / 'out.png'), steps, True)
+    with pytest.raises(ValueError):
+        batch.use_out_of_core(str(source), str(tmp_path / 'out.jpg'), STEPS, True)
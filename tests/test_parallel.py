@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+from PIL import ImageFilter
+
+import parallel
+from conftest import max_difference, noise_image
+
+
+@pytest.fixture(autouse=True)
+def pool():
+    yield
+    parallel.shutdown_pool()
+
+
+@pytest.mark.parametrize('mode', ['L', 'LA', 'RGB', 'RGBA'])
+def test_parallel_filter_matches_pillow(mode):
+    img = noise_image(mode, size=(120, 300))
+    result = parallel.filter_in_parallel(img, ImageFilter.GaussianBlur(3), halo=12, workers=2)
+    assert max_difference(result, img.filter(ImageFilter.GaussianBlur(3))) == 0
+    # The pixels were copied out, so the shared segment is already gone
+    assert not result.readonly
+
+
+def test_pools_are_kept_per_worker_count():
+    two = parallel.get_pool(2)
+    assert parallel.get_pool(3) is not two
+    # Asking for another count must not shut down a pool still in use
+    assert parallel.get_pool(2) is two
+    assert two.submit(max, 1, 2).result() == 2
+
+
+def test_threads_share_one_pool():
+    pools = []
+    threads = [threading.Thread(target=lambda: pools.append(parallel.get_pool(2)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(pool) for pool in pools}) == 1
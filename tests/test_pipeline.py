@@ -0,0 +1,40 @@
+import itertools
+
+import pytest
+
+import engine
+import pipeline
+from conftest import max_difference, noise_image
+
+# Colour matrices fuse in floating point; the separate steps round after each
+TOLERANCE = 2
+
+STEPS = [('grayscale', []), ('sepia', []), ('invert', []), ('saturation', [40]),
+         ('saturation', [-60]), ('brightness', [30]), ('contrast', [25]),
+         ('flip_horizontal', []), ('rotate_90', [])]
+
+
+def run_in_turn(img, steps):
+    for name, args in steps:
+        img = engine.OPERATIONS[name](img, *args)
+    return img
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_fused_chains_within_tolerance(mode):
+    img = noise_image(mode, size=(64, 48))
+    for steps in itertools.permutations(STEPS, 3):
+        fused = pipeline.apply_chain(img, list(steps))
+        assert max_difference(fused, run_in_turn(img, steps)) <= TOLERANCE, steps
+
+
+def test_transposes_fuse_exactly(rgb_image):
+    steps = [('rotate_90', []), ('flip_vertical', []), ('transpose', []), ('rotate_180', [])]
+    assert max_difference(pipeline.apply_chain(rgb_image, steps),
+                          run_in_turn(rgb_image, steps)) == 0
+
+
+def test_lookup_tables_fuse_exactly(rgb_image):
+    steps = [('brightness', [20]), ('invert', []), ('brightness', [-35])]
+    assert max_difference(pipeline.apply_chain(rgb_image, steps),
+                          run_in_turn(rgb_image, steps)) == 0
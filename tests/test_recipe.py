@@ -0,0 +1,102 @@
+import pytest
+
+import engine
+from history import History
+from recipe import Recipe, RecipeRecorder, step
+from conftest import max_difference, noise_image
+
+# Colour steps fuse in floating point on replay; the editor rounds after each
+TOLERANCE = 2
+
+
+class Editor:
+    """The editor's bookkeeping for edits, without Tk"""
+
+    def __init__(self, image):
+        self.original = image
+        self.image = image.copy()
+        self.history = History()
+        self.recorder = RecipeRecorder()
+
+    def edit(self, operation, *args):
+        before = self.image
+        self.image = operation(before, *args)
+        self.history.record(operation, args, before)
+        self.recorder.record([step(operation, args)])
+
+    def stroke(self, points, color, size):
+        box = engine.clip_box(engine.line_bounds(points, size), self.image.size)
+        self.history.record_patch(box, self.image.crop(box))
+        self.recorder.record([step(engine.draw, (points, color, size))])
+        engine.draw_line(self.image, points, color, size)
+
+    def reset(self):
+        self.history.record_frame(self.image)
+        self.recorder.reset()
+        self.image = self.original.copy()
+
+    def undo(self):
+        self.image, _ = self.history.undo(self.image)
+        self.recorder.undo()
+
+    def redo(self):
+        self.image, _ = self.history.redo(self.image)
+        self.recorder.redo()
+
+    def in_step(self):
+        return (len(self.recorder.undo_stack) == len(self.history.undo_stack)
+                and len(self.recorder.redo_stack) == len(self.history.redo_stack))
+
+
+def names(recipe):
+    return [name for name, _ in recipe.steps]
+
+
+def test_groups_follow_history_through_undo_and_redo():
+    editor = Editor(noise_image('RGB'))
+    editor.edit(engine.invert)
+    editor.edit(engine.rotate_90)
+    editor.stroke([(5, 5), (40, 30)], '#00ff00', 3)
+    editor.undo()
+    editor.undo()
+    assert editor.in_step() and names(editor.recorder.recipe()) == ['invert']
+    editor.redo()
+    assert editor.in_step() and names(editor.recorder.recipe()) == ['invert', 'rotate_90']
+    # A new edit drops the redo groups along with the redo entries
+    editor.edit(engine.blur)
+    assert editor.in_step() and not editor.recorder.redo_stack
+    assert names(editor.recorder.recipe()) == ['invert', 'rotate_90', 'blur']
+
+
+def test_reset_starts_the_recipe_over():
+    editor = Editor(noise_image('RGB'))
+    editor.edit(engine.sepia)
+    editor.reset()
+    editor.edit(engine.flip_vertical)
+    assert editor.in_step() and names(editor.recorder.recipe()) == ['flip_vertical']
+    editor.undo()
+    editor.undo()
+    assert editor.in_step() and names(editor.recorder.recipe()) == ['sepia']
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA'])
+def test_saved_recipe_replays_to_the_same_pixels(tmp_path, mode):
+    editor = Editor(noise_image(mode))
+    editor.edit(engine.crop, (10, 5, 150, 110))
+    editor.stroke([(5, 5), (60, 40), (100, 20)], '#ff0000', 4)
+    editor.edit(engine.adjust, 20, -15, 30)
+    editor.edit(engine.rotate_270)
+    editor.edit(engine.invert)
+    editor.edit(engine.sharpen)
+    editor.undo()
+
+    path = str(tmp_path / 'recipe.json')
+    editor.recorder.recipe().save(path)
+    recipe = Recipe.load(path)
+    replayed = recipe.apply(editor.original)
+    assert max_difference(replayed, editor.image) <= TOLERANCE
+    # The loaded steps, run one at a time without fusion, agree too
+    in_turn = editor.original
+    for name, args in recipe.steps:
+        in_turn = engine.OPERATIONS[name](in_turn, *args)
+    assert max_difference(replayed, in_turn) <= TOLERANCE
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+import sessions
+from display import DisplayPyramid
+from history import History
+from conftest import noise_image
+
+
+class ClosingHistory(History):
+    closed = False
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+def make_session(path, size=(100, 100)):
+    """Session of an unedited L image, so it holds width * height bytes"""
+    image = noise_image('L', size=size)
+    return sessions.Session(str(path), sessions.file_stamp(path), image, image, 1,
+                            DisplayPyramid(), ClosingHistory(), None, 1.0)
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for name in 'abc':
+        path = tmp_path / f'{name}.png'
+        path.write_bytes(name.encode())
+        paths.append(path)
+    return paths
+
+
+def test_least_recently_used_session_is_evicted(files):
+    cache = sessions.SessionCache(budget=25000)
+    first, second, third = (make_session(path) for path in files)
+    cache.put(first)
+    cache.put(second)
+    # Putting first back makes second the oldest
+    cache.put(cache.take(files[0]))
+    cache.put(third)
+    assert files[1] not in cache
+    assert files[0] in cache and files[2] in cache
+    assert second.history.closed and not first.history.closed
+    assert cache.nbytes == 20000
+
+
+def test_eviction_counts_bytes_not_sessions(files):
+    cache = sessions.SessionCache(budget=25000)
+    cache.put(make_session(files[0], size=(100, 50)))
+    cache.put(make_session(files[1], size=(100, 50)))
+    cache.put(make_session(files[2], size=(100, 160)))
+    assert len(cache) == 2 and files[0] not in cache
+
+
+def test_session_over_the_whole_budget_is_not_kept(files):
+    cache = sessions.SessionCache(budget=5000)
+    session = make_session(files[0])
+    cache.put(session)
+    assert len(cache) == 0 and session.history.closed
+
+
+def test_stale_session_is_dropped(files):
+    cache = sessions.SessionCache()
+    session = make_session(files[0])
+    cache.put(session)
+    files[0].write_bytes(b'changed on disk')
+    assert cache.take(files[0]) is None
+    assert session.history.closed and len(cache) == 0
+
+
+def test_take_is_keyed_by_absolute_path(files, monkeypatch):
+    cache = sessions.SessionCache()
+    session = make_session(files[0])
+    cache.put(session)
+    monkeypatch.chdir(files[0].parent)
+    assert cache.take(os.path.basename(files[0])) is session
+    assert cache.take(files[0]) is None
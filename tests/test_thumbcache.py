@@ -0,0 +1,89 @@
+import itertools
+import json
+import os
+
+import pytest
+
+import thumbcache
+from conftest import noise_image
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Distinct, increasing use times however fast the test runs
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(thumbcache.time, 'time', lambda: float(next(ticks)))
+
+
+@pytest.fixture
+def sources(tmp_path):
+    folder = tmp_path / 'photos'
+    folder.mkdir()
+    paths = []
+    for seed in range(4):
+        path = folder / f'{seed}.png'
+        noise_image('RGB', size=(300, 200), seed=seed).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def cache_files(cache):
+    return sorted(name for name in os.listdir(cache.directory) if name != thumbcache.INDEX_NAME)
+
+
+def test_thumbnail_is_generated_once_and_missed_after_an_edit(tmp_path, sources):
+    cache = thumbcache.ThumbnailCache(str(tmp_path / 'cache'), size=64)
+    assert cache.get(sources[0]) is None
+    thumbnail = cache.thumbnail(sources[0])
+    assert max(thumbnail.size) == 64
+    # Stored as JPEG, so only the size survives exactly
+    assert cache.get(sources[0]).size == thumbnail.size
+    assert cache_files(cache) == [cache.key(sources[0]) + '.jpg']
+    noise_image('RGB', size=(320, 200), seed=9).save(sources[0])
+    assert cache.get(sources[0]) is None
+
+
+def test_least_recently_used_thumbnails_are_evicted_by_bytes(tmp_path, sources, clock):
+    cache = thumbcache.ThumbnailCache(str(tmp_path / 'cache'), size=64)
+    for path in sources[:3]:
+        cache.thumbnail(path)
+    # Using the first again makes the second the oldest
+    cache.get(sources[0])
+    cache.budget = cache.total
+    cache.thumbnail(sources[3])
+    assert cache.get(sources[1]) is None
+    assert all(cache.get(path) is not None for path in (sources[0], sources[2], sources[3]))
+    assert cache.total <= cache.budget
+    assert cache.total == sum(os.path.getsize(os.path.join(cache.directory, name))
+                              for name in cache_files(cache))
+    assert len(cache_files(cache)) == 3
+
+
+def test_flushed_index_is_read_back(tmp_path, sources, clock):
+    directory = str(tmp_path / 'cache')
+    cache = thumbcache.ThumbnailCache(directory, size=64)
+    cache.thumbnail(sources[0])
+    cache.thumbnail(sources[1])
+    cache.flush()
+    assert not cache.dirty
+    with open(os.path.join(directory, thumbcache.INDEX_NAME)) as f:
+        assert json.load(f) == cache.entries
+
+    reopened = thumbcache.ThumbnailCache(directory, size=64)
+    assert reopened.entries == cache.entries and reopened.total == cache.total
+
+
+def test_unindexed_files_are_adopted_and_vanished_ones_forgotten(tmp_path, sources):
+    directory = str(tmp_path / 'cache')
+    cache = thumbcache.ThumbnailCache(directory, size=64)
+    cache.thumbnail(sources[0])
+    cache.flush()
+    # Written after the last flush, as when the editor exits without one
+    cache.thumbnail(sources[1])
+    os.remove(os.path.join(directory, cache.key(sources[0]) + '.jpg'))
+
+    reopened = thumbcache.ThumbnailCache(directory, size=64)
+    assert sorted(reopened.entries) == cache_files(reopened)
+    assert reopened.get(sources[0]) is None
+    assert reopened.get(sources[1]) is not None
+    assert reopened.total == sum(entry[0] for entry in reopened.entries.values())
@@ -0,0 +1,118 @@
+import json
+import pstats
+import threading
+
+import pytest
+
+import tracing
+
+
+def test_clear_resets_the_total():
+    tracer = tracing.Tracer(max_spans=4)
+    for i in range(6):
+        tracer.add('step', 'test', tracer.origin + i, 0.001)
+    assert tracer.total == 6 and len(tracer.recent()) == 4
+    tracer.clear()
+    assert tracer.total == 0 and tracer.recent() == []
+    tracer.add('step', 'test', tracer.origin, 0.001)
+    assert tracer.total == 1
+
+
+def test_nested_spans_record_depth_and_enclose_their_children():
+    tracer = tracing.Tracer()
+    with tracer.span('outer', 'test'):
+        with tracer.span('inner', 'test', size=3):
+            with tracer.span('innermost', 'test'):
+                pass
+        with tracer.span('sibling', 'test'):
+            pass
+    spans = tracer.recent()
+    # Spans are recorded as they end, so children come before their parent
+    assert [span.name for span in spans] == ['innermost', 'inner', 'sibling', 'outer']
+    depths = {span.name: span.args.get('depth', 0) for span in spans}
+    assert depths == {'outer': 0, 'inner': 1, 'innermost': 2, 'sibling': 1}
+    assert spans[1].args['size'] == 3
+    by_name = {span.name: span for span in spans}
+    for parent, child in (('outer', 'inner'), ('inner', 'innermost'), ('outer', 'sibling')):
+        parent, child = by_name[parent], by_name[child]
+        assert parent.start <= child.start
+        assert child.start + child.duration <= parent.start + parent.duration
+    assert by_name['inner'].start + by_name['inner'].duration <= by_name['sibling'].start
+
+
+def test_depth_is_per_thread():
+    tracer = tracing.Tracer()
+
+    def work():
+        with tracer.span('task', 'test'):
+            pass
+
+    with tracer.span('ui', 'test'):
+        # Opened while the UI span is, but on another thread, so top-level
+        thread = threading.Thread(target=work, name='worker')
+        thread.start()
+        thread.join()
+    task = tracer.recent()[0]
+    assert task.name == 'task' and 'depth' not in task.args
+    assert task.thread_name == 'worker'
+
+
+def test_chrome_trace_structure(tmp_path):
+    tracer = tracing.Tracer()
+    with tracer.span('load', 'decode', file='a.png'):
+        pass
+    tracer.add('slider latency', 'latency', tracer.origin + 0.5, 0.25)
+    path = tmp_path / 'trace.json'
+    tracer.export_chrome(str(path))
+    document = json.loads(path.read_text())
+    assert document == json.loads(json.dumps(tracer.chrome_trace()))
+    assert document['displayTimeUnit'] == 'ms'
+
+    events = document['traceEvents']
+    complete = [event for event in events if event['ph'] == 'X']
+    assert [event['name'] for event in complete] == ['load', 'slider latency']
+    for event in complete:
+        assert {'name', 'cat', 'ph', 'pid', 'tid', 'ts', 'dur', 'args'} <= set(event)
+    assert complete[0]['cat'] == 'decode' and complete[0]['args']['file'] == 'a.png'
+    # Microseconds from the tracer's origin
+    assert complete[1]['ts'] == 500000.0 and complete[1]['dur'] == 250000.0
+    names = [event for event in events if event['ph'] == 'M']
+    assert [event['args']['name'] for event in names] == [threading.current_thread().name]
+    assert all(event['name'] == 'memory' and 'rss_mb' in event['args']
+               for event in events if event['ph'] == 'C')
+
+
+@pytest.mark.parametrize('kind', ['cprofile', 'tracemalloc'])
+def test_profile_claims_only_the_next_top_level_span(tmp_path, kind):
+    tracer = tracing.Tracer()
+    path = tmp_path / 'profile.out'
+    tracer.profile_next(kind, str(path), name='blur')
+    assert tracer.profile_armed
+    with tracer.span('sharpen', 'operation'):
+        # Nested spans are never profiled, even when the name matches
+        with tracer.span('blur', 'operation'):
+            pass
+    assert tracer.profile_armed and not path.exists()
+
+    with tracer.span('blur', 'operation'):
+        sum(range(1000))
+    assert not tracer.profile_armed and path.exists()
+    if kind == 'cprofile':
+        assert pstats.Stats(str(path)).total_calls > 0
+    else:
+        assert path.read_text().startswith("Peak traced Python memory")
+
+    path.unlink()
+    with tracer.span('blur', 'operation'):
+        pass
+    assert not path.exists()
+
+
+def test_profile_matches_category():
+    tracer = tracing.Tracer()
+    tracer.profile_next('cprofile', 'unused', category='decode')
+    with tracer.span('blur', 'operation'):
+        pass
+    assert tracer.profile_armed
+    with pytest.raises(ValueError):
+        tracer.profile_next('perf', 'unused')
@@ -0,0 +1,96 @@
+import threading
+
+import pytest
+
+import engine
+from workers import Task, TaskRunner
+from conftest import FakeRoot
+
+
+@pytest.fixture
+def root():
+    return FakeRoot()
+
+
+@pytest.fixture
+def runner(root):
+    runner = TaskRunner(root, max_workers=1, poll_ms=1)
+    yield runner
+    runner.shutdown()
+
+
+def track(events):
+    return dict(on_done=lambda result: events.append(('done', result)),
+                on_error=lambda error: events.append(('error', error)),
+                on_cancel=lambda: events.append(('cancel',)))
+
+
+def test_result_and_progress_reach_the_main_loop(root, runner):
+    events, fractions = [], []
+    halfway, finish = threading.Event(), threading.Event()
+
+    def work(value, progress):
+        progress(0.5)
+        halfway.set()
+        finish.wait(5)
+        return value * 2
+
+    runner.submit("Doubling", work, 21, on_progress=lambda task: fractions.append(task.fraction),
+                  **track(events))
+    halfway.wait(5)
+    root.pump(lambda: fractions)
+    finish.set()
+    root.pump(lambda: events)
+    assert events == [('done', 42)]
+    assert set(fractions) == {0.5}
+
+
+def test_errors_go_to_on_error(root, runner):
+    events = []
+
+    def work(progress):
+        raise ValueError("bad pixels")
+
+    runner.submit("Failing", work, **track(events))
+    root.pump(lambda: events)
+    assert len(events) == 1 and events[0][0] == 'error'
+    assert isinstance(events[0][1], ValueError)
+
+
+def test_cancel_stops_a_running_task_at_its_next_report(root, runner):
+    events, steps = [], []
+    started = threading.Event()
+
+    def work(progress):
+        started.set()
+        while True:
+            steps.append(None)
+            progress(0.1)
+
+    task = runner.submit("Looping", work, **track(events))
+    started.wait(5)
+    task.cancel()
+    root.pump(lambda: events)
+    assert events == [('cancel',)]
+    assert task.cancelled
+
+
+def test_cancel_before_start_never_runs_the_task(root, runner):
+    events, ran = [], []
+    release = threading.Event()
+    runner.submit("Blocking", lambda progress: release.wait(5), on_done=lambda result: None)
+    task = runner.submit("Queued", lambda progress: ran.append(True), **track(events))
+    task.cancel()
+    release.set()
+    root.pump(lambda: events)
+    assert events == [('cancel',)] and not ran
+
+
+def test_report_raises_once_cancelled():
+    task = Task("Reporting")
+    task.report(0.25)
+    assert task.fraction == 0.25
+    task.cancel()
+    with pytest.raises(engine.Cancelled):
+        task.report(0.5)
+    assert task.fraction == 0.25
@@ -0,0 +1,135 @@
+"""Persistent thumbnail cache for Ignora's folder browser.
+
+Thumbnails are small files in a cache directory, named by a hash of the
+source's absolute path, modification time and size, so an edited or replaced
+file simply misses. An index of entry sizes and last-use times is kept beside
+them and the least recently used entries are deleted once the total goes over
+the byte budget. The cache is shared by the browser's worker threads.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import engine
+
+# Longest side of a cached thumbnail, in pixels
+THUMBNAIL_SIZE = 160
+
+# Total bytes of thumbnail files kept before the oldest are evicted
+DEFAULT_BUDGET = 256 * 1024 * 1024
+
+INDEX_NAME = 'index.json'
+
+
+def default_directory():
+    """Per-user cache directory, following XDG_CACHE_HOME where it's set"""
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'ignora', 'thumbnails')
+
+
+class ThumbnailCache:
+    """Thumbnails on disk keyed by (path, mtime, size), evicted LRU by bytes"""
+
+    def __init__(self, directory=None, budget=DEFAULT_BUDGET, size=THUMBNAIL_SIZE):
+        self.directory = directory or default_directory()
+        self.budget = budget
+        self.size = size
+        self.lock = threading.Lock()
+        self.dirty = False
+        os.makedirs(self.directory, exist_ok=True)
+        # name -> [bytes, last used]
+        self.entries = self._read_index()
+        self.total = sum(entry[0] for entry in self.entries.values())
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_NAME)) as f:
+                indexed = json.load(f)
+        except (OSError, ValueError):
+            indexed = {}
+        # The directory is the truth: files missing from the index (written
+        # after its last flush) are adopted, and vanished files are forgotten
+        entries = {}
+        for name in os.listdir(self.directory):
+            if name.endswith(('.jpg', '.png')):
+                path = os.path.join(self.directory, name)
+                entries[name] = indexed.get(name) or [os.path.getsize(path),
+                                                      os.path.getmtime(path)]
+        return entries
+
+    def key(self, path):
+        """Cache file name for path as it is now on disk"""
+        stat = os.stat(path)
+        identity = f"{os.path.abspath(path)}\0{stat.st_mtime_ns}\0{stat.st_size}\0{self.size}"
+        return hashlib.sha1(identity.encode('utf-8', 'surrogateescape')).hexdigest()
+
+    def get(self, path):
+        """Cached thumbnail of path, or None"""
+        key = self.key(path)
+        with self.lock:
+            name = next((n for n in (key + '.jpg', key + '.png') if n in self.entries), None)
+            if name is None:
+                return None
+            self.entries[name][1] = time.time()
+            self.dirty = True
+        try:
+            return engine.load_image(os.path.join(self.directory, name))
+        except OSError:
+            self._forget(name)
+            return None
+
+    def put(self, path, thumbnail):
+        """Store the thumbnail of path, evicting old entries if over budget"""
+        # JPEG is much smaller; PNG keeps transparency
+        name = self.key(path) + ('.png' if thumbnail.mode == 'RGBA' else '.jpg')
+        target = os.path.join(self.directory, name)
+        engine.save_image(thumbnail, target, quality=85)
+        with self.lock:
+            size = os.path.getsize(target)
+            previous = self.entries.get(name)
+            self.total += size - (previous[0] if previous else 0)
+            self.entries[name] = [size, time.time()]
+            self.dirty = True
+            self._evict()
+
+    def thumbnail(self, path):
+        """Thumbnail of path from the cache, generating and storing it on a miss"""
+        thumbnail = self.get(path)
+        if thumbnail is None:
+            thumbnail = engine.load_thumbnail(path, (self.size, self.size))
+            self.put(path, thumbnail)
+        return thumbnail
+
+    def _forget(self, name):
+        with self.lock:
+            entry = self.entries.pop(name, None)
+            if entry is not None:
+                self.total -= entry[0]
+                self.dirty = True
+
+    def _evict(self):
+        # Caller holds the lock
+        if self.total <= self.budget:
+            return
+        for name in sorted(self.entries, key=lambda n: self.entries[n][1]):
+            if self.total <= self.budget:
+                break
+            self.total -= self.entries.pop(name)[0]
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def flush(self):
+        """Write the index if it changed; call now and then and on exit"""
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = json.dumps(self.entries)
+            self.dirty = False
+        path = os.path.join(self.directory, INDEX_NAME)
+        with open(path + '.part', 'w') as f:
+            f.write(entries)
+        os.replace(path + '.part', path)
@@ -0,0 +1,219 @@
+"""Timing and memory spans for Ignora's operations.
+
+Code wraps a stage in `with tracing.span(name, category):` and the shared
+tracer records when it started, how long it took, on which thread, and how
+the process's resident memory changed. Spans from the UI thread and the
+workers go into one ring buffer, which the editor's performance panel shows
+live and which can be saved as a Chrome trace-event file for chrome://tracing
+or Perfetto.
+
+One span can also be profiled: profile_next() arms cProfile or tracemalloc
+for the next span whose name matches, and the report is written when it
+ends. Note that tracemalloc only sees Python allocations, not pixel buffers.
+"""
+from collections import deque
+import contextlib
+import os
+import threading
+import time
+
+# Spans kept for the panel and for export
+MAX_SPANS = 20000
+
+# Lines of a tracemalloc report
+TRACEMALLOC_LINES = 30
+
+
+def rss():
+    """Resident memory of this process in bytes, or None where it can't be read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Span:
+    """One finished stage"""
+
+    __slots__ = ('name', 'category', 'start', 'duration', 'thread', 'thread_name',
+                 'rss', 'rss_delta', 'args')
+
+    def __init__(self, name, category, start, duration, rss_after, rss_delta, args):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.duration = duration
+        thread = threading.current_thread()
+        self.thread = thread.ident
+        self.thread_name = thread.name
+        self.rss = rss_after
+        self.rss_delta = rss_delta
+        self.args = args
+
+
+class Tracer:
+    """Thread-safe ring buffer of spans with an optional one-shot profiler"""
+
+    def __init__(self, max_spans=MAX_SPANS):
+        self.spans = deque(maxlen=max_spans)
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.total = 0
+        self.enabled = True
+        self._profile = None
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def span(self, name, category='operation', **args):
+        """Time the body of a with statement as a span called name"""
+        if not self.enabled:
+            yield
+            return
+        profiler = self._claim_profile(name, category)
+        rss_before = rss()
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                yield
+            else:
+                with profiler:
+                    yield
+        finally:
+            duration = time.perf_counter() - start
+            self._local.depth = depth
+            rss_after = rss()
+            delta = None
+            if rss_after is not None and rss_before is not None:
+                delta = rss_after - rss_before
+            if depth:
+                args['depth'] = depth
+            with self.lock:
+                self.spans.append(Span(name, category, start - self.origin, duration,
+                                       rss_after, delta, args))
+                self.total += 1
+
+    def add(self, name, category, start, duration, **args):
+        """Record a span measured elsewhere; start is a time.perf_counter() value"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.spans.append(Span(name, category, start - self.origin, duration,
+                                   None, None, args))
+            self.total += 1
+
+    def recent(self, count=200):
+        """The newest spans, oldest first"""
+        with self.lock:
+            return list(self.spans)[-count:]
+
+    def clear(self):
+        """Forget every recorded span"""
+        with self.lock:
+            self.spans.clear()
+            self.total = 0
+
+    def profile_next(self, kind, path, name=None, category=None):
+        """Profile the next top-level span matching name and category (None: any).
+
+        kind is 'cprofile', which writes pstats data to path, or 'tracemalloc',
+        which writes a text report of the biggest allocation sites.
+        """
+        if kind not in ('cprofile', 'tracemalloc'):
+            raise ValueError(f"Unknown profiler: {kind}")
+        with self.lock:
+            self._profile = (kind, path, name, category)
+
+    @property
+    def profile_armed(self):
+        """Whether profile_next() is waiting for its span"""
+        return self._profile is not None
+
+    def _claim_profile(self, name, category):
+        if self._profile is None or getattr(self._local, 'depth', 0):
+            return None
+        with self.lock:
+            if (self._profile is None or self._profile[2] not in (None, name)
+                    or self._profile[3] not in (None, category)):
+                return None
+            kind, path = self._profile[:2]
+            self._profile = None
+        if kind == 'cprofile':
+            return _CProfileRun(path)
+        return _TracemallocRun(path)
+
+    def chrome_trace(self):
+        """The recorded spans as a Chrome trace-event document"""
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for span in self.recent(len(self.spans)):
+            threads[span.thread] = span.thread_name
+            args = dict(span.args)
+            if span.rss_delta is not None:
+                args['rss_delta_mb'] = round(span.rss_delta / 2 ** 20, 2)
+            events.append({'name': span.name, 'cat': span.category, 'ph': 'X', 'pid': pid,
+                           'tid': span.thread, 'ts': round(span.start * 1e6, 1),
+                           'dur': round(span.duration * 1e6, 1), 'args': args})
+            if span.rss is not None:
+                events.append({'name': 'memory', 'ph': 'C', 'pid': pid,
+                               'ts': round((span.start + span.duration) * 1e6, 1),
+                               'args': {'rss_mb': round(span.rss / 2 ** 20, 1)}})
+        for thread, name in threads.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread,
+                           'args': {'name': name}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome(self, path):
+        """Write the recorded spans as Chrome trace-event JSON"""
+        import json
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class _CProfileRun:
+    def __init__(self, path):
+        # The profilers are imported only when one is used, to keep start-up quick
+        import cProfile
+        self.path = path
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self.profiler.enable()
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        self.profiler.dump_stats(self.path)
+
+
+class _TracemallocRun:
+    def __init__(self, path):
+        self.path = path
+        self.started = False
+
+    def __enter__(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started = True
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.take_snapshot()
+
+    def __exit__(self, *exc):
+        import tracemalloc
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if self.started:
+            tracemalloc.stop()
+        with open(self.path, 'w') as f:
+            f.write(f"Peak traced Python memory: {peak / 2 ** 20:.1f} MB\n")
+            f.write("Biggest allocation sites during the span:\n")
+            for stat in after.compare_to(self.before, 'lineno')[:TRACEMALLOC_LINES]:
+                f.write(f"{stat}\n")
+
+
+# The tracer shared by the editor and its workers
+tracer = Tracer()
+span = tracer.span
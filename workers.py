@@ -0,0 +1,104 @@
+"""Background execution of image operations for the Ignora editor.
+
+Operations run on a thread pool (Pillow and NumPy release the GIL for the
+heavy lifting) and their results are handed back on the Tk thread by polling
+with root.after, since Tk must only be touched from the thread that owns it.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+import engine
+import tracing
+
+# How often the Tk thread checks on running tasks
+POLL_MS = 50
+
+
+class Task:
+    """One background operation with progress and cancellation"""
+
+    def __init__(self, description):
+        self.description = description
+        self.fraction = None
+        self.started = time.perf_counter()
+        self.future = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        """Whether cancel() has been called"""
+        return self._cancelled.is_set()
+
+    def report(self, fraction):
+        """Progress callback for operations; raises Cancelled after cancel()"""
+        if self._cancelled.is_set():
+            raise engine.Cancelled()
+        self.fraction = fraction
+
+    def cancel(self):
+        """Ask the operation to stop; its result is discarded either way"""
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def elapsed(self):
+        """Seconds since the task was submitted"""
+        return time.perf_counter() - self.started
+
+
+class TaskRunner:
+    """Runs callables on a thread pool and reports back on the Tk thread"""
+
+    def __init__(self, root, max_workers=None, poll_ms=POLL_MS):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1)
+
+    def submit(self, description, func, *args, on_done, on_error=None,
+               on_progress=None, on_cancel=None):
+        """Run func(*args, progress=task.report) in the background.
+
+        Exactly one of on_done(result), on_error(exception) or on_cancel()
+        is later called on the Tk thread; on_progress(task) is called on
+        every poll while the task is running.
+        """
+        task = Task(description)
+        task.future = self.executor.submit(self._run, task, func, args)
+        callbacks = (on_done, on_error, on_progress, on_cancel)
+        self.root.after(self.poll_ms, self._poll, task, callbacks)
+        return task
+
+    def _run(self, task, func, args):
+        queued = time.perf_counter() - task.started
+        with tracing.span(task.description, 'task', queued_ms=round(queued * 1000, 1)):
+            return func(*args, progress=task.report)
+
+    def _poll(self, task, callbacks):
+        on_done, on_error, on_progress, on_cancel = callbacks
+        if not task.future.done():
+            if on_progress is not None and not task.cancelled:
+                on_progress(task)
+            self.root.after(self.poll_ms, self._poll, task, callbacks)
+            return
+
+        if task.cancelled or task.future.cancelled():
+            if on_cancel is not None:
+                on_cancel()
+            return
+        error = task.future.exception()
+        if isinstance(error, engine.Cancelled):
+            if on_cancel is not None:
+                on_cancel()
+        elif error is not None:
+            if on_error is not None:
+                on_error(error)
+        else:
+            # The Tk-thread side of the task: showing and recording the result
+            with tracing.span(f"{task.description}: finish", 'ui'):
+                on_done(task.future.result())
+
+    def shutdown(self):
+        """Stop accepting work and drop queued tasks"""
+        self.executor.shutdown(wait=False, cancel_futures=True)